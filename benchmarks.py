@@ -0,0 +1,298 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import NoneType
+
+import numpy as np
+import pandas as pd
+
+import ezxt
+from ezxt import Colors
+
+"""
+This module contains a set of benchmarks for ezxt.py, results are printed and saved as json to track regressions
+usage: python benchmarks.py [--output results.json]
+"""
+
+
+def timed(func: callable, repeat: int = 5) -> float:
+    """
+    Run a function several times
+    :param func: function to run
+    :param repeat: number of runs
+    :return: best time of a run in seconds
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def synthetic_ohlcv(rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Build a random 1m series with a 0.1 price tick and a 0.0001 volume step
+    :param rows: number of candles
+    :param seed: random seed
+    :return: pandas dataframe with the columns timestamp open high low close volume
+    """
+    rng = np.random.default_rng(seed)
+    close = np.round(20000 + np.cumsum(rng.normal(0, 5, rows)), 1)
+    return pd.DataFrame({'timestamp': 1600000000000 + np.arange(rows, dtype=np.int64) * 60000,
+                         'open': np.round(close + rng.normal(0, 2, rows), 1),
+                         'high': np.round(close + np.abs(rng.normal(0, 4, rows)), 1),
+                         'low': np.round(close - np.abs(rng.normal(0, 4, rows)), 1),
+                         'close': close,
+                         'volume': np.round(rng.exponential(5, rows), 4)})
+
+
+def replay_client(**options) -> ezxt.WrappedGenericExchange:
+    """
+    Build an authenticated wrapped client on the offline replay exchange
+    :param options: ReplayExchange options, look at ReplayExchange.configure
+    :return: wrapped client
+    """
+    wrapped_client = ezxt.WrappedGenericExchange(ezxt.ReplayExchange.configure(**options))
+    wrapped_client.authenticate_client("key", "secret")
+    return wrapped_client
+
+
+def benchmark_download(concurrency: tuple = (1, 10, 50, 100), page_sizes: tuple = (500, 1000),
+                       candles: int = 50000, latency: float = 0.05) -> list:
+    """
+    Measure the multithreaded download throughput
+    :param concurrency: download_size values to try
+    :param page_sizes: number of candles returned by a request
+    :param candles: number of 1m candles downloaded by a run
+    :param latency: simulated round trip of a request in seconds
+    :return: one result per (download_size, page size) with the candles/sec
+    """
+    results = []
+    for page_size in page_sizes:
+        for download_size in concurrency:
+            wrapped_client = replay_client(ohlcv_limit=page_size, latency=latency)
+            since = int(time.time() * 1000) - (candles + 10) * 60000
+            elapsed = timed(lambda: wrapped_client.load_ohlcv("BTC/USDT", "1m", since, candles, output=False,
+                                                              download_size=download_size, path=None), 1)
+            results.append({'download_size': download_size, 'page_size': page_size, 'candles': candles,
+                            'requests': wrapped_client.client.calls['fetch_ohlcv'], 'seconds': elapsed,
+                            'candles_per_s': candles / elapsed})
+    return results
+
+
+def benchmark_cache(lengths: tuple = (10000, 100000, 1000000)) -> list:
+    """
+    Measure the cold (file) and warm (memory cache) load time & memory of load_ohlcv by series length
+    :param lengths: number of candles of the series
+    :return: one result per length, times in seconds & peak memory in bytes
+    """
+    results = []
+    for length in lengths:
+        dataframe = synthetic_ohlcv(length)
+        with tempfile.TemporaryDirectory() as directory:
+            wrapped_client = replay_client()
+            since = int(dataframe['timestamp'].iloc[0])
+            result = {'rows': length}
+            path = os.path.join(directory, "")
+            fullpath = path + wrapped_client.__get_file_name__("BTC/USDT", "1m", since, length)
+            for mmap in (False, True):
+                wrapped_client.__write_cache__(dataframe, fullpath, mmap)
+
+                def load():
+                    return wrapped_client.load_ohlcv("BTC/USDT", "1m", since, length, output=False, path=path,
+                                                     mmap=mmap)
+
+                def cold():
+                    wrapped_client.memory_cache.clear()
+                    load()
+
+                prefix = "mmap_" if mmap else "csv_"
+                result[prefix + 'cold_s'] = timed(cold, 3)
+                wrapped_client.memory_cache.clear()
+                tracemalloc.start()
+                load()
+                result[prefix + 'cold_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                result[prefix + 'warm_s'] = timed(load, 5)
+                wrapped_client.memory_cache.clear()
+            results.append(result)
+    return results
+
+
+def benchmark_overhead(calls: int = 2000) -> dict:
+    """
+    Measure the cost of the wrapper (decorators & methods) on top of a zero latency exchange
+    :param calls: number of calls per method
+    :return: microseconds per call of the raw client calls & of the wrapped methods
+    """
+    wrapped_client = replay_client(balances={'BTC': 1e9, 'USDT': 1e12}, fill_delay=0)
+    client = wrapped_client.client
+    market = "BTC/USDT"
+    bid = wrapped_client.get_bid(market)
+
+    def per_call(func):
+        return timed(lambda: [func() for _ in range(calls)], 3) / calls * 1e6
+
+    results = {
+        'raw_fetch_ticker_us': per_call(lambda: client.fetch_ticker(market)),
+        'get_bid_us': per_call(lambda: wrapped_client.get_bid(market)),
+        'get_order_size_us': per_call(lambda: wrapped_client.get_order_size(market, "buy", "currency_2_percent",
+                                                                            1, bid)),
+        'raw_create_order_us': per_call(lambda: client.create_order(market, "limit", "buy", 0.01, bid / 2)),
+    }
+    for name, post in (('post_market_order', lambda: wrapped_client.post_market_order(market, "buy", 0.01)),
+                       ('post_limit_order', lambda: wrapped_client.post_limit_order(market, "buy", 0.01, bid / 2)),
+                       ('post_stop_loss_order', lambda: wrapped_client.post_stop_loss_order(market, "sell", 0.01,
+                                                                                           bid / 2)),
+                       ('post_take_profit_order',
+                        lambda: wrapped_client.post_take_profit_order(market, "sell", 0.01, bid * 2))):
+        results[name + '_us'] = per_call(post)
+    wrapped_client.metrics = None
+    results['get_bid_without_metrics_us'] = per_call(lambda: wrapped_client.get_bid(market))
+    results['get_bid_overhead_us'] = results['get_bid_us'] - results['raw_fetch_ticker_us']
+    results['post_limit_order_overhead_us'] = results['post_limit_order_us'] - results['raw_create_order_us']
+    return results
+
+
+def benchmark_import(repeat: int = 5) -> dict:
+    """
+    Measure the startup cost in fresh interpreters: import ezxt, wrap an exchange and post a first order on the replay
+    exchange, then import the heavy dependencies loaded lazily by ezxt
+    :param repeat: number of interpreters started, the best times are kept
+    :return: times in seconds & the lazy modules imported by the order path (should be empty)
+    """
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import ezxt\n"
+        "imported = time.perf_counter()\n"
+        "wrapped_client = ezxt.WrappedGenericExchange(ezxt.ReplayExchange)\n"
+        "wrapped_client.authenticate_client('key', 'secret')\n"
+        "wrapped_client.post_market_order('BTC/USDT', 'buy', 0.01)\n"
+        "ordered = time.perf_counter()\n"
+        "lazy = [name for name in ('pandas', 'ccxt') if name in sys.modules]\n"
+        "import pandas\n"
+        "pandas_imported = time.perf_counter()\n"
+        "import ccxt\n"
+        "ccxt_imported = time.perf_counter()\n"
+        "print(imported - start, ordered - imported, pandas_imported - ordered, ccxt_imported - pandas_imported,"
+        " ','.join(lazy))\n")
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+        runs.append(output)
+    return {'import_ezxt_s': min(float(run[0]) for run in runs),
+            'first_order_s': min(float(run[1]) for run in runs),
+            'import_pandas_s': min(float(run[2]) for run in runs),
+            'import_ccxt_s': min(float(run[3]) for run in runs),
+            'imported_by_order_path': runs[0][4].split(",") if len(runs[0]) > 4 else []}
+
+
+def benchmark_aggregator(venues: int = 5, symbols: int = 200, latency: float = 0.1) -> dict:
+    """
+    Measure a full refresh of the quote aggregator
+    :param venues: number of replay exchanges
+    :param symbols: number of symbols quoted on every venue
+    :param latency: simulated round trip of a request in seconds
+    :return: refresh time in seconds & in round trips
+    """
+    markets = tuple(f"C{i}/USDT" for i in range(symbols))
+    aggregator = ezxt.QuoteAggregator([ezxt.WrappedGenericExchange(
+        ezxt.ReplayExchange.configure(symbols=markets, latency=latency, seed=seed)) for seed in range(venues)])
+    aggregator.refresh(markets)  # markets loading
+    refresh = timed(lambda: aggregator.refresh(markets), 3)
+    return {'venues': venues, 'symbols': symbols, 'latency_s': latency, 'refresh_s': refresh,
+            'round_trips': refresh / latency}
+
+
+def benchmark_archive(rows: int = 500000, block_size: int = 65536) -> dict:
+    """
+    Compare the compressed archive with the csv files written by load_ohlcv
+    :param rows: number of candles
+    :param block_size: number of candles of a block of the archive
+    :return: sizes, size ratio and encode / decode / range read times in seconds
+    """
+    dataframe = synthetic_ohlcv(rows)
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "series.csv")
+        archive_path = os.path.join(directory, "series.ezxt")
+
+        csv_write = timed(lambda: dataframe.to_csv(csv_path), repeat=1)
+        csv_read = timed(lambda: pd.read_csv(csv_path, index_col=0), repeat=3)
+        encode = timed(lambda: ezxt.OhlcvArchive.write(archive_path, dataframe, 1, 4, block_size=block_size), 3)
+        decode = timed(lambda: ezxt.OhlcvArchive(archive_path).read(), repeat=3)
+        middle = int(dataframe['timestamp'].iloc[rows // 2])
+        range_read = timed(lambda: ezxt.OhlcvArchive(archive_path).read(middle, middle + 1440 * 60000), repeat=3)
+
+        if not ezxt.OhlcvArchive(archive_path).read().equals(dataframe):
+            raise AssertionError("the archive is not lossless")
+
+        return {'rows': rows, 'block_size': block_size,
+                'csv_bytes': os.path.getsize(csv_path), 'archive_bytes': os.path.getsize(archive_path),
+                'ratio': os.path.getsize(csv_path) / os.path.getsize(archive_path),
+                'csv_write_s': csv_write, 'csv_read_s': csv_read,
+                'archive_write_s': encode, 'archive_read_s': decode, 'archive_range_read_1d_s': range_read}
+
+
+def benchmark_scheduler(parents: int = 500, slices: int = 5, duration: float = 1.) -> dict:
+    """
+    Measure the cost of the order scheduler running many TWAP parents on a zero latency exchange
+    :param parents: number of parent orders
+    :param slices: child orders of a parent
+    :param duration: seconds of a TWAP
+    :return: wall time, cpu time of the ticks (scheduler, wrapper & simulated exchange) per parent & per child in
+    microseconds and requests per child
+    """
+    wrapped_client = replay_client(balances={'BTC': 1e9, 'USDT': 1e12}, fill_delay=duration / slices / 2)
+    scheduler = ezxt.OrderScheduler(wrapped_client, poll_interval=duration / slices / 4)
+    for i in range(parents):
+        scheduler.submit_twap("BTC/USDT", "buy" if i % 2 else "sell", 0.01, duration, slices)
+    cpu, start, ticks = 0., time.perf_counter(), 0
+    while scheduler.get_parents(ezxt.ParentState.ACTIVE):
+        tick = time.process_time()
+        scheduler.run_pending()
+        cpu += time.process_time() - tick
+        ticks += 1
+        time.sleep(0.005)
+    calls = wrapped_client.client.calls
+    children = calls['create_order']
+    return {'parents': parents, 'slices': slices, 'wall_s': time.perf_counter() - start, 'ticks': ticks,
+            'cpu_per_parent_us': cpu / parents * 1e6, 'cpu_per_child_us': cpu / children * 1e6,
+            'requests_per_child': sum(calls.values()) / children,
+            'polls': calls.get('fetch_open_orders', 0), 'cancels': calls.get('cancel_order', 0)}
+
+
+def run(output: (str, NoneType) = None) -> dict:
+    """
+    Run every benchmark
+    :param output: path of the json file to write the results to, None to only print them
+    :return: results
+    """
+    results = {'python': sys.version.split()[0], 'numpy': np.__version__, 'pandas': pd.__version__,
+               'time': int(time.time()), 'benchmarks': {}}
+
+    for name, benchmark in (('import', benchmark_import), ('download', benchmark_download),
+                            ('cache', benchmark_cache), ('overhead', benchmark_overhead),
+                            ('aggregator', benchmark_aggregator), ('archive', benchmark_archive),
+                            ('scheduler', benchmark_scheduler)):
+        print(f"{Colors.PURPLE}| Benchmark: {name} |{Colors.END}")
+        results['benchmarks'][name] = benchmark()
+        print(f"{Colors.GREEN}-> {results['benchmarks'][name]}{Colors.END}")
+
+    if output is not None:
+        with open(output, "w") as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the ezxt benchmarks and print the results")
+    parser.add_argument("--output", default=None, help="path of the json file to write the results to")
+    run(parser.parse_args().output)
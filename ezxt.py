@@ -1,13 +1,61 @@
+import bisect
 import functools
+import glob
+import hashlib
+import heapq
+import importlib
+import itertools
+import json
 import math
 import os
+import random
+import socket
+import sqlite3
+import struct
+import sys
 import threading
 import time
-from datetime import datetime
+import zlib
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from decimal import Decimal, ROUND_CEILING, ROUND_DOWN, ROUND_FLOOR, ROUND_HALF_EVEN, ROUND_UP
 from types import NoneType
 
-import pandas as pd
-import ccxt
+try:  # file locks
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+
+
+# Module imported the first time one of its attributes is used
+class LazyModule:
+    """
+    Stand-in for a heavy module (pandas, ccxt) imported on first use so that importing ezxt stays fast, the global
+    holding the stand-in is then replaced by the module itself
+    """
+
+    def __init__(self, name: str, alias: str):
+        """
+        :param name: name of the module to import
+        :param alias: name of the global of ezxt holding the stand-in
+        """
+        self.__dict__.update(name=name, alias=alias)
+
+    def __getattr__(self, attribute: str):
+        module = importlib.import_module(self.name)
+        globals()[self.alias] = module
+        return getattr(module, attribute)
+
+    def __setattr__(self, attribute: str, value):
+        setattr(importlib.import_module(self.name), attribute, value)
+
+
+pd = LazyModule("pandas", "pd")  # only imported by the methods dealing with dataframes
+ccxt = LazyModule("ccxt", "ccxt")  # imported when an exchange is wrapped
 
 '''
 Utility
@@ -21,6 +69,16 @@ class ClientState:
     AUTHENTICATED = "client instanced and linked to an account"
 
 
+# Reason codes attached to each leg by WrappedGenericExchange.get_order_sizes()
+class SizeReason:
+    OK = "ok"
+    BELOW_MINIMUM = "below_minimum"
+    NO_PRICE = "no_price"
+    NO_BALANCE = "no_balance"
+    WRONG_SIZE_TYPE = "wrong_size_type"
+    BELOW_MIN_COST = "below_min_cost"
+
+
 # Terminal colors
 class Colors:
     """
@@ -90,6 +148,18 @@ def truncate(number: float, decimals: int = 0) -> float:
     return math.trunc(number * factor) / factor
 
 
+# Convert a timeframe to milliseconds
+def timeframe_to_ms(timeframe: str) -> int:
+    """
+    Returns the duration of a timeframe in milliseconds.
+    :param timeframe: usually '1y', '1M', '1w', '1d', '1h', '1m', '1s'...
+    :return: duration in milliseconds
+    """
+    units = {'s': 1000, 'm': 60000, 'h': 3600000, 'd': 86400000, 'w': 604800000, 'M': 2592000000,
+             'y': 31536000000}
+    return int(timeframe[:-1]) * units[timeframe[-1]]
+
+
 # Load markets before a method
 def load_markets(func: callable):
     """
@@ -157,6 +227,76 @@ def only_implemented_types(func):
     return wrapper
 
 
+# Retry a request following the retry policy of the client
+def retry_request(func: callable):
+    """
+    Retry a method following the retry policy of the client (instance.retry_policy), for idempotent requests
+    :param func: function to be decorated
+    :return: a function
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        instance = args[0]  # we take the object from which the method is called
+        metrics = instance.metrics
+        if metrics is None:
+            if instance.retry_policy is None:
+                return func(*args, **kwargs)
+            return instance.retry_policy.call(func, *args, client=instance.client, **kwargs)
+        metrics.instrument(instance.client)
+        if instance.retry_policy is None:
+            return metrics.measure(func.__name__, func, *args, **kwargs)
+        return metrics.measure(func.__name__, instance.retry_policy.call, func, *args, client=instance.client,
+                               metrics=metrics, **kwargs)
+
+    return wrapper
+
+
+# Retry an order following the retry policy of the client
+def retry_order(func: callable):
+    """
+    Retry a method following the retry policy of the client (instance.retry_policy), for requests which must not be
+    sent twice (orders, cancels), only errors meaning the request was rejected before being processed are retried
+    :param func: function to be decorated
+    :return: a function
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        instance = args[0]  # we take the object from which the method is called
+        metrics = instance.metrics
+        if metrics is None:
+            if instance.retry_policy is None:
+                return func(*args, **kwargs)
+            return instance.retry_policy.call(func, *args, client=instance.client, idempotent=False, **kwargs)
+        metrics.instrument(instance.client)
+        if instance.retry_policy is None:
+            return metrics.measure(func.__name__, func, *args, **kwargs)
+        return metrics.measure(func.__name__, instance.retry_policy.call, func, *args, client=instance.client,
+                               idempotent=False, metrics=metrics, **kwargs)
+
+    return wrapper
+
+
+# Record the orders returned by a method in the order journal
+def journal_orders(func: callable):
+    """
+    Record the order(s) returned by a method in the order journal of the client, if the journal is enabled
+    :param func: function to be decorated
+    :return: a function
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        instance = args[0]  # we take the object from which the method is called
+        result = func(*args, **kwargs)
+        if instance.journal is not None:
+            instance.journal.record(result)
+        return result
+
+    return wrapper
+
+
 '''
 exceptions
 '''
@@ -207,334 +347,3443 @@ class WrongSizeType(BaseException):
             f"to the documentation at WrappedGenericExchange.get_order_size()")
 
 
+class TradesPaginationError(BaseException):
+    """
+    Exception to be raised when the trades of a millisecond don't fit in a page and can't be paged by id
+    """
+
+    def __init__(self, market: str, timestamp: int, count: int):
+        """
+        Constructor
+        :param market: market of the trades
+        :param timestamp: timestamp of the trades
+        :param count: number of trades received for this timestamp
+        """
+        super().__init__(
+            f"{Colors.ERROR}TradesPaginationError exception {market} has more than {count} trades at {timestamp}, more "
+            f"than a page of the exchange, use the id_param of load_trades to page them by id{Colors.END}")
+
+
+class JournalNotEnabled(BaseException):
+    """
+    Exception to be raised when a method needing the order journal is called before enable_order_journal()
+    """
+
+    def __init__(self, func: callable):
+        """
+        Constructor
+        :param func: a function
+        """
+        super().__init__(f"{Colors.ERROR}JournalNotEnabled exception you can't call {func.__name__} because the order "
+                         f"journal is not enabled, call enable_order_journal() first{Colors.END}")
+
+
 '''
-Core
+Order journal
 '''
 
 
-# Template class representing a wrapped exchange
-class WrappedGenericExchange:
+# Local append-only journal of orders and fills (used by WrappedGenericExchange)
+class OrderJournal:
+    """
+    Append-only order & fill journal stored in a SQLite database.
+    Every order seen by the wrapper is appended to the `events` table, the `orders` table always holds the last
+    known state of each order and is indexed by id, market, status and time so history queries stay local.
+    """
 
-    def __init__(self, exchange):
+    def __init__(self, path: str = ":memory:"):
         """
-        Template class representing a wrapped exchange
-        :param exchange: a ccxt exchange ( a class not an object ), ccxt.ftx for example.
+        :param path: path of the SQLite file, ":memory:" to keep the journal in memory only
         """
-        # check if there is a custom class for the exchange
-        name = exchange.__name__.lower()
-        if name in customs and self.__class__.__name__ == WrappedGenericExchange.__name__:
-            print(f"{Colors.YELLOW} Warning {name} has a custom class provided by EZXT, please use {customs[name]} "
-                  f"class instead of WrappedGenericExchange if you don't want to encouter some unexpected issues")
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_id TEXT NOT NULL,
+                market TEXT,
+                status TEXT,
+                timestamp INTEGER,
+                recorded INTEGER NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS orders (
+                order_id TEXT PRIMARY KEY,
+                market TEXT,
+                side TEXT,
+                type TEXT,
+                status TEXT,
+                price REAL,
+                amount REAL,
+                filled REAL,
+                timestamp INTEGER,
+                updated INTEGER NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS fills (
+                fill_id TEXT PRIMARY KEY,
+                order_id TEXT,
+                market TEXT,
+                side TEXT,
+                price REAL,
+                amount REAL,
+                timestamp INTEGER,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS orders_market ON orders (market, timestamp);
+            CREATE INDEX IF NOT EXISTS orders_status ON orders (status, timestamp);
+            CREATE INDEX IF NOT EXISTS orders_timestamp ON orders (timestamp);
+            CREATE INDEX IF NOT EXISTS fills_order ON fills (order_id);
+            CREATE INDEX IF NOT EXISTS fills_market ON fills (market, timestamp);
+        """)
+
+    # Record an order, a list of orders or nothing
+    def record(self, orders: (dict, list, NoneType)):
+        """
+        Append one or several orders to the journal, orders without id (e.g. the {} returned for a null size)
+        are ignored
+        :param orders: an order as a dict or a list of orders
+        """
+        if isinstance(orders, dict):
+            orders = [orders]
+        if not orders:
+            return
+        now = int(time.time() * 1000)
+        events, known, fills = [], [], []
+        for order in orders:
+            if not isinstance(order, dict) or order.get("id") is None:
+                continue
+            order_id = str(order["id"])
+            events.append((order_id, order.get("symbol"), order.get("status"), order.get("timestamp"), now,
+                           json.dumps(order, default=str)))
+            known.append((order_id, order))
+            for trade in order.get("trades") or []:
+                if trade.get("id") is not None:
+                    fills.append(self.__fill_row__(trade, order_id))
+
+        with self.lock:
+            self.connection.execute("BEGIN")
+            try:
+                self.connection.executemany("INSERT INTO events (order_id, market, status, timestamp, recorded, "
+                                            "data) VALUES (?, ?, ?, ?, ?, ?)", events)
+                states = []
+                for order_id, order in known:
+                    # the last known state wins, but a missing field never erases a known one
+                    row = self.connection.execute("SELECT data FROM orders WHERE order_id = ?",
+                                                  (order_id,)).fetchone()
+                    state = {} if row is None else json.loads(row[0])
+                    state.update({key: value for key, value in order.items() if value is not None})
+                    states.append((order_id, state.get("symbol"), state.get("side"), state.get("type"),
+                                   state.get("status"), state.get("price"), state.get("amount"), state.get("filled"),
+                                   state.get("timestamp"), now, json.dumps(state, default=str)))
+                self.connection.executemany("INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                            states)
+                self.connection.executemany("INSERT OR IGNORE INTO fills VALUES (?, ?, ?, ?, ?, ?, ?, ?)", fills)
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    # Record fills (trades) returned by fetch_my_trades
+    def record_fills(self, trades: list):
+        """
+        Append fills to the journal, fills already known are ignored
+        :param trades: list of ccxt trades
+        """
+        rows = [self.__fill_row__(trade, trade.get("order")) for trade in trades if trade.get("id") is not None]
+        with self.lock:
+            self.connection.executemany("INSERT OR IGNORE INTO fills VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
 
-        self.exchange = exchange  # Look at the method docstring
-        self.client = exchange({'enableRateLimit': True})  # Store the instanced client
-        self.ClientState = ClientState.NOT_AUTHENTICATED  # Store the client state
+    @staticmethod
+    def __fill_row__(trade: dict, order_id: (str, NoneType)) -> tuple:
+        """
+        Convert a ccxt trade to a row of the fills table
+        """
+        return (str(trade["id"]), None if order_id is None else str(order_id), trade.get("symbol"), trade.get("side"),
+                trade.get("price"), trade.get("amount"), trade.get("timestamp"), json.dumps(trade, default=str))
 
-    # Overrideable
-    @only_implemented_types
-    def authenticate_client(self, api_key: str, api_secret: str,
-                            enable_rate_limit: bool = True):
+    # Get the last known state of an order
+    def get_order(self, order_id: str) -> (dict, NoneType):
         """
-        Instantiate ccxt client
-        :param api_key: api key in your cex settings
-        :param api_secret: api secret in your cex settings
-        :param enable_rate_limit: True to activate the control of the ratelimit
+        :param order_id: order id
+        :return: the last known state of the order or None if the order is unknown
         """
+        with self.lock:
+            row = self.connection.execute("SELECT data FROM orders WHERE order_id = ?", (str(order_id),)).fetchone()
+        return None if row is None else json.loads(row[0])
 
-        self.client = self.exchange({
-            'apiKey': api_key,
-            'secret': api_secret,
-            'enableRateLimit': enable_rate_limit
-        })
-        self.ClientState = ClientState.AUTHENTICATED
+    # Query orders by market, status and time
+    def get_orders(self, market: (str, NoneType) = None, status: (str, NoneType) = None,
+                   since: (int, NoneType) = None, until: (int, NoneType) = None) -> list:
+        """
+        :param market: example "BTC/USD", None for every market
+        :param status: "open", "closed", "canceled"... None for every status
+        :param since: first order timestamp (ms, included)
+        :param until: last order timestamp (ms, excluded)
+        :return: the last known state of the matching orders sorted by timestamp
+        """
+        query, values = self.__where__(market=market, status=status, since=since, until=until)
+        with self.lock:
+            rows = self.connection.execute(f"SELECT data FROM orders{query} ORDER BY timestamp", values).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    # Query fills by order, market and time
+    def get_fills(self, order_id: (str, NoneType) = None, market: (str, NoneType) = None,
+                  since: (int, NoneType) = None, until: (int, NoneType) = None) -> list:
+        """
+        :param order_id: order id, None for every order
+        :param market: example "BTC/USD", None for every market
+        :param since: first fill timestamp (ms, included)
+        :param until: last fill timestamp (ms, excluded)
+        :return: matching fills sorted by timestamp
+        """
+        query, values = self.__where__(order_id=None if order_id is None else str(order_id), market=market,
+                                       since=since, until=until)
+        with self.lock:
+            rows = self.connection.execute(f"SELECT data FROM fills{query} ORDER BY timestamp", values).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    # Get the whole history of an order
+    def get_events(self, order_id: str) -> list:
+        """
+        :param order_id: order id
+        :return: every recorded state of the order, oldest first
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT data FROM events WHERE order_id = ? ORDER BY seq",
+                                           (str(order_id),)).fetchall()
+        return [json.loads(row[0]) for row in rows]
 
-    # Public API
+    # Timestamp to start an incremental sync from
+    def get_last_timestamp(self, market: (str, NoneType) = None, table: str = "orders") -> (int, NoneType):
+        """
+        :param market: example "BTC/USD", None for every market
+        :param table: "orders" or "fills"
+        :return: timestamp of the most recent order (or fill) of the market, None if the journal is empty
+        """
+        query, values = self.__where__(market=market)
+        with self.lock:
+            row = self.connection.execute(f"SELECT MAX(timestamp) FROM {table}{query}", values).fetchone()
+        return row[0]
 
-    @load_markets
-    @only_implemented_types
-    def get_bid(self, market: str, params: (dict, NoneType) = None) -> int:
+    @staticmethod
+    def __where__(**filters) -> tuple[str, list]:
         """
-        Return bid price of a market
-        :param market: Example: "BTC/USD"
-        :param params: Additional parameters
-        :return: bid price
+        Build a WHERE clause from the filters which are not None
         """
-        if params is None:
-            params = {}
-        return int(self.client.fetch_ticker(market, params=params)["bid"])
+        clauses, values = [], []
+        for column, value in filters.items():
+            if value is None:
+                continue
+            if column == "since":
+                clauses.append("timestamp >= ?")
+            elif column == "until":
+                clauses.append("timestamp < ?")
+            else:
+                clauses.append(f"{column} = ?")
+            values.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), values
 
-    @load_markets
-    @only_implemented_types
-    def get_ask(self, market: str, params: (dict, NoneType) = None) -> int:
+    def close(self):
         """
-        Return ask price of a market
-        :param market: example: "BTC/USD"
-        :param params: additional parameters
-        :return: ask price
+        Close the SQLite connection
         """
-        if params is None:
-            params = {}
-        return int(self.client.fetch_ticker(market, params=params)["ask"])
+        with self.lock:
+            self.connection.close()
 
-    @only_implemented_types
-    def get_kline(self, market: str, timeframe: str, since: (str, int, NoneType), limit: (int, NoneType),
-                  params: (dict, NoneType) = None) -> pd.DataFrame:
+
+'''
+Market rules
+'''
+
+
+# ccxt precision modes (ccxt.DECIMAL_PLACES, ccxt.SIGNIFICANT_DIGITS, ccxt.TICK_SIZE)
+class PrecisionMode:
+    DECIMAL_PLACES = 2
+    SIGNIFICANT_DIGITS = 3
+    TICK_SIZE = 4
+
+
+# Rounding directions accepted by MarketRules & RoundingTable
+roundings = {'down': ROUND_DOWN, 'up': ROUND_UP, 'floor': ROUND_FLOOR, 'ceil': ROUND_CEILING,
+             'nearest': ROUND_HALF_EVEN}
+
+
+# Precision & limits of one market, precomputed from the ccxt market structure
+class MarketRules:
+    """
+    Precision & limits of a market: amount step, price tick, min/max amount, min cost and precision mode.
+    Steps are stored as Decimal so rounding is exact whatever the precision mode of the exchange.
+    """
+    __slots__ = ('symbol', 'base', 'quote', 'spot', 'active', 'mode', 'amount_precision', 'price_precision',
+                 'amount_step', 'price_tick', 'amount_min', 'amount_max', 'price_min', 'price_max', 'cost_min',
+                 'cost_max')
+
+    def __init__(self, market: dict, mode: int):
         """
-        Download kline for a market
-        :param market: example "ETH/USD"
-        :param timeframe: usually '1y', '1m', '1d', '1w', '1h'...
-        :param since: first candle to download timestamp
-        :param limit: number of candles
-        :param params: additional parameters
-        :return: pandas dataframe
+        :param market: ccxt market structure (client.markets[symbol])
+        :param mode: precision mode of the exchange (client.precisionMode)
         """
-        if params is None:
-            params = {}
-        kline = self.client.fetch_ohlcv(market, timeframe, since=since, limit=limit, params=params)
-        dataframe = pd.DataFrame(kline)
-        if dataframe.empty:
-            return dataframe
-        dataframe.rename(columns={0: 'timestamp', 1: 'open', 2: 'high', 3: 'low', 4: 'close', 5: 'volume'},
-                         inplace=True)
-        return dataframe
+        precision = market.get("precision") or {}
+        limits = market.get("limits") or {}
+        self.symbol = market["symbol"]
+        self.base = market.get("base")
+        self.quote = market.get("quote")
+        self.spot = market.get("spot", True) is not False
+        self.active = market.get("active") is not False
+        self.mode = mode
+        self.amount_precision = self.__number__(precision.get("amount"))
+        self.price_precision = self.__number__(precision.get("price"))
+        self.amount_step = self.__step__(self.amount_precision, mode)
+        self.price_tick = self.__step__(self.price_precision, mode)
+        self.amount_min = self.__number__((limits.get("amount") or {}).get("min"), 0.)
+        self.amount_max = self.__number__((limits.get("amount") or {}).get("max"), math.inf)
+        self.price_min = self.__number__((limits.get("price") or {}).get("min"), 0.)
+        self.price_max = self.__number__((limits.get("price") or {}).get("max"), math.inf)
+        self.cost_min = self.__number__((limits.get("cost") or {}).get("min"), 0.)
+        self.cost_max = self.__number__((limits.get("cost") or {}).get("max"), math.inf)
+
+    @staticmethod
+    def __number__(value, default=None):
+        """
+        Convert a ccxt number (float, str or None) to a float
+        """
+        return default if value is None else float(value)
 
-    @only_implemented_types
-    def get_market(self, market: str) -> dict:
+    @staticmethod
+    def __step__(precision: (float, NoneType), mode: int) -> (Decimal, NoneType):
         """
-        Get some market information
-        :param market: example "ETH/USD"
-        :return:
+        Convert a ccxt precision to an exact step, None when the step depends on the value (significant digits)
+        or when the exchange doesn't give any precision
         """
-        return self.client.market(market)
+        if precision is None or mode == PrecisionMode.SIGNIFICANT_DIGITS:
+            return None
+        if mode == PrecisionMode.DECIMAL_PLACES:
+            return Decimal(1).scaleb(-int(precision))
+        return Decimal(repr(precision))
 
-    @only_implemented_types
-    def get_precision(self, market: str, params: (dict, NoneType) = None) -> tuple[float, float]:
+    def __round__(self, value: float, step: (Decimal, NoneType), precision: (float, NoneType), rounding: str):
         """
-        Get the precision of a market and the minimal size
-        :param market: example "ETH/USD"
-        :param params: additional parameters
-        :return: (market precision, minimal size)
+        Round a value to a multiple of step (or to precision significant digits)
         """
-        if params is None:
-            params = {}
-        market = self.get_market(market)
-        return float(market["precision"]["amount"]), float(market["limits"]["amount"]["min"])
+        if precision is None or value == 0:
+            return float(value)
+        exact = Decimal(repr(float(value)))
+        if step is None:  # significant digits, the step depends on the magnitude of the value
+            step = Decimal(1).scaleb(exact.adjusted() - int(precision) + 1)
+        return float((exact / step).to_integral_value(rounding=roundings[rounding]) * step)
+
+    def round_amount(self, amount: (float, int), rounding: str = "down") -> float:
+        """
+        :param amount: amount to round
+        :param rounding: "down" (toward zero, default), "up", "floor", "ceil" or "nearest"
+        :return: the amount rounded to the amount step of the market
+        """
+        return self.__round__(amount, self.amount_step, self.amount_precision, rounding)
 
-    # Public API - Multithreading dl & ohlcv file saving
-    # Do not use __download__ & __load__ use load_ohlcv instead
-    def __download__(self, market: str, timeframe: str, since: (str, int, NoneType), limit: (int, NoneType),
-                     output: bool, download_size: int):
+    def round_price(self, price: (float, int), rounding: str = "nearest") -> float:
         """
-        Please do not use this method directly use load_ohlcv instead
+        :param price: price to round
+        :param rounding: "nearest" (default), "down", "up", "floor" or "ceil"
+        :return: the price rounded to the price tick of the market
         """
+        return self.__round__(price, self.price_tick, self.price_precision, rounding)
 
-        # Sub functions
 
-        def dl(_since, _limit, _request_id, response_dict):
-            nonlocal rate_limit_reached
-            while True:
-                try:
-                    response = self.get_kline(market, timeframe, int(_since), _limit)
-                    break
-                except Exception:
-                    rate_limit_reached = True
-                    while rate_limit_reached:
-                        pass
-                    time.sleep(1)
+# Rounding table of every market of an exchange (used by WrappedGenericExchange)
+class RoundingTable:
+    """
+    Precomputed MarketRules for every market of an exchange, built once when markets are loaded.
+    Batch methods round whole arrays with NumPy on integer ticks.
+    """
 
-            response_dict[_request_id] = response
-            return response_dict
+    def __init__(self, markets: dict, mode: int):
+        """
+        :param markets: ccxt markets (client.markets)
+        :param mode: precision mode of the exchange (client.precisionMode)
+        """
+        self.markets = markets  # kept to detect a reload of the markets
+        self.mode = mode
+        self.rules = {symbol: MarketRules(market, mode) for symbol, market in markets.items()}
 
-        def rate_limit_handler():
-            nonlocal rate_limit_reached, finished
-            remaining = 60
-            while True:
-                if rate_limit_reached:
-                    while remaining > 0:
-                        # at least one thread turned this parameter on True so we wait 61s
-                        progress_bar(request_id, total_length, front=f" rate limit reached waiting for [{remaining}s]") \
-                            if output else None
-                        time.sleep(1)
-                        remaining -= 1
-                    remaining = 60
-                    rate_limit_reached = False
-                time.sleep(1)
-                if finished:
-                    break
-            finished = False
+    def __getitem__(self, market: str) -> MarketRules:
+        return self.rules[market]
 
-        # Ini
-        remainging_candles = limit
-        finished = False  # used to stop rate limit thread
+    def __contains__(self, market: str) -> bool:
+        return market in self.rules
 
-        # Part 1 - first set of candles
-        dataframe = self.get_kline(market, timeframe, since=since, limit=limit)
-        size = len(dataframe)
-        if size == 0:
-            return dataframe
-        remainging_candles -= size
-        if remainging_candles <= 0 or len(dataframe) < 2:
-            return dataframe
+    def __round_batch__(self, markets: list, values, kind: str, rounding: str) -> np.ndarray:
+        """
+        Round values[i] to the step of markets[i], kind is "amount" or "price". Values are rounded on integer ticks
+        with NumPy, values too close to a tick (or to half a tick for "nearest") to decide with floats are rounded
+        exactly by MarketRules, results are the same as MarketRules.round_amount & round_price
+        """
+        values = np.asarray(values, dtype=float)
+        if not len(values):
+            return values
+        # every step is written units * 10 ** -exponents with integer units
+        steps = {market: self.__units__(self.rules[market], kind) for market in set(markets)}
+        units, exponents = np.array([steps[market] for market in markets], dtype=float).reshape(len(values), 2).T
+        undecided = np.zeros(len(values), dtype=bool)
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            if self.mode == PrecisionMode.SIGNIFICANT_DIGITS:
+                logs = np.log10(np.abs(values))
+                exponents = exponents - np.floor(logs) - 1
+                undecided |= np.abs(logs - np.rint(logs)) < 1e-9  # the magnitude may be wrong near powers of 10
+            exponents = np.nan_to_num(exponents)
+            scales = 10. ** np.abs(exponents)
+            positive = exponents >= 0
+            ticks = np.where(positive, values * scales, values / scales) / units
+            nearest = np.rint(ticks)
+            # float error of ticks is a few 1e-16 relative, closer than tolerance the side of the tick is unknown
+            tolerance = 1e-12 * np.maximum(1., np.abs(ticks))
+            on_tick = np.abs(ticks - nearest) <= tolerance
+
+            def to_values(_ticks):  # exact when _ticks * units < 2 ** 53 & scales <= 1e22
+                return np.where(positive, _ticks * units / scales, _ticks * units * scales)
+
+            functions = {'down': np.trunc, 'up': lambda x: np.sign(x) * np.ceil(np.abs(x)), 'floor': np.floor,
+                         'ceil': np.ceil, 'nearest': np.rint}
+            rounded_ticks = functions[rounding](ticks)
+            # a value already on a tick (its shortest repr is the tick) is left as it is
+            exact = on_tick & (to_values(nearest) == values) & (np.abs(nearest * units) < 1e15)
+            rounded_ticks = np.where(exact, nearest, rounded_ticks)
+            undecided |= on_tick & ~exact
+            if rounding == "nearest":
+                undecided |= np.abs(np.abs(ticks - np.trunc(ticks)) - 0.5) <= tolerance
+            undecided |= ~np.isfinite(ticks) | (np.abs(rounded_ticks * units) >= 2 ** 53) | (np.abs(exponents) > 22)
+            rounded = to_values(rounded_ticks)
+        # markets without precision and null values are left untouched
+        untouched = np.isnan(units) | (values == 0) | ~np.isfinite(values)
+        rounded = np.where(untouched, values, rounded)
+        for i in np.flatnonzero(undecided & ~untouched):
+            rounded[i] = self.rules[markets[i]].round_amount(values[i], rounding) if kind == "amount" else \
+                self.rules[markets[i]].round_price(values[i], rounding)
+        return rounded
+
+    @staticmethod
+    def __units__(rules: MarketRules, kind: str) -> tuple:
+        """
+        Decompose the step of a market as (units, exponent) with step = units * 10 ** -exponent,
+        for significant digits the exponent is the number of digits (the magnitude is added per value)
+        """
+        precision = getattr(rules, kind + "_precision")
+        step = getattr(rules, "amount_step" if kind == "amount" else "price_tick")
+        if precision is None:
+            return np.nan, np.nan
+        if step is None:
+            return 1, int(precision)
+        sign, digits, exponent = step.normalize().as_tuple()
+        return int("".join(map(str, digits))), -exponent
+
+    def round_amounts(self, markets: list, amounts, rounding: str = "down") -> np.ndarray:
+        """
+        :param markets: list of markets
+        :param amounts: list or array of amounts
+        :param rounding: "down" (toward zero, default), "up", "floor", "ceil" or "nearest"
+        :return: amounts rounded to the amount step of their market
+        """
+        return self.__round_batch__(markets, amounts, "amount", rounding)
 
-        # Part 2 - requests making
-        t0 = dataframe.iloc[0]["timestamp"]  # First timestamp
-        t1 = dataframe.iloc[1]["timestamp"]  # Second timestamp
-        tx = dataframe.iloc[-1]["timestamp"]  # Last timestamp
-        offset = t1 - t0  # time between two df rows
-        full_offset = tx - t0  # time between first & last df rows
-        requests = []
-        last_timestamp = tx  # For the loop
-        while remainging_candles > 0:
-            last_timestamp += offset
-            if last_timestamp > time.time() * 1000:
-                remainging_candles = 0
-                break
-            requests.append((last_timestamp, remainging_candles))
-            remainging_candles -= size
-            last_timestamp += full_offset
-        if len(requests) == 0:
-            return dataframe
+    def round_prices(self, markets: list, prices, rounding: str = "nearest") -> np.ndarray:
+        """
+        :param markets: list of markets
+        :param prices: list or array of prices
+        :param rounding: "nearest" (default), "down", "up", "floor" or "ceil"
+        :return: prices rounded to the price tick of their market
+        """
+        return self.__round_batch__(markets, prices, "price", rounding)
 
-        # Part 3 - requests sending
-        temp_responses = {}
-        responses = {}
-        responses_expected_length = len(requests)
-        total_length = responses_expected_length  # total length of the responses list
-        rate_limit_reached = False  # for rate_limit_handler()
-        if responses_expected_length > download_size:
-            responses_expected_length = download_size
-
-        # Starting rate limit handler thread
-        threading.Thread(target=rate_limit_handler).start()
-
-        request_id = 0
-        print(f"{Colors.YELLOW}[DataManager] Multithreading Download" if output else None)
-        progress_bar(0, total_length)
-        scheduled = 0
-        for timestamp, limit in requests:
-            threading.Thread(target=dl,
-                             args=(timestamp, limit, request_id, temp_responses)).start()  # we schedule the request
-            request_id += 1  # we increment the request id
-            scheduled += 1  # we increment requests amount
-
-            if scheduled == responses_expected_length:  # we wait for the responses
-                while not len(temp_responses) == responses_expected_length:
-                    pass
-                responses.update(temp_responses)  # we merge new responses with the old ones
-                temp_responses = {}  # we reset temporary responses
-                scheduled = 0
-                responses_expected_length = len(requests) - len(responses)  # expected length of the responses list
-                if responses_expected_length > download_size:
-                    responses_expected_length = download_size
-                progress_bar(request_id, total_length) if output else None
 
-        # Merging
-        dataframes = [dataframe]
-        for i in range(len(responses)):
-            dataframes.append(responses[i])
+'''
+Pre-trade validation
+'''
 
-        dataframe = pd.concat(dataframes, ignore_index=True)
 
-        # We are here waiting for the rate limit thread to stop
-        finished = True
-        while finished:
-            pass
-        return dataframe
+# Error codes of OrderError
+class OrderErrorCode:
+    UNKNOWN_MARKET = "unknown_market"
+    INACTIVE_MARKET = "inactive_market"
+    WRONG_SIDE = "wrong_side"
+    UNSUPPORTED_TYPE = "unsupported_type"
+    MISSING_PRICE = "missing_price"
+    AMOUNT_PRECISION = "amount_precision"
+    PRICE_PRECISION = "price_precision"
+    AMOUNT_TOO_LOW = "amount_too_low"
+    AMOUNT_TOO_HIGH = "amount_too_high"
+    PRICE_TOO_LOW = "price_too_low"
+    PRICE_TOO_HIGH = "price_too_high"
+    COST_TOO_LOW = "cost_too_low"
+    COST_TOO_HIGH = "cost_too_high"
+    INSUFFICIENT_BALANCE = "insufficient_balance"
+
+
+# One reason for an order to be rejected locally
+class OrderError:
+    """
+    Structured validation error returned by OrderValidator.validate()
+    """
+    __slots__ = ('code', 'field', 'value', 'limit', 'message')
 
-    def __get_file_name__(self, market: str, timeframe: str, since: int, limit: int):
+    def __init__(self, code: str, field: str, value, limit, message: str):
         """
-        Generate file name to save / load market data from file system
-        :return:
+        :param code: one of OrderErrorCode
+        :param field: parameter involved ("market", "side", "type", "size", "price", "cost")
+        :param value: the value given
+        :param limit: the value expected (a limit, a step...)
+        :param message: human readable message
         """
-        filename = ""
-        filename += market.replace("-", "").replace("/", "") + '_'  # market
-        filename += timeframe + '_'  # timeframe
-        filename += datetime.fromtimestamp(since / 1000).strftime("%d-%m-%y-%H-%M-%S") + '_'  # since
-        filename += ("to_now" if limit == -1 else str(limit) + '_candles') + '.csv'  # limit
+        self.code = code
+        self.field = field
+        self.value = value
+        self.limit = limit
+        self.message = message
 
-        return filename
+    def __repr__(self):
+        return f"OrderError({self.code}: {self.message})"
 
-    @only_implemented_types
-    def load_ohlcv(self, market: str, timeframe: str, since: int, limit: int, output: bool = True,
-                   download_size: int = 100, path: (str, NoneType) = "data/") -> pd.DataFrame:
+
+class OrderValidationError(BaseException):
+    """
+    Exception to be raised when an order is rejected by the pre-trade validation
+    """
+
+    def __init__(self, errors: list):
         """
-        Load ohlcv method work as the get_kline method with some more features:
-        - you can very quickly download a lot of candles using multithreading with just one call
-        - you can save your data as a csv file to be able to load it from a file when you need it to gain a lot of speed
-        - you can pass -1 as the limit to update your data everytime you load it with the last candles,
+        Constructor
+        :param errors: list of OrderError
+        """
+        self.errors = errors
+        super().__init__(f"{Colors.ERROR}OrderValidationError exception the order was rejected before being sent: "
+                         f"{'; '.join(error.message for error in errors)}{Colors.END}")
+
+
+# Pre-trade checks run from cached market data & balances (used by WrappedGenericExchange)
+class OrderValidator:
+    """
+    Check an order against the precision & limits of its market, the cached balance and the order types supported
+    by the exchange, without any request.
+    """
+    # order type -> ccxt "has" capability
+    capabilities = {'market': 'createMarketOrder', 'limit': 'createLimitOrder', 'stop': 'createStopOrder',
+                    'takeProfit': 'createTakeProfitOrder'}
+
+    def __init__(self, strict_precision: bool = False, balance_ttl: (int, float) = 10):
+        """
+        :param strict_precision: True to reject sizes & prices which are not a multiple of the market steps,
+        by default they are only checked once rounded the way ccxt will round them before sending the order
+        :param balance_ttl: max age in seconds of the cached balance used to check the order, 0 to disable
+        the balance check
+        """
+        self.strict_precision = strict_precision
+        self.balance_ttl = balance_ttl
+
+    def validate(self, rules: (MarketRules, NoneType), side: str, order_type: str, size: (float, int),
+                 price: (float, int, NoneType), has: dict, balance: (dict, NoneType) = None,
+                 params: (dict, NoneType) = None) -> list:
+        """
+        :param rules: MarketRules of the market, None if the market is unknown
+        :param side: "buy" or "sell"
+        :param order_type: "market", "limit", "stop" or "takeProfit"
+        :param size: size of the order
+        :param price: price of the order (None for market orders)
+        :param has: ccxt capabilities of the exchange (client.has)
+        :param balance: free balances {token: amount}, None to skip the balance check
+        :param params: additional parameters of the order
+        :return: list of OrderError, empty if the order is valid
+        """
+        errors = []
+        if rules is None:
+            return [OrderError(OrderErrorCode.UNKNOWN_MARKET, "market", None, None, "unknown market")]
+        if not rules.active:
+            errors.append(OrderError(OrderErrorCode.INACTIVE_MARKET, "market", rules.symbol, None,
+                                     f"{rules.symbol} is not active"))
+        if side not in ("buy", "sell"):
+            errors.append(OrderError(OrderErrorCode.WRONG_SIDE, "side", side, ("buy", "sell"),
+                                     f"side must be 'buy' or 'sell', not '{side}'"))
+        if has.get(self.capabilities.get(order_type, "createOrder")) is False:
+            errors.append(OrderError(OrderErrorCode.UNSUPPORTED_TYPE, "type", order_type, None,
+                                     f"{order_type} orders are not supported by this exchange"))
+        if price is None and order_type != "market":
+            errors.append(OrderError(OrderErrorCode.MISSING_PRICE, "price", None, None,
+                                     f"{order_type} orders need a price"))
+
+        # Precision
+        amount = rules.round_amount(size)
+        if self.strict_precision and amount != size:
+            errors.append(OrderError(OrderErrorCode.AMOUNT_PRECISION, "size", size, amount,
+                                     f"size {size} is not a multiple of the amount step, nearest valid is {amount}"))
+        if price is not None:
+            rounded = rules.round_price(price)
+            if self.strict_precision and rounded != price:
+                errors.append(OrderError(OrderErrorCode.PRICE_PRECISION, "price", price, rounded,
+                                         f"price {price} is not a multiple of the price tick, nearest is {rounded}"))
+            price = rounded
+
+        # Limits
+        if amount < rules.amount_min or amount <= 0:
+            errors.append(OrderError(OrderErrorCode.AMOUNT_TOO_LOW, "size", amount, rules.amount_min,
+                                     f"size {amount} is below the minimum {rules.amount_min}"))
+        elif amount > rules.amount_max:
+            errors.append(OrderError(OrderErrorCode.AMOUNT_TOO_HIGH, "size", amount, rules.amount_max,
+                                     f"size {amount} is above the maximum {rules.amount_max}"))
+        if price is not None:
+            if price < rules.price_min or price <= 0:
+                errors.append(OrderError(OrderErrorCode.PRICE_TOO_LOW, "price", price, rules.price_min,
+                                         f"price {price} is below the minimum {rules.price_min}"))
+            elif price > rules.price_max:
+                errors.append(OrderError(OrderErrorCode.PRICE_TOO_HIGH, "price", price, rules.price_max,
+                                         f"price {price} is above the maximum {rules.price_max}"))
+            cost = amount * price
+            if cost < rules.cost_min:
+                errors.append(OrderError(OrderErrorCode.COST_TOO_LOW, "cost", cost, rules.cost_min,
+                                         f"order value {cost} is below the minimum {rules.cost_min}"))
+            elif cost > rules.cost_max:
+                errors.append(OrderError(OrderErrorCode.COST_TOO_HIGH, "cost", cost, rules.cost_max,
+                                         f"order value {cost} is above the maximum {rules.cost_max}"))
+
+        # Balance (spot only, reduce only orders never need a balance)
+        if balance is not None and rules.spot and not (params or {}).get("reduceOnly"):
+            if side == "sell" and rules.base in balance and amount > balance[rules.base]:
+                errors.append(OrderError(OrderErrorCode.INSUFFICIENT_BALANCE, "size", amount, balance[rules.base],
+                                         f"size {amount} is above your free {rules.base} balance "
+                                         f"{balance[rules.base]}"))
+            elif side == "buy" and price is not None and rules.quote in balance \
+                    and amount * price > balance[rules.quote]:
+                errors.append(OrderError(OrderErrorCode.INSUFFICIENT_BALANCE, "cost", amount * price,
+                                         balance[rules.quote], f"order value {amount * price} is above your free "
+                                                               f"{rules.quote} balance {balance[rules.quote]}"))
+
+        return errors
+
+
+'''
+Fast-path orders
+'''
+
+
+# Stages timed by PreparedOrder.submit()
+order_stages = ('validation', 'rate_limit', 'signing', 'network', 'parsing', 'total')
+
+
+# Time the signing, network and rate limit stages of a ccxt client
+def trace_client(client) -> threading.local:
+    """
+    Wrap the sign(), fetch() and throttle() methods of a ccxt client (once) to accumulate the time spent in each of
+    them in a thread local, clients without these methods are left untouched
+    :param client: ccxt client
+    :return: the thread local holding the accumulated timings (signing, network, rate_limit)
+    """
+    if getattr(client, '_ezxt_trace', None) is not None:
+        return client._ezxt_trace
+    local = threading.local()
+
+    def timed(method, stage):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                setattr(local, stage, getattr(local, stage, 0.) + time.perf_counter() - start)
+
+        return wrapper
+
+    for name, stage in (('sign', 'signing'), ('fetch', 'network'), ('throttle', 'rate_limit')):
+        if callable(getattr(client, name, None)):
+            setattr(client, name, timed(getattr(client, name), stage))
+    client._ezxt_trace = local
+    return local
+
+
+# Order handle with everything resolved in advance (created by WrappedGenericExchange.prepare_order)
+class PreparedOrder:
+    """
+    Low latency order submission: the market rules, the ccxt order type and the static parameters are resolved once,
+    submit() only fills the size & price, validates from cache and sends. Every submission records the time spent in
+    each stage (validation, rate_limit, signing, network, parsing).
+    ccxt signs every request with a fresh nonce so requests can't be signed in advance, signing is timed instead.
+    """
+
+    def __init__(self, wrapped_client, market: str, side: str, order_type: str, params: (dict, NoneType) = None,
+                 history: int = 1000):
+        """
+        :param wrapped_client: WrappedGenericExchange used to send the orders
+        :param market: example "BTC/USD"
+        :param side: "buy" or "sell"
+        :param order_type: "market", "limit", "stop" or "takeProfit"
+        :param params: static additional parameters sent with every order (copied, never modified)
+        :param history: number of traces kept in self.traces
+        """
+        self.wrapped_client = wrapped_client
+        self.client = wrapped_client.client
+        self.market = market
+        self.side = side
+        self.order_type = order_type
+        self.rules = wrapped_client.get_market_rules(market)
+        self.params = dict(params or {})
+        # parameter filled with the price for trigger orders
+        self.price_param = {'stop': 'stopPrice', 'takeProfit': 'triggerPrice'}.get(order_type)
+        self.trace = trace_client(self.client)
+        if wrapped_client.metrics is not None:
+            wrapped_client.metrics.instrument(self.client)
+        self.traces = deque(maxlen=history)
+        self.last_trace = None
+
+    def submit(self, size: (float, int), price: (float, int, NoneType) = None,
+               params: (dict, NoneType) = None) -> dict:
+        """
+        Send the order
+        :param size: the size of the order
+        :param price: the price of the order (trigger price for stop & take profit orders), None for market orders
+        :param params: additional parameters merged with the static ones for this order only
+        :return: the order as a dict, {} if the size is null
+        """
+        if size <= 0:
+            return {}
+        start = time.perf_counter()
+        validator = self.wrapped_client.validator
+        if validator is not None:
+            balance = self.wrapped_client.balance_cache
+            if balance is not None and time.time() - self.wrapped_client.balance_cache_time >= validator.balance_ttl:
+                balance = None
+            errors = validator.validate(self.rules, self.side, self.order_type, size, price, self.client.has,
+                                        balance, self.params)
+            if errors:
+                raise OrderValidationError(errors)
+
+        request_params = dict(self.params, **params) if params else dict(self.params)
+        if self.price_param is not None:
+            request_params[self.price_param] = price
+        self.trace.signing = self.trace.network = self.trace.rate_limit = 0.
+        validated = time.perf_counter()
+        order = self.client.create_order(self.market, self.order_type, self.side, size,
+                                         None if self.order_type == 'takeProfit' else price, request_params)
+        end = time.perf_counter()
+
+        self.wrapped_client.__on_order_sent__()
+        if self.wrapped_client.journal is not None:
+            self.wrapped_client.journal.record(order)
+        sent = self.trace.signing + self.trace.network + self.trace.rate_limit
+        self.last_trace = {'validation': validated - start, 'rate_limit': self.trace.rate_limit,
+                           'signing': self.trace.signing, 'network': self.trace.network,
+                           'parsing': max(end - validated - sent, 0.), 'total': end - start}
+        self.traces.append(self.last_trace)
+        if self.wrapped_client.metrics is not None:
+            self.wrapped_client.metrics.observe("ezxt_method_seconds", end - start, method="prepared_order")
+        return order
+
+    def get_stats(self) -> dict:
+        """
+        :return: {stage: {'count', 'mean', 'min', 'max'}} in seconds over the recorded traces
+        """
+        stats = {}
+        for stage in order_stages:
+            values = [trace[stage] for trace in self.traces]
+            stats[stage] = {'count': len(values),
+                            'mean': sum(values) / len(values) if values else 0.,
+                            'min': min(values, default=0.),
+                            'max': max(values, default=0.)}
+        return stats
+
+
+'''
+Retry policy
+'''
+
+
+# Error categories used by RetryPolicy
+class ErrorCategory:
+    RATE_LIMIT = "rate_limit"  # the request was rejected before being processed, always safe to retry
+    TRANSIENT = "transient"  # the request may have been processed, only idempotent requests are retried
+    PERMANENT = "permanent"  # retrying can't help (bad symbol, authentication, invalid order...)
+
+
+# Retry & backoff policy of a client (used by WrappedGenericExchange)
+class RetryPolicy:
+    """
+    Classify ccxt errors and retry requests with exponential backoff & jitter, honouring Retry-After headers.
+    Each request has a max number of retries and a deadline, all requests of the client share an optional retry
+    budget. Nested calls (a wrapped method calling another one) are only retried by the outermost call.
+    By default a request gives up after 30 seconds of retries (8 retries with a backoff up to 60 seconds could block
+    a call for several minutes), pass deadline=None to retry until max_retries.
+    """
+
+    def __init__(self, max_retries: int = 8, base_delay: (int, float) = 0.5, max_delay: (int, float) = 60,
+                 jitter: (int, float) = 0.5, deadline: (int, float, NoneType) = 30,
+                 budget: (int, NoneType) = None, budget_window: (int, float) = 60):
+        """
+        :param max_retries: max number of retries of a request
+        :param base_delay: delay before the first retry in seconds, doubled at each retry
+        :param max_delay: max delay between two retries in seconds
+        :param jitter: part of the delay randomized (0 no jitter, 1 full jitter)
+        :param deadline: max time in seconds spent on a request retries included, a retry which would end after it
+        is not made, None for no deadline
+        :param budget: max number of retries over budget_window seconds for the whole client, None for no budget
+        :param budget_window: length of the budget window in seconds
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.deadline = deadline
+        self.budget = budget
+        self.budget_window = budget_window
+        self.retries = deque()  # timestamps of the retries inside the budget window
+        self.lock = threading.Lock()
+        self.local = threading.local()  # depth of nested calls
+
+    @staticmethod
+    def classify(exception: BaseException) -> str:
+        """
+        :param exception: exception raised by a request
+        :return: an ErrorCategory
+        """
+        module = sys.modules.get("ccxt")  # only a loaded ccxt raises ccxt errors, the lazy ccxt would import it
+        if module is None or not isinstance(exception, module.BaseError):
+            return ErrorCategory.PERMANENT
+        if isinstance(exception, (module.RateLimitExceeded, module.DDoSProtection)):
+            return ErrorCategory.RATE_LIMIT
+        if isinstance(exception, module.NetworkError):  # RequestTimeout, ExchangeNotAvailable, InvalidNonce...
+            return ErrorCategory.TRANSIENT
+        return ErrorCategory.PERMANENT  # ExchangeError: BadSymbol, AuthenticationError, InvalidOrder...
+
+    @staticmethod
+    def get_retry_after(client) -> (float, NoneType):
+        """
+        :param client: ccxt client
+        :return: delay asked by the exchange in the last response (Retry-After header) in seconds, None if any
+        """
+        headers = getattr(client, 'last_response_headers', None) or {}
+        value = next((value for key, value in headers.items() if key.lower() == 'retry-after'), None)
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0.)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.)
+            except (TypeError, ValueError):
+                return None
+
+    def get_delay(self, attempt: int, category: str, client=None) -> float:
+        """
+        :param attempt: number of the retry (0 for the first one)
+        :param category: ErrorCategory of the error
+        :param client: ccxt client, used to read the Retry-After header
+        :return: delay in seconds before the retry
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        delay -= random.uniform(0, delay * self.jitter)
+        if category == ErrorCategory.RATE_LIMIT and client is not None:
+            retry_after = self.get_retry_after(client)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+        return delay
+
+    def __consume_budget__(self) -> bool:
+        """
+        Take one retry from the budget
+        :return: False if the budget is exhausted
+        """
+        if self.budget is None:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            while self.retries and now - self.retries[0] > self.budget_window:
+                self.retries.popleft()
+            if len(self.retries) >= self.budget:
+                return False
+            self.retries.append(now)
+        return True
+
+    def call(self, func: callable, *args, client=None, idempotent: bool = True, on_retry: (callable, NoneType) = None,
+             deadline: (int, float, NoneType) = None, metrics=None, **kwargs):
+        """
+        Call a function and retry it following the policy, the last error is raised when the policy gives up
+        :param func: function to call
+        :param args: arguments of the function
+        :param client: ccxt client, used to read the Retry-After header
+        :param idempotent: False if the request must not be sent twice, then only rate limit errors are retried
+        :param on_retry: called as on_retry(exception, attempt, delay) before waiting for a retry
+        :param deadline: deadline of this call in seconds, None to use the deadline of the policy
+        :param metrics: Metrics recording the retries, None to record nothing
+        :param kwargs: keyword arguments of the function
+        :return: what the function returns
+        """
+        depth = getattr(self.local, 'depth', 0)
+        if depth:  # an outer call is already retrying
+            return func(*args, **kwargs)
+        deadline = self.deadline if deadline is None else deadline
+        start = time.monotonic()
+        attempt = 0
+        self.local.depth = 1
+        try:
+            while True:
+                try:
+                    return func(*args, **kwargs)
+                except BaseException as exception:
+                    category = self.classify(exception)
+                    if category == ErrorCategory.PERMANENT or attempt >= self.max_retries \
+                            or (category == ErrorCategory.TRANSIENT and not idempotent):
+                        raise
+                    delay = self.get_delay(attempt, category, client)
+                    if deadline is not None and time.monotonic() - start + delay > deadline:
+                        raise
+                    if not self.__consume_budget__():
+                        raise
+                    if on_retry is not None:
+                        on_retry(exception, attempt, delay)
+                    if metrics is not None:
+                        method = getattr(getattr(func, 'func', func), '__name__', "unknown")  # partials too
+                        metrics.inc("ezxt_retries_total", method=method, category=category)
+                        metrics.inc("ezxt_retry_wait_seconds_total", delay, method=method, category=category)
+                    time.sleep(delay)
+                    attempt += 1
+        finally:
+            self.local.depth = 0
+
+
+'''
+Metrics
+'''
+
+
+# In-memory metrics registry (counters & histograms), look at WrappedGenericExchange.metrics
+class Metrics:
+    """
+    Thread-safe in-memory counters and histograms with Prometheus text and OpenMetrics exports.
+    Any object with the same inc(name, value, **labels) and observe(name, value, **labels) methods can be used instead
+    as a backend (to forward the samples to prometheus_client or statsd for example).
+    Metrics recorded by ezxt:
+    - ezxt_method_seconds{method}: latency of the wrapper methods, retries included
+    - ezxt_method_errors_total{method, error}: errors raised by the wrapper methods
+    - ezxt_endpoint_seconds{endpoint}: latency of the ccxt requests (one per http request)
+    - ezxt_endpoint_errors_total{endpoint, error}: errors raised by the ccxt requests
+    - ezxt_retries_total{method, category}, ezxt_retry_wait_seconds_total{method, category}: retries of the retry policy
+    - ezxt_rate_limit_wait_seconds: time spent waiting in the ccxt rate limiter
+    - ezxt_cache_requests_total{cache, result}: cache hits & misses ({kind}_memory & {kind}_file with kind ohlcv,
+    funding or open_interest, trades_file, balance, account)
+    """
+    # Upper bounds of the histogram buckets in seconds
+    buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30.)
+
+    def __init__(self, buckets: (tuple, list, NoneType) = None):
+        """
+        :param buckets: upper bounds of the histogram buckets, sorted, None to use Metrics.buckets
+        """
+        if buckets is not None:
+            self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.counters = {}  # {name: {labels: value}}
+        self.histograms = {}  # {name: {labels: [count per bucket..., count above the last bucket, sum]}}
+
+    def inc(self, name: str, value: (int, float) = 1, **labels):
+        """
+        Increment a counter
+        :param name: name of the counter
+        :param value: increment
+        :param labels: labels of the sample
+        """
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            samples = self.counters.setdefault(name, {})
+            samples[key] = samples.get(key, 0) + value
+
+    def observe(self, name: str, value: (int, float), **labels):
+        """
+        Add a value to a histogram
+        :param name: name of the histogram
+        :param value: observed value, usually a duration in seconds
+        :param labels: labels of the sample
+        """
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            samples = self.histograms.setdefault(name, {})
+            sample = samples.get(key)
+            if sample is None:
+                sample = samples[key] = [0] * (len(self.buckets) + 1) + [0.]
+            sample[index] += 1
+            sample[-1] += value
+
+    def measure(self, method: str, func: callable, *args, **kwargs):
+        """
+        Call a function and record its latency & errors as the ones of a wrapper method
+        :param method: name of the method
+        :param func: function to call
+        :return: what the function returns
+        """
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except BaseException as exception:
+            self.inc("ezxt_method_errors_total", method=method, error=type(exception).__name__)
+            raise
+        finally:
+            self.observe("ezxt_method_seconds", time.perf_counter() - start, method=method)
+
+    def instrument(self, client):
+        """
+        Wrap the request() and throttle() methods of a ccxt client (once) to record the latency & errors of every
+        endpoint and the time spent in the rate limiter, clients without these methods are left untouched
+        :param client: ccxt client
+        """
+        if getattr(client, '_ezxt_metrics', None) is not None:
+            client._ezxt_metrics = self
+            return
+
+        def request(method):
+            @functools.wraps(method)
+            def wrapper(path, *args, **kwargs):
+                metrics = client._ezxt_metrics
+                api = args[0] if args else kwargs.get('api', 'public')
+                endpoint = f"{'/'.join(api) if isinstance(api, (list, tuple)) else api}/{path}"
+                start = time.perf_counter()
+                try:
+                    return method(path, *args, **kwargs)
+                except BaseException as exception:
+                    metrics.inc("ezxt_endpoint_errors_total", endpoint=endpoint, error=type(exception).__name__)
+                    raise
+                finally:
+                    metrics.observe("ezxt_endpoint_seconds", time.perf_counter() - start, endpoint=endpoint)
+
+            return wrapper
+
+        def throttle(method):
+            @functools.wraps(method)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    client._ezxt_metrics.observe("ezxt_rate_limit_wait_seconds", time.perf_counter() - start)
+
+            return wrapper
+
+        for name, wrap in (('request', request), ('throttle', throttle)):
+            if callable(getattr(client, name, None)):
+                setattr(client, name, wrap(getattr(client, name)))
+        client._ezxt_metrics = self
+
+    def get_counter(self, name: str, **labels) -> (int, float):
+        """
+        :return: value of a counter, 0 if it was never incremented
+        """
+        with self.lock:
+            return self.counters.get(name, {}).get(tuple(sorted(labels.items())), 0)
+
+    def get_histogram(self, name: str, **labels) -> dict:
+        """
+        :return: a dict with the following keys: count, sum, mean, buckets {upper bound: cumulative count}
+        """
+        with self.lock:
+            sample = list(self.histograms.get(name, {}).get(tuple(sorted(labels.items())), ()))
+        if not sample:
+            return {'count': 0, 'sum': 0., 'mean': None, 'buckets': {}}
+        count = sum(sample[:-1])
+        cumulative = list(itertools.accumulate(sample[:-1]))
+        return {'count': count, 'sum': sample[-1], 'mean': sample[-1] / count,
+                'buckets': dict(zip(self.buckets + (float("inf"),), cumulative))}
+
+    def get_hit_rate(self, cache: str) -> (float, NoneType):
+        """
+        :param cache: ohlcv_memory, ohlcv_file, funding_file, trades_file, balance... (look at the class docstring)
+        :return: hits / requests of a cache, None if it was never requested
+        """
+        hits = self.get_counter("ezxt_cache_requests_total", cache=cache, result="hit")
+        misses = self.get_counter("ezxt_cache_requests_total", cache=cache, result="miss")
+        return hits / (hits + misses) if hits + misses else None
+
+    def get_stats(self) -> dict:
+        """
+        :return: a snapshot {'counters': {name: {labels: value}}, 'histograms': {name: {labels: {count, sum, mean}}}},
+        labels formatted as 'key="value",...'
+        """
+        with self.lock:
+            counters = {name: dict(samples) for name, samples in self.counters.items()}
+            histograms = {name: {key: list(sample) for key, sample in samples.items()}
+                          for name, samples in self.histograms.items()}
+        return {'counters': {name: {self.__labels__(key): value for key, value in samples.items()}
+                             for name, samples in counters.items()},
+                'histograms': {name: {self.__labels__(key): {'count': sum(sample[:-1]), 'sum': sample[-1],
+                                                             'mean': sample[-1] / sum(sample[:-1])}
+                                      for key, sample in samples.items()}
+                               for name, samples in histograms.items()}}
+
+    def clear(self):
+        """
+        Reset every metric
+        """
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+
+    @staticmethod
+    def __labels__(key: tuple, extra: (tuple, NoneType) = None) -> str:
+        """
+        Format labels as key="value",... with the escaping of the exposition formats
+        """
+        pairs = key + extra if extra else key
+        escape = {"\\": "\\\\", "\n": "\\n", '"': '\\"'}
+        return ",".join(f'{name}="{"".join(escape.get(char, char) for char in str(value))}"' for name, value in pairs)
+
+    def __export__(self, openmetrics: bool) -> str:
+        """
+        Render every metric in the Prometheus text format (0.0.4) or in the OpenMetrics text format
+        """
+        with self.lock:
+            counters = {name: dict(samples) for name, samples in self.counters.items()}
+            histograms = {name: {key: list(sample) for key, sample in samples.items()}
+                          for name, samples in self.histograms.items()}
+        lines = []
+        for name in sorted(counters):
+            family = name[:-len("_total")] if openmetrics and name.endswith("_total") else name
+            lines.append(f"# TYPE {family} counter")
+            for key, value in counters[name].items():
+                labels = self.__labels__(key)
+                lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+        bounds = [repr(float(bound)) for bound in self.buckets] + ["+Inf"]
+        for name in sorted(histograms):
+            lines.append(f"# TYPE {name} histogram")
+            for key, sample in histograms[name].items():
+                for bound, count in zip(bounds, itertools.accumulate(sample[:-1])):
+                    lines.append(f"{name}_bucket{{{self.__labels__(key, (('le', bound),))}}} {count}")
+                labels = self.__labels__(key)
+                labels = f"{{{labels}}}" if labels else ""
+                lines.append(f"{name}_sum{labels} {sample[-1]}")
+                lines.append(f"{name}_count{labels} {sum(sample[:-1])}")
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def to_prometheus(self) -> str:
+        """
+        :return: every metric in the Prometheus text exposition format (version 0.0.4)
+        """
+        return self.__export__(openmetrics=False)
+
+    def to_openmetrics(self) -> str:
+        """
+        :return: every metric in the OpenMetrics text format (application/openmetrics-text; version=1.0.0)
+        """
+        return self.__export__(openmetrics=True)
+
+
+'''
+Progress
+'''
+
+
+# Events reported by DownloadProgress
+class ProgressEvent:
+    START = "start"  # pages to download are known
+    PAGE = "page"  # a page of candles was received
+    WAIT = "wait"  # a request waits before being retried (rate limit or transient error)
+    DONE = "done"  # every page was received
+    ERROR = "error"  # the download was stopped by an error
+
+
+# Progress of the load_ohlcv downloads
+class DownloadProgress:
+    """
+    Follow the progress of load_ohlcv downloads and report it as events to callbacks and / or a queue.
+    Events are dicts with the keys: event (look at ProgressEvent), market, timeframe, pages_done, pages_total, candles,
+    bytes (memory size of the candles received), elapsed, eta (seconds, None until a page was received), wait (delay
+    of a WAIT event), reason (error category of a WAIT event, message of an ERROR event) and message.
+    Callbacks are called from the download threads. Without callback nor queue nothing is computed (silent mode).
+    """
+
+    def __init__(self, callbacks: (list, tuple, NoneType) = None, queue=None):
+        """
+        :param callbacks: functions called with each event, TerminalProgress() to display a progress bar
+        :param queue: queue.Queue (or any object with a put method) receiving each event
+        """
+        self.callbacks = list(callbacks or [])
+        self.queue = queue
+        self.lock = threading.Lock()
+        self.market = self.timeframe = None
+        self.pages_done = self.pages_total = self.pages_resumed = self.candles = self.bytes = 0
+        self.start_time = time.monotonic()
+
+    @property
+    def silent(self) -> bool:
+        return not self.callbacks and self.queue is None
+
+    def start(self, market: str, timeframe: str, pages_total: int, pages_done: int = 0, candles: int = 0,
+              message: (str, NoneType) = None):
+        """
+        A download starts
+        :param pages_total: number of pages to download
+        :param pages_done: number of pages already downloaded (resumed from a checkpoint)
+        :param candles: number of candles already received
+        :param message: description of the download
+        """
+        with self.lock:
+            self.market, self.timeframe = market, timeframe
+            self.pages_total, self.pages_done, self.pages_resumed = pages_total, pages_done, pages_done
+            self.candles, self.bytes = candles, 0
+            self.start_time = time.monotonic()
+        self.emit(ProgressEvent.START, message=message)
+
+    def page(self, candles: int, size: int = 0):
+        """
+        A page was received
+        :param candles: number of candles of the page
+        :param size: size of the page in bytes
+        """
+        with self.lock:
+            self.pages_done += 1
+            self.candles += candles
+            self.bytes += size
+        self.emit(ProgressEvent.PAGE)
+
+    def wait(self, delay: (int, float), reason: str):
+        """
+        A request waits before being retried
+        :param delay: seconds waited
+        :param reason: error category, look at ErrorCategory
+        """
+        self.emit(ProgressEvent.WAIT, wait=delay, reason=reason)
+
+    def done(self):
+        self.emit(ProgressEvent.DONE)
+
+    def error(self, exception: BaseException):
+        self.emit(ProgressEvent.ERROR, reason=f"{type(exception).__name__}: {exception}")
+
+    def emit(self, event: str, wait: (int, float, NoneType) = None, reason: (str, NoneType) = None,
+             message: (str, NoneType) = None):
+        """
+        Report an event to the callbacks & the queue
+        """
+        if self.silent:
+            return
+        with self.lock:
+            elapsed = time.monotonic() - self.start_time
+            downloaded = self.pages_done - self.pages_resumed
+            eta = elapsed / downloaded * (self.pages_total - self.pages_done) if downloaded else None
+            data = {'event': event, 'market': self.market, 'timeframe': self.timeframe,
+                    'pages_done': self.pages_done, 'pages_total': self.pages_total, 'candles': self.candles,
+                    'bytes': self.bytes, 'elapsed': elapsed, 'eta': eta, 'wait': wait, 'reason': reason,
+                    'message': message}
+        for callback in self.callbacks:
+            callback(data)
+        if self.queue is not None:
+            self.queue.put(data)
+
+
+# Progress bar rendering the DownloadProgress events
+class TerminalProgress:
+    """
+    DownloadProgress callback printing a progress bar, redrawn at most refresh_rate times per second (the start, last
+    page and error events are always drawn)
+    """
+
+    def __init__(self, refresh_rate: (int, float) = 10, bar_length: int = 100):
+        """
+        :param refresh_rate: max number of redraws per second
+        :param bar_length: length of the progress bar
+        """
+        self.interval = 1 / refresh_rate
+        self.bar_length = bar_length
+        self.lock = threading.Lock()
+        self.last_draw = 0.
+        self.finished = False  # the bar of the current download is full
+
+    def __call__(self, event: dict):
+        kind, done, total = event['event'], event['pages_done'], event['pages_total']
+        now = time.monotonic()
+        with self.lock:
+            if kind == ProgressEvent.START:
+                print(f"{Colors.YELLOW}[DataManager] {event['message'] or 'Multithreading Download'}{Colors.END}")
+                self.finished = False
+            elif kind == ProgressEvent.ERROR:
+                print(f"\n{Colors.RED}[DataManager] Download stopped: {event['reason']}{Colors.END}")
+                return
+            elif self.finished or (kind != ProgressEvent.DONE and done < total
+                                   and now - self.last_draw < self.interval):
+                return
+            front = ""
+            if kind == ProgressEvent.WAIT:
+                front = f" {event['reason'].replace('_', ' ')} waiting for [{round(event['wait'])}s]"
+            progress_bar(done, max(total, 1), bar_length=self.bar_length, front=front)
+            self.last_draw = now
+            self.finished = done >= total
+
+
+'''
+OHLCV storage
+'''
+
+
+# Inter-process lock on a file (used by load_ohlcv)
+class FileLock:
+    """
+    Advisory lock on a lock file shared between processes, exclusive by default or shared for readers.
+    Uses fcntl.flock on POSIX and msvcrt.locking on Windows (where every lock is exclusive).
+    """
+
+    def __init__(self, path: str, shared: bool = False):
+        """
+        :param path: path of the lock file, created if it doesn't exist
+        :param shared: True for a shared (reader) lock
+        """
+        self.path = path
+        self.shared = shared
+        self.file = None
+
+    def acquire(self):
+        """
+        Block until the lock is acquired
+        """
+        self.file = open(self.path, "a+")
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        else:
+            self.file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after 10s
+                    pass
+
+    def release(self):
+        """
+        Release the lock
+        """
+        if self.file is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
+        self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+# Write a file atomically
+def atomic_to_csv(dataframe: "pd.DataFrame", path: str):
+    """
+    Write a dataframe as a csv file through a temporary file renamed once complete, readers never see a
+    half-written file
+    :param dataframe: dataframe to save
+    :param path: path of the csv file
+    """
+    temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        dataframe.to_csv(temp)
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+# Save a dataframe for memory mapped reads
+def save_shared(dataframe: "pd.DataFrame", path: str):
+    """
+    Save the columns of a dataframe as a numpy structured array (.npy), written atomically, so processes reading it
+    with load_shared() share the same pages of the OS cache instead of each holding a private copy
+    :param dataframe: dataframe to save
+    :param path: path of the .npy file
+    """
+    dtype = [(str(column), np.int64 if pd.api.types.is_integer_dtype(dataframe[column]) else np.float64)
+             for column in dataframe.columns]
+    array = np.empty(len(dataframe), dtype=dtype)
+    for column in dataframe.columns:
+        array[str(column)] = dataframe[column].to_numpy()
+    temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp, "wb") as file:
+            np.save(file, array)
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+# Load a dataframe saved by save_shared() without copying it in memory
+def load_shared(path: str) -> "pd.DataFrame":
+    """
+    Memory map a file saved by save_shared(), the dataframe is read-only (call .copy() to modify it)
+    :param path: path of the .npy file
+    :return: a read-only dataframe backed by the memory mapped file
+    """
+    array = np.load(path, mmap_mode="r")
+    return pd.DataFrame({name: array[name] for name in array.dtype.names}, copy=False)
+
+
+# In-process cache of the series loaded from the file system (used by WrappedGenericExchange.load_ohlcv)
+class OhlcvMemoryCache:
+    """
+    LRU cache of dataframes loaded from files, bounded by the memory used by the dataframes rather than by their
+    number. An entry is invalidated as soon as its file changes on disk (mtime, size or inode). Dataframes are
+    returned as shallow copies with pandas copy-on-write (pandas >= 3, or enabled on pandas 2) and as deep copies
+    otherwise: modifying them never modifies the cached dataframe.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 ** 2):
+        """
+        :param max_bytes: max memory used by the cached dataframes in bytes
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (dataframe, file signature, size in bytes)
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def __share__(dataframe: "pd.DataFrame") -> "pd.DataFrame":
+        """
+        :return: a copy of a dataframe which can be modified without modifying the dataframe, shallow with pandas
+        copy-on-write or if the dataframe is read-only (memory mapped), deep otherwise
+        """
+        if int(pd.__version__.split(".")[0]) >= 3 or pd.get_option("mode.copy_on_write") is True:
+            return dataframe.copy(deep=False)
+        if len(dataframe.columns) and not any(dataframe[column].to_numpy().flags.writeable
+                                              for column in dataframe.columns):
+            return dataframe.copy(deep=False)  # writes raise
+        return dataframe.copy()
+
+    @staticmethod
+    def __signature__(path: str) -> (tuple, NoneType):
+        """
+        :return: signature of a file, None if the file doesn't exist
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def get(self, key, path: str) -> ("pd.DataFrame", NoneType):
+        """
+        :param key: key of the series
+        :param path: file the series was loaded from
+        :return: the cached dataframe, None if it's not cached or if the file changed
+        """
+        signature = self.__signature__(path)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] != signature:
+                del self.entries[key]
+                self.size -= entry[2]
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return self.__share__(entry[0])
+
+    def put(self, key, path: str, dataframe: "pd.DataFrame"):
+        """
+        Cache a dataframe, least recently used dataframes are evicted to stay under max_bytes
+        :param key: key of the series
+        :param path: file the series was loaded from (or saved to)
+        :param dataframe: the dataframe
+        """
+        size = int(dataframe.memory_usage(index=True, deep=False).sum())
+        signature = self.__signature__(path)
+        if size > self.max_bytes or signature is None:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[2]
+            while self.entries and self.size + size > self.max_bytes:
+                _, (_, _, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+            self.entries[key] = (self.__share__(dataframe), signature, size)
+            self.size += size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def get_stats(self) -> dict:
+        """
+        :return: a dict with the following keys: hits, misses, evictions, invalidations, entries, bytes, hit_rate
+        """
+        with self.lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'invalidations': self.invalidations, 'entries': len(self.entries), 'bytes': self.size,
+                    'hit_rate': self.hits / total if total else 0.}
+
+
+# Cache shared by every wrapped client of the process
+ohlcv_cache = OhlcvMemoryCache()
+
+
+# Compressed columnar archive of a series (used by WrappedGenericExchange.archive_ohlcv)
+class OhlcvArchive:
+    """
+    Compressed archive of an OHLCV series. Rows are split in blocks, each column of a block is encoded separately:
+    - timestamps with delta-of-delta (0 for regular candles)
+    - prices & volumes as integers scaled by 10 ** decimals (the market precision), delta encoded
+    - floats which can't be scaled exactly are kept as raw float64
+    then stored in the smallest integer type and compressed with zlib. A JSON index at the end of the file keeps the
+    first & last timestamp of each block so range reads only decode the blocks they touch.
+    """
+    magic = b"EZXTOHLC"
+    version = 1
+    columns = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, path: str):
+        """
+        Open an archive written by OhlcvArchive.write()
+        :param path: path of the archive
+        """
+        self.path = path
+        with open(path, "rb") as file:
+            file.seek(-16, os.SEEK_END)
+            index_offset, magic = struct.unpack("<Q8s", file.read(16))
+            if magic != self.magic:
+                raise ValueError(f"{path} is not an EZXT archive")
+            file.seek(index_offset)
+            self.index = json.loads(zlib.decompress(file.read(os.path.getsize(path) - 16 - index_offset)))
+        self.blocks = self.index['blocks']
+        self.rows = sum(block['rows'] for block in self.blocks)
+
+    @staticmethod
+    def __detect_decimals__(values: np.ndarray, max_decimals: int = 12) -> (int, NoneType):
+        """
+        :return: the smallest number of decimals representing every value exactly, None if there is none
+        """
+        for decimals in range(max_decimals + 1):
+            scaled = np.rint(values * 10. ** decimals)
+            if np.abs(scaled).max(initial=0) < 2 ** 53 and np.array_equal(scaled / 10. ** decimals, values):
+                return decimals
+        return None
+
+    @staticmethod
+    def __pack__(values: np.ndarray, level: int) -> tuple[bytes, str]:
+        """
+        Store integers in the smallest integer type & compress them
+        """
+        dtype = np.int64
+        if len(values):
+            low, high = values.min(), values.max()
+            dtype = next(t for t in (np.int8, np.int16, np.int32, np.int64)
+                         if np.iinfo(t).min <= low and high <= np.iinfo(t).max)
+        return zlib.compress(values.astype(dtype).tobytes(), level), np.dtype(dtype).str
+
+    @classmethod
+    def __encode__(cls, column: str, values: np.ndarray, decimals: (int, NoneType), level: int) -> tuple:
+        """
+        Encode a column of a block
+        :return: (compressed bytes, metadata)
+        """
+        if column == 'timestamp':
+            values = values.astype(np.int64)
+            deltas = np.diff(values)
+            data, dtype = cls.__pack__(np.diff(deltas), level)
+            return data, {'codec': 'dod', 'first': [int(values[0]), int(deltas[0]) if len(deltas) else 0],
+                          'dtype': dtype}
+        values = values.astype(np.float64)
+        if decimals is None or not np.array_equal(np.rint(values * 10. ** decimals) / 10. ** decimals, values):
+            decimals = cls.__detect_decimals__(values)
+        if decimals is None:
+            return zlib.compress(values.tobytes(), level), {'codec': 'raw', 'dtype': '<f8'}
+        scaled = np.rint(values * 10. ** decimals).astype(np.int64)
+        data, dtype = cls.__pack__(np.diff(scaled), level)
+        return data, {'codec': 'delta', 'first': [int(scaled[0])], 'decimals': decimals, 'dtype': dtype}
+
+    @staticmethod
+    def __decode__(data: bytes, meta: dict, rows: int) -> np.ndarray:
+        """
+        Decode a column of a block
+        """
+        values = np.frombuffer(zlib.decompress(data), dtype=meta['dtype'])
+        if meta['codec'] == 'raw':
+            return values.copy()
+        if meta['codec'] == 'dod':
+            deltas = np.cumsum(np.concatenate(([meta['first'][1]], values)), dtype=np.int64)[:rows - 1]
+            return np.cumsum(np.concatenate(([meta['first'][0]], deltas)), dtype=np.int64)
+        scaled = np.cumsum(np.concatenate(([meta['first'][0]], values)), dtype=np.int64)
+        return scaled / 10. ** meta['decimals']
+
+    @classmethod
+    def write(cls, path: str, dataframe: "pd.DataFrame", price_decimals: (int, NoneType) = None,
+              volume_decimals: (int, NoneType) = None, block_size: int = 65536, level: int = 6):
+        """
+        Write a series as an archive (atomically)
+        :param path: path of the archive
+        :param dataframe: dataframe with the columns timestamp open high low close volume, sorted by timestamp
+        :param price_decimals: number of decimals of the prices (market precision), None to detect it
+        :param volume_decimals: number of decimals of the volumes (market precision), None to detect it
+        :param block_size: number of rows of a block, smaller blocks make range reads faster but compress less
+        :param level: zlib compression level
+        """
+        columns = {column: dataframe[column].to_numpy() for column in cls.columns}
+        decimals = {'open': price_decimals, 'high': price_decimals, 'low': price_decimals, 'close': price_decimals,
+                    'volume': volume_decimals, 'timestamp': None}
+        temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp, "wb") as file:
+                file.write(cls.magic + struct.pack("<I", cls.version))
+                blocks = []
+                for first in range(0, len(dataframe), block_size):
+                    block = {'rows': min(block_size, len(dataframe) - first), 'columns': {}}
+                    for column in cls.columns:
+                        values = columns[column][first:first + block_size]
+                        data, meta = cls.__encode__(column, values, decimals[column], level)
+                        meta.update({'offset': file.tell(), 'length': len(data)})
+                        file.write(data)
+                        block['columns'][column] = meta
+                    block['start'] = int(columns['timestamp'][first])
+                    block['end'] = int(columns['timestamp'][first + block['rows'] - 1])
+                    blocks.append(block)
+                index_offset = file.tell()
+                file.write(zlib.compress(json.dumps({'version': cls.version, 'blocks': blocks}).encode()))
+                file.write(struct.pack("<Q8s", index_offset, cls.magic))
+            os.replace(temp, path)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+    def read(self, since: (int, NoneType) = None, until: (int, NoneType) = None) -> "pd.DataFrame":
+        """
+        Read the archive, only the blocks overlapping the range are decoded
+        :param since: first timestamp (included), None from the beginning
+        :param until: last timestamp (excluded), None to the end
+        :return: pandas dataframe with the columns timestamp open high low close volume
+        """
+        blocks = [block for block in self.blocks
+                  if (since is None or block['end'] >= since) and (until is None or block['start'] < until)]
+        parts = {column: [] for column in self.columns}
+        with open(self.path, "rb") as file:
+            for block in blocks:
+                for column in self.columns:
+                    meta = block['columns'][column]
+                    file.seek(meta['offset'])
+                    parts[column].append(self.__decode__(file.read(meta['length']), meta, block['rows']))
+        dataframe = pd.DataFrame({column: np.concatenate(values) if values else
+                                  np.array([], dtype=np.int64 if column == 'timestamp' else np.float64)
+                                  for column, values in parts.items()})
+        if since is not None or until is not None:
+            timestamps = dataframe['timestamp']
+            mask = (timestamps >= (since if since is not None else timestamps.min())) & \
+                   (timestamps < (until if until is not None else np.iinfo(np.int64).max))
+            dataframe = dataframe[mask].reset_index(drop=True)
+        return dataframe
+
+
+# Checkpoint of a multithreading download (used by WrappedGenericExchange.__download__)
+class DownloadCheckpoint:
+    """
+    Persist the pages of a download as they complete with a manifest of the planned & pending pages, a download
+    interrupted halfway can then be resumed from the pages already saved.
+    """
+
+    def __init__(self, directory: str, key: dict):
+        """
+        :param directory: directory of the checkpoint, created if it doesn't exist
+        :param key: parameters of the download, a checkpoint made with other parameters is discarded
+        """
+        self.directory = directory
+        self.key = key
+        self.lock = threading.Lock()
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = {'key': key, 'pages': None, 'pending': None}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as file:
+                manifest = json.load(file)
+            if manifest.get('key') == key:
+                self.manifest = manifest
+            else:
+                self.clear()
+                os.makedirs(directory, exist_ok=True)
+
+    def __page_path__(self, page: (int, str)) -> str:
+        return os.path.join(self.directory, f"page_{page}.csv")
+
+    def __save_manifest__(self):
+        """
+        Write the manifest atomically (the caller holds self.lock)
+        """
+        temp = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(temp, "w") as file:
+            json.dump(self.manifest, file)
+        os.replace(temp, self.manifest_path)
+
+    def get_first_page(self) -> ("pd.DataFrame", NoneType):
+        """
+        :return: the first page of the download if it was saved
+        """
+        path = self.__page_path__("first")
+        return pd.read_csv(path, index_col=0) if os.path.exists(path) else None
+
+    def save_first_page(self, dataframe: "pd.DataFrame"):
+        atomic_to_csv(dataframe, self.__page_path__("first"))
+
+    def get_pages(self) -> (list, NoneType):
+        """
+        :return: planned pages [(since, limit), ...], None if the pages were not planned yet
+        """
+        pages = self.manifest['pages']
+        return None if pages is None else [tuple(page) for page in pages]
+
+    def save_pages(self, pages: list):
+        """
+        :param pages: planned pages [(since, limit), ...], every page is pending
+        """
+        with self.lock:
+            self.manifest['pages'] = [list(page) for page in pages]
+            self.manifest['pending'] = list(range(len(pages)))
+            self.__save_manifest__()
+
+    def get_pending(self) -> list:
+        """
+        :return: ids of the pages not downloaded yet
+        """
+        return list(self.manifest['pending'] or [])
+
+    def load_page(self, page: int) -> "pd.DataFrame":
+        return pd.read_csv(self.__page_path__(page), index_col=0)
+
+    def save_page(self, page: int, dataframe: "pd.DataFrame"):
+        """
+        Save a downloaded page and remove it from the pending pages
+        """
+        atomic_to_csv(dataframe, self.__page_path__(page))
+        with self.lock:
+            if page in self.manifest['pending']:
+                self.manifest['pending'].remove(page)
+            self.__save_manifest__()
+
+    def clear(self):
+        """
+        Delete the checkpoint once the download is complete
+        """
+        for path in glob.glob(os.path.join(glob.escape(self.directory), "*")):
+            os.remove(path)
+        if os.path.isdir(self.directory):
+            os.rmdir(self.directory)
+
+
+'''
+Trades
+'''
+
+
+# Columns of the trades dataframes returned by load_trades
+trade_columns = ['timestamp', 'id', 'price', 'amount', 'side']
+
+
+# Build ohlcv candles of any interval from trades
+def trades_to_candles(trades: "pd.DataFrame", timeframe: (str, int), fill: bool = False) -> "pd.DataFrame":
+    """
+    Aggregate trades in candles (vectorised, the trades are sorted by timestamp if they are not)
+    :param trades: dataframe with at least the columns timestamp price amount, look at load_trades
+    :param timeframe: interval of the candles, '10s', '1m', '4h'... or a number of milliseconds
+    :param fill: True to add the intervals without trades (open = high = low = close = previous close, volume = 0)
+    :return: pandas dataframe with the columns timestamp open high low close volume, timestamp is the start of the
+    interval
+    """
+    interval = timeframe if isinstance(timeframe, int) else timeframe_to_ms(timeframe)
+    columns = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+    if trades.empty:
+        return pd.DataFrame(columns=columns)
+    timestamps = trades['timestamp'].to_numpy(dtype=np.int64)
+    prices = trades['price'].to_numpy(dtype=float)
+    amounts = trades['amount'].to_numpy(dtype=float)
+    if np.any(timestamps[1:] < timestamps[:-1]):
+        order = np.argsort(timestamps, kind="stable")
+        timestamps, prices, amounts = timestamps[order], prices[order], amounts[order]
+
+    buckets = timestamps // interval * interval
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(buckets)] - 1
+    candles = {'timestamp': buckets[starts], 'open': prices[starts], 'high': np.maximum.reduceat(prices, starts),
+               'low': np.minimum.reduceat(prices, starts), 'close': prices[ends],
+               'volume': np.add.reduceat(amounts, starts)}
+    if fill:
+        slots = (candles['timestamp'] - candles['timestamp'][0]) // interval
+        count = int(slots[-1]) + 1
+        last = np.zeros(count, dtype=np.int64)
+        last[slots] = np.arange(len(slots))
+        last = np.maximum.accumulate(last)  # index of the last candle with trades at or before each slot
+        traded = np.zeros(count, dtype=bool)
+        traded[slots] = True
+        close = candles['close'][last]
+        candles = {'timestamp': candles['timestamp'][0] + np.arange(count, dtype=np.int64) * interval,
+                   'open': np.where(traded, candles['open'][last], close),
+                   'high': np.where(traded, candles['high'][last], close),
+                   'low': np.where(traded, candles['low'][last], close), 'close': close,
+                   'volume': np.where(traded, candles['volume'][last], 0.)}
+    return pd.DataFrame({column: candles[column] for column in columns})
+
+
+# Join a time series (funding rates, open interest...) to candles
+def align_to_candles(candles: "pd.DataFrame", series: "pd.DataFrame", columns: (list, NoneType) = None,
+                     tolerance: (int, NoneType) = None) -> "pd.DataFrame":
+    """
+    Add to each candle the last value of a series known at the candle timestamp (as of join, no look-ahead)
+    :param candles: dataframe with a timestamp column, look at load_ohlcv
+    :param series: dataframe with a timestamp column, look at load_funding_rates & load_open_interest
+    :param columns: columns of the series to add, None for every column but timestamp
+    :param tolerance: max age in ms of the value joined to a candle, None for no limit
+    :return: a copy of the candles with the columns of the series, empty (NaN) before the first value of the series
+    """
+    columns = [column for column in series.columns if column != 'timestamp'] if columns is None else list(columns)
+    left = candles.astype({'timestamp': np.int64})
+    right = series[['timestamp'] + columns].astype({'timestamp': np.int64}).sort_values('timestamp', kind="stable")
+    right = right.drop_duplicates(subset='timestamp', keep="last")
+    order = np.argsort(left['timestamp'].to_numpy(), kind="stable")
+    joined = pd.merge_asof(left.iloc[order], right, on='timestamp', direction="backward", tolerance=tolerance)
+    joined.index = left.index[order]
+    return joined.loc[candles.index]
+
+
+'''
+Indicators
+'''
+
+
+# Base of the indicators computed by IndicatorEngine
+class Indicator:
+    """
+    An indicator computes its values for a block of candles from the state left by the previous block, computing the
+    whole history at once or candle block by candle block gives the same values.
+    Subclasses define spec (identifies the indicator & its parameters), columns and compute().
+    """
+
+    spec = ""
+    columns = []
+
+    def compute(self, candles: dict, state: (dict, NoneType)) -> tuple:
+        """
+        :param candles: numpy arrays of the new candles by column (timestamp open high low close volume)
+        :param state: state returned for the previous candles, None for the first candles
+        :return: ({column: numpy array of the values of the new candles}, new state), the state must be json
+        serializable
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def rolling_sum(tail: list, values: "np.ndarray", window: int) -> tuple:
+        """
+        Rolling sum of values following the tail (last window - 1 values of the previous candles)
+        :return: (sums of the new values, NaN while the window isn't full, new tail)
+        """
+        values = np.concatenate([np.asarray(tail, dtype=float), values.astype(float)])
+        sums = np.cumsum(np.concatenate([[0.], values]))
+        result = np.full(len(values), np.nan)
+        result[window - 1:] = sums[window:] - sums[:-window]
+        return result[len(tail):], values[-(window - 1):].tolist() if window > 1 else []
+
+    @staticmethod
+    def smooth(last: (float, NoneType), values: "np.ndarray", alpha: float) -> "np.ndarray":
+        """
+        Exponential smoothing y = alpha * x + (1 - alpha) * y[-1] following the last smoothed value, the first value
+        seeds the smoothing when there is none
+        """
+        if last is None:
+            return pd.Series(values, dtype=float).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+        series = pd.Series(np.concatenate([[last], values.astype(float)]))
+        return series.ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:]
+
+
+# Simple moving average
+class SMA(Indicator):
+
+    def __init__(self, window: int, column: str = "close", name: (str, NoneType) = None):
+        """
+        :param window: number of candles
+        :param column: averaged column
+        :param name: name of the output column, None for sma_{window}
+        """
+        self.window = window
+        self.column = column
+        self.spec = f"sma({column},{window})"
+        self.columns = [f"sma_{window}" if name is None else name]
+
+    def compute(self, candles: dict, state: (dict, NoneType)) -> tuple:
+        sums, tail = self.rolling_sum([] if state is None else state['tail'], candles[self.column], self.window)
+        return {self.columns[0]: sums / self.window}, {'tail': tail}
+
+
+# Exponential moving average
+class EMA(Indicator):
+
+    def __init__(self, window: int, column: str = "close", name: (str, NoneType) = None):
+        """
+        :param window: span of the average, alpha = 2 / (window + 1), seeded with the first value
+        :param column: averaged column
+        :param name: name of the output column, None for ema_{window}
+        """
+        self.window = window
+        self.column = column
+        self.spec = f"ema({column},{window})"
+        self.columns = [f"ema_{window}" if name is None else name]
+
+    def compute(self, candles: dict, state: (dict, NoneType)) -> tuple:
+        values = self.smooth(None if state is None else state['last'], candles[self.column], 2 / (self.window + 1))
+        return {self.columns[0]: values}, {'last': float(values[-1])}
+
+
+# Average true range
+class ATR(Indicator):
+
+    def __init__(self, window: int = 14, name: (str, NoneType) = None):
+        """
+        :param window: number of candles of Wilder's smoothing (alpha = 1 / window), seeded with the first true range
+        :param name: name of the output column, None for atr_{window}
+        """
+        self.window = window
+        self.spec = f"atr({window})"
+        self.columns = [f"atr_{window}" if name is None else name]
+
+    def compute(self, candles: dict, state: (dict, NoneType)) -> tuple:
+        high, low, close = (candles[column].astype(float) for column in ('high', 'low', 'close'))
+        previous = np.concatenate([[np.nan if state is None else state['close']], close[:-1]])
+        true_range = np.fmax(high - low, np.fmax(np.abs(high - previous), np.abs(low - previous)))
+        values = self.smooth(None if state is None else state['last'], true_range, 1 / self.window)
+        return {self.columns[0]: values}, {'close': float(close[-1]), 'last': float(values[-1])}
+
+
+# Volume weighted average price
+class VWAP(Indicator):
+
+    def __init__(self, window: (int, NoneType) = None, name: (str, NoneType) = None):
+        """
+        :param window: number of candles, None for the vwap since the first candle
+        :param name: name of the output column, None for vwap or vwap_{window}
+        """
+        self.window = window
+        self.spec = f"vwap({window})"
+        self.columns = [("vwap" if window is None else f"vwap_{window}") if name is None else name]
+
+    def compute(self, candles: dict, state: (dict, NoneType)) -> tuple:
+        volume = candles['volume'].astype(float)
+        price_volume = (candles['high'] + candles['low'] + candles['close']) / 3 * volume
+        if self.window is None:
+            state = {'price_volume': 0., 'volume': 0.} if state is None else state
+            price_volume = state['price_volume'] + np.cumsum(price_volume)
+            volume = state['volume'] + np.cumsum(volume)
+            state = {'price_volume': float(price_volume[-1]), 'volume': float(volume[-1])}
+        else:
+            state = {'price_volume': [], 'volume': []} if state is None else state
+            price_volume, price_volume_tail = self.rolling_sum(state['price_volume'], price_volume, self.window)
+            volume, volume_tail = self.rolling_sum(state['volume'], volume, self.window)
+            state = {'price_volume': price_volume_tail, 'volume': volume_tail}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return {self.columns[0]: price_volume / volume}, state
+
+
+# Returns
+class Returns(Indicator):
+
+    def __init__(self, periods: int = 1, log: bool = False, column: str = "close", name: (str, NoneType) = None):
+        """
+        :param periods: number of candles of a return
+        :param log: True for log returns, False for simple returns
+        :param column: column of the prices
+        :param name: name of the output column, None for return_{periods} or log_return_{periods}
+        """
+        self.periods = periods
+        self.log = log
+        self.column = column
+        self.spec = f"returns({column},{periods},{log})"
+        self.columns = [(f"log_return_{periods}" if log else f"return_{periods}") if name is None else name]
+
+    def compute(self, candles: dict, state: (dict, NoneType)) -> tuple:
+        tail = [] if state is None else state['tail']
+        values = np.concatenate([np.asarray(tail, dtype=float), candles[self.column].astype(float)])
+        result = np.full(len(values), np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = values[self.periods:] / values[:-self.periods]
+            result[self.periods:] = np.log(ratio) if self.log else ratio - 1
+        return {self.columns[0]: result[len(tail):]}, {'tail': values[-self.periods:].tolist()}
+
+
+# Indicators of a series updated with its new candles only
+class IndicatorEngine:
+    """
+    Compute indicators over the history of a series once, then only over the candles appended to it (by
+    load_ohlcv(limit=-1) or a live feed). Values are kept in growing numpy buffers, and if a path is given they are
+    appended to a binary file with the states of the indicators in a json file, a restart loads them instead of
+    computing the history again.
+    """
+
+    def __init__(self, indicators: list, path: (str, NoneType) = None):
+        """
+        :param indicators: Indicator instances (SMA, EMA, ATR, VWAP, Returns or subclasses of Indicator)
+        :param path: path of the saved values without extension (.values & .json files), None to keep them in memory
+        """
+        self.indicators = list(indicators)
+        self.path = path
+        self.lock = threading.Lock()
+        self.columns = [column for indicator in self.indicators for column in indicator.columns]
+        if len(set(self.columns)) != len(self.columns):
+            raise ValueError(f"Indicators have the same column names: {self.columns}")
+        self.dtype = np.dtype([('timestamp', np.int64)] + [(column, np.float64) for column in self.columns])
+        self.specs = [indicator.spec for indicator in self.indicators]
+        self.values = np.empty(0, dtype=self.dtype)  # values of the candles, the first self.rows rows are used
+        self.rows = 0
+        self.states = [None] * len(self.indicators)  # state of each indicator after the last computed candle
+        if path is not None:
+            self.__load__()
+
+    def reset(self):
+        """
+        Forget every value, the next update computes the whole history
+        """
+        self.values = np.empty(0, dtype=self.dtype)
+        self.rows = 0
+        self.states = [None] * len(self.indicators)
+        if self.path is not None:
+            for extension in (".json", ".values"):
+                if os.path.exists(self.path + extension):
+                    os.remove(self.path + extension)
+
+    # Compute the indicators of the candles of a series not computed yet
+    def update(self, candles: "pd.DataFrame") -> "pd.DataFrame":
+        """
+        :param candles: the whole series (look at load_ohlcv), only the candles after the last computed one are
+        computed, if the series doesn't contain the last computed candle the whole series is computed again
+        :return: indicator values of the series, look at get_frame
+        """
+        with self.lock:
+            timestamps = candles['timestamp'].to_numpy(dtype=np.int64)
+            start = 0
+            if self.rows:
+                last = int(self.values['timestamp'][self.rows - 1])
+                start = int(np.searchsorted(timestamps, last, side="right"))
+                if start == 0 or timestamps[start - 1] != last or start != self.rows:  # another series
+                    self.reset()
+                    start = 0
+            if start < len(candles):
+                self.__append__(candles.iloc[start:])
+            return self.__frame__()
+
+    # Compute the indicators of new candles (live feed)
+    def append(self, candles: "pd.DataFrame") -> "pd.DataFrame":
+        """
+        :param candles: candles following the last computed one, older candles are ignored
+        :return: indicator values of the series, look at get_frame
+        """
+        with self.lock:
+            if self.rows:
+                candles = candles[candles['timestamp'] > self.values['timestamp'][self.rows - 1]]
+            if len(candles):
+                self.__append__(candles)
+            return self.__frame__()
+
+    def get_frame(self) -> "pd.DataFrame":
+        """
+        :return: pandas dataframe with a timestamp column and one column per indicator value, indexed from 0 like the
+        series, its columns are read-only views of the buffers
+        """
+        with self.lock:
+            return self.__frame__()
+
+    def __frame__(self) -> "pd.DataFrame":
+        values = self.values[:self.rows]
+        return pd.DataFrame({name: values[name] for name in self.dtype.names}, copy=False)
+
+    def __append__(self, candles: "pd.DataFrame"):
+        """
+        Compute the indicators of new candles, store their values and save them (the caller holds self.lock)
+        """
+        arrays = {column: candles[column].to_numpy() for column in candles.columns}
+        block = np.empty(len(candles), dtype=self.dtype)
+        block['timestamp'] = arrays['timestamp']
+        for i, indicator in enumerate(self.indicators):
+            values, self.states[i] = indicator.compute(arrays, self.states[i])
+            for column in indicator.columns:
+                block[column] = values[column]
+
+        if self.rows + len(block) > len(self.values):  # buffers grow by doubling, an append copies O(new) values
+            values = np.empty(max(2 * len(self.values), self.rows + len(block), 1024), dtype=self.dtype)
+            values[:self.rows] = self.values[:self.rows]
+            self.values = values
+        self.values[self.rows:self.rows + len(block)] = block
+        self.rows += len(block)
+
+        if self.path is not None:
+            self.__save__(block)
+
+    def __save__(self, block: "np.ndarray"):
+        """
+        Append the new values to the values file then write the states, a file with more values than the states
+        count (interrupted save) is truncated on load
+        """
+        mode = "r+b" if os.path.exists(self.path + ".values") else "wb"
+        with open(self.path + ".values", mode) as file:
+            file.seek((self.rows - len(block)) * self.dtype.itemsize)
+            file.write(block.tobytes())
+            file.truncate()
+        temp = f"{self.path}.json.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp, "w") as file:
+            json.dump({'specs': self.specs, 'columns': self.columns, 'rows': self.rows, 'states': self.states}, file)
+        os.replace(temp, self.path + ".json")
+
+    def __load__(self):
+        """
+        Load the saved values & states, they are ignored if they were saved by other indicators
+        """
+        if not os.path.exists(self.path + ".json") or not os.path.exists(self.path + ".values"):
+            return
+        with open(self.path + ".json") as file:
+            saved = json.load(file)
+        if saved['specs'] != self.specs or saved['columns'] != self.columns:
+            return
+        values = np.fromfile(self.path + ".values", dtype=self.dtype, count=-1)
+        if len(values) < saved['rows']:
+            return
+        self.values = values[:saved['rows']].copy()
+        self.rows = saved['rows']
+        self.states = saved['states']
+
+
+'''
+Backfill queue
+'''
+
+
+# States of a backfill work unit
+class UnitState:
+    PENDING = "pending"  # waiting for a worker
+    LEASED = "leased"  # downloaded by a worker until its lease expires
+    DONE = "done"  # saved to the common store
+    FAILED = "failed"  # gave up after max_attempts
+
+
+# Work queue shared by the backfill workers of every node
+class BackfillQueue:
+    """
+    Work queue of a backfill stored in a SQLite database shared by the workers (on a shared volume for several
+    nodes). Jobs (market, timeframe, range) are split in units of unit_candles candles, workers lease units,
+    download them with WrappedGenericExchange.backfill() and mark them done. A unit whose lease expired (crashed
+    worker) is leased again by the next worker.
+    """
+
+    def __init__(self, path: str = "data/backfill.sqlite", lease: float = 300., max_attempts: int = 5,
+                 journal_mode: str = "DELETE"):
+        """
+        :param path: path of the SQLite file
+        :param lease: seconds a worker keeps a unit without renewing its lease
+        :param max_attempts: leases of a unit before it is marked failed
+        :param journal_mode: SQLite journal mode, keep "DELETE" on network volumes (WAL needs shared memory and only
+        works when every worker runs on the same host)
+        """
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=60)
+        self.connection.executescript(f"""
+            PRAGMA journal_mode={journal_mode};
+            CREATE TABLE IF NOT EXISTS units (
+                unit_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                market TEXT NOT NULL,
+                timeframe TEXT NOT NULL,
+                since INTEGER NOT NULL,
+                until INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                candles INTEGER,
+                error TEXT,
+                updated REAL NOT NULL,
+                UNIQUE (market, timeframe, since, until)
+            );
+            CREATE INDEX IF NOT EXISTS units_status ON units (status, lease_until);
+            CREATE INDEX IF NOT EXISTS units_series ON units (market, timeframe, since);
+        """)
+
+    # Split jobs in work units
+    def add_jobs(self, markets: (str, list, tuple), timeframes: (str, list, tuple), since: int,
+                 until: (int, NoneType) = None, unit_candles: int = 10000) -> int:
+        """
+        Add the units of every market x timeframe, adding a job twice adds nothing, adding it again with a later until
+        adds the missing units
+        :param markets: example "BTC/USD" or a list of markets
+        :param timeframes: usually '1m', '1h', '1d'... or a list of timeframes
+        :param since: first candle timestamp
+        :param until: timestamp after the last candle (excluded), None for now
+        :param unit_candles: candles of a unit, a unit is downloaded by one worker in several pages
+        :return: number of units added
+        """
+        markets = [markets] if isinstance(markets, str) else list(markets)
+        timeframes = [timeframes] if isinstance(timeframes, str) else list(timeframes)
+        until = int(time.time() * 1000) if until is None else until
+        now = time.time()
+        rows = []
+        for market in markets:
+            for timeframe in timeframes:
+                span = timeframe_to_ms(timeframe) * unit_candles
+                for start in range(since, until, span):
+                    rows.append((market, timeframe, start, min(start + span, until), UnitState.PENDING, now))
+        with self.lock:
+            before = self.connection.total_changes
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.executemany("INSERT OR IGNORE INTO units (market, timeframe, since, until, status, "
+                                            "updated) VALUES (?, ?, ?, ?, ?, ?)", rows)
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            return self.connection.total_changes - before
+
+    # Lease units to a worker
+    def lease_units(self, worker: str, count: int = 1) -> list:
+        """
+        Lease pending units and units whose lease expired, atomically for every worker of every node
+        :param worker: id of the worker
+        :param count: max number of units to lease
+        :return: leased units as dicts with the keys unit_id market timeframe since until attempts, empty when there
+        is nothing left to lease
+        """
+        now = time.time()
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")  # one worker leases at a time
+            try:
+                rows = self.connection.execute(
+                    "SELECT unit_id, market, timeframe, since, until, attempts FROM units WHERE status = ? OR "
+                    "(status = ? AND lease_until < ?) ORDER BY unit_id LIMIT ?",
+                    (UnitState.PENDING, UnitState.LEASED, now, count)).fetchall()
+                units = []
+                for unit_id, market, timeframe, since, until, attempts in rows:
+                    if attempts >= self.max_attempts:  # leased again and again, the worker crashes on this unit
+                        self.connection.execute("UPDATE units SET status = ?, worker = NULL, updated = ? "
+                                                "WHERE unit_id = ?", (UnitState.FAILED, now, unit_id))
+                        continue
+                    self.connection.execute("UPDATE units SET status = ?, worker = ?, lease_until = ?, "
+                                            "attempts = attempts + 1, updated = ? WHERE unit_id = ?",
+                                            (UnitState.LEASED, worker, now + self.lease, now, unit_id))
+                    units.append({'unit_id': unit_id, 'market': market, 'timeframe': timeframe, 'since': since,
+                                  'until': until, 'attempts': attempts + 1})
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        return units
+
+    # Extend the lease of a unit
+    def renew(self, unit_id: int, worker: str) -> bool:
+        """
+        :param unit_id: id of the unit
+        :param worker: id of the worker holding the lease
+        :return: False if the worker lost the lease (it expired and the unit was leased again)
+        """
+        return self.__update__("lease_until = ?", (time.time() + self.lease,), unit_id, worker)
+
+    # Mark a unit done
+    def complete(self, unit_id: int, worker: str, candles: int) -> bool:
+        """
+        :param unit_id: id of the unit
+        :param worker: id of the worker holding the lease
+        :param candles: number of candles saved
+        :return: False if the worker lost the lease, the new holder completes the unit
+        """
+        return self.__update__("status = ?, candles = ?, error = NULL, lease_until = NULL",
+                               (UnitState.DONE, candles), unit_id, worker)
+
+    # Give a unit back to the queue
+    def fail(self, unit_id: int, worker: str, error: str) -> bool:
+        """
+        The unit is leased again by the next worker, or marked failed after max_attempts
+        :param unit_id: id of the unit
+        :param worker: id of the worker holding the lease
+        :param error: description of the error
+        :return: False if the worker lost the lease
+        """
+        return self.__update__("status = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = ?, lease_until = NULL",
+                               (self.max_attempts, UnitState.FAILED, UnitState.PENDING, error), unit_id, worker)
+
+    # Retry the failed units
+    def reset_failed(self) -> int:
+        """
+        :return: number of failed units set back to pending
+        """
+        with self.lock:
+            return self.connection.execute("UPDATE units SET status = ?, attempts = 0, updated = ? WHERE status = ?",
+                                           (UnitState.PENDING, time.time(), UnitState.FAILED)).rowcount
+
+    # Query units
+    def get_units(self, market: (str, NoneType) = None, timeframe: (str, NoneType) = None,
+                  status: (str, NoneType) = None) -> list:
+        """
+        :param market: example "BTC/USD", None for every market
+        :param timeframe: usually '1m', '1h', '1d'... None for every timeframe
+        :param status: look at UnitState, None for every status
+        :return: units as dicts sorted by market, timeframe & since
+        """
+        conditions, values = [], []
+        for column, value in (('market', market), ('timeframe', timeframe), ('status', status)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        query = " WHERE " + " AND ".join(conditions) if conditions else ""
+        columns = ['unit_id', 'market', 'timeframe', 'since', 'until', 'status', 'worker', 'lease_until', 'attempts',
+                   'candles', 'error', 'updated']
+        with self.lock:
+            rows = self.connection.execute(f"SELECT {', '.join(columns)} FROM units{query} "
+                                           f"ORDER BY market, timeframe, since", values).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+    # Progress of the backfill
+    def get_stats(self) -> dict:
+        """
+        :return: number of units by state, expired leases are counted as pending
+        """
+        stats = {state: 0 for state in (UnitState.PENDING, UnitState.LEASED, UnitState.DONE, UnitState.FAILED)}
+        with self.lock:
+            rows = self.connection.execute("SELECT CASE WHEN status = ? AND lease_until < ? THEN ? ELSE status END, "
+                                           "COUNT(*) FROM units GROUP BY 1",
+                                           (UnitState.LEASED, time.time(), UnitState.PENDING)).fetchall()
+        stats.update(dict(rows))
+        return stats
+
+    def __update__(self, assignments: str, values: tuple, unit_id: int, worker: str) -> bool:
+        """
+        Update a unit only if the worker still holds its lease
+        """
+        with self.lock:
+            return self.connection.execute(f"UPDATE units SET {assignments}, updated = ? WHERE unit_id = ? AND "
+                                           f"worker = ? AND status = ?",
+                                           values + (time.time(), unit_id, worker, UnitState.LEASED)).rowcount == 1
+
+    def close(self):
+        """
+        Close the SQLite connection
+        """
+        with self.lock:
+            self.connection.close()
+
+
+'''
+Core
+'''
+
+
+# Template class representing a wrapped exchange
+class WrappedGenericExchange:
+
+    def __init__(self, exchange):
+        """
+        Template class representing a wrapped exchange
+        :param exchange: a ccxt exchange ( a class not an object ), ccxt.ftx for example.
+        """
+        # check if there is a custom class for the exchange
+        name = exchange.__name__.lower()
+        if name in customs and self.__class__.__name__ == WrappedGenericExchange.__name__:
+            print(f"{Colors.YELLOW} Warning {name} has a custom class provided by EZXT, please use {customs[name]} "
+                  f"class instead of WrappedGenericExchange if you don't want to encouter some unexpected issues")
+
+        self.exchange = exchange  # Look at the method docstring
+        self.client = exchange({'enableRateLimit': True})  # Store the instanced client
+        self.ClientState = ClientState.NOT_AUTHENTICATED  # Store the client state
+        self.journal = None  # Order journal, look at enable_order_journal()
+        self.retry_policy = RetryPolicy()  # Retry & backoff of the requests, None to disable retries
+        self.memory_cache = ohlcv_cache  # In-process cache of the saved series, None to disable it
+        self.rounding_table = None  # Precision & limits of every market, look at get_market_rules()
+        self.validator = OrderValidator()  # Pre-trade validation, look at enable_order_validation()
+        self.balance_cache = None  # Last free balances received {token: amount}
+        self.balance_cache_time = 0.  # When balance_cache was received
+        self.metrics = Metrics()  # Latency, errors, retries & cache metrics, None to disable them, look at Metrics
+        self.indicator_engines = {}  # IndicatorEngine of each load_indicators() call
+        # Max number of values per request of each series loaded by __load_series__, None for the exchange default
+        self.page_limits = {'ohlcv': None, 'funding': 1000, 'open_interest': 500}
+
+    # Order journal
+
+    @only_implemented_types
+    def enable_order_journal(self, path: str = "data/orders.sqlite"):
+        """
+        Enable the local order journal, every order posted, cancelled or fetched by the wrapper will be recorded and
+        can then be queried locally with get_journal_orders() and get_journal_fills()
+        :param path: path of the SQLite file, ":memory:" to keep the journal in memory only
+        """
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.journal = OrderJournal(path)
+
+    @only_implemented_types
+    def get_journal_orders(self, market: (str, NoneType) = None, status: (str, NoneType) = None,
+                           since: (int, NoneType) = None, until: (int, NoneType) = None) -> list:
+        """
+        Return orders from the local journal without any request
+        :param market: example "BTC/USD", None for every market
+        :param status: "open", "closed", "canceled"... None for every status
+        :param since: first order timestamp
+        :param until: last order timestamp (excluded)
+        :return: orders
+        """
+        if self.journal is None:
+            return []
+        return self.journal.get_orders(market=market, status=status, since=since, until=until)
+
+    @only_implemented_types
+    def get_journal_fills(self, order_id: (str, NoneType) = None, market: (str, NoneType) = None,
+                          since: (int, NoneType) = None, until: (int, NoneType) = None) -> list:
+        """
+        Return fills from the local journal without any request
+        :param order_id: order id, None for every order
+        :param market: example "BTC/USD", None for every market
+        :param since: first fill timestamp
+        :param until: last fill timestamp (excluded)
+        :return: fills
+        """
+        if self.journal is None:
+            return []
+        return self.journal.get_fills(order_id=order_id, market=market, since=since, until=until)
+
+    # Pre-trade validation
+
+    @only_implemented_types
+    def enable_order_validation(self, enabled: bool = True, strict_precision: bool = False,
+                                balance_ttl: (int, float) = 10):
+        """
+        Configure the pre-trade validation run by post_*_order() methods before any request
+        :param enabled: False to send orders without any local check
+        :param strict_precision: True to reject sizes & prices which are not a multiple of the market steps instead
+        of letting ccxt round them
+        :param balance_ttl: max age in seconds of the cached balance used to check the order, 0 to disable the
+        balance check
+        """
+        self.validator = OrderValidator(strict_precision, balance_ttl) if enabled else None
+
+    @only_implemented_types
+    def validate_order(self, market: str, side: str, order_type: str, size: (float, int),
+                       price: (float, int, NoneType) = None, params: (dict, NoneType) = None) -> list:
+        """
+        Check an order locally from cached market data & balances, no request is made once markets are loaded
+        :param market: example "BTC/USD"
+        :param side: "buy" or "sell"
+        :param order_type: "market", "limit", "stop" or "takeProfit"
+        :param size: the size of the order
+        :param price: the price of the order, None for market orders
+        :param params: additional parameters
+        :return: a list of OrderError, empty if the order is valid
+        """
+        validator = self.validator if self.validator is not None else OrderValidator()
+        try:
+            rules = self.get_market_rules(market)
+        except (KeyError, ccxt.BadSymbol):
+            rules = None
+        balance = None
+        if self.balance_cache is not None and time.time() - self.balance_cache_time < validator.balance_ttl:
+            balance = self.balance_cache
+        self.__count_cache__("balance", balance is not None)
+        return validator.validate(rules, side, order_type, size, price, self.client.has, balance, params)
+
+    def __check_order__(self, market: str, side: str, order_type: str, size: (float, int),
+                        price: (float, int, NoneType), params: dict):
+        """
+        Raise OrderValidationError if the order is rejected by the pre-trade validation
+        """
+        if self.validator is None:
+            return
+        errors = self.validate_order(market, side, order_type, size, price, params)
+        if errors:
+            raise OrderValidationError(errors)
+
+    def __cache_balance__(self, balances: dict):
+        """
+        Keep the free balances of a fetch_balance response for the pre-trade validation
+        """
+        free = balances.get('free')
+        if isinstance(free, dict):
+            self.balance_cache = {token: float(amount or 0) for token, amount in free.items()}
+            self.balance_cache_time = time.time()
+
+    def __count_cache__(self, cache: str, hit: bool):
+        """
+        Count a hit or a miss of a cache in the metrics
+        """
+        if self.metrics is not None:
+            self.metrics.inc("ezxt_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+    # Overrideable
+    def __on_order_sent__(self):
+        """
+        Called each time an order is sent or cancelled, drop cached account state changed by our own orders
+        """
+        self.balance_cache = None
+
+    # Overrideable
+    @only_implemented_types
+    def authenticate_client(self, api_key: str, api_secret: str,
+                            enable_rate_limit: bool = True):
+        """
+        Instantiate ccxt client
+        :param api_key: api key in your cex settings
+        :param api_secret: api secret in your cex settings
+        :param enable_rate_limit: True to activate the control of the ratelimit
+        """
+
+        self.client = self.exchange({
+            'apiKey': api_key,
+            'secret': api_secret,
+            'enableRateLimit': enable_rate_limit
+        })
+        self.ClientState = ClientState.AUTHENTICATED
+
+    # Public API
+
+    @retry_request
+    @load_markets
+    @only_implemented_types
+    def get_bid(self, market: str, params: (dict, NoneType) = None) -> int:
+        """
+        Return bid price of a market
+        :param market: Example: "BTC/USD"
+        :param params: Additional parameters
+        :return: bid price
+        """
+        if params is None:
+            params = {}
+        return int(self.client.fetch_ticker(market, params=params)["bid"])
+
+    @retry_request
+    @load_markets
+    @only_implemented_types
+    def get_ask(self, market: str, params: (dict, NoneType) = None) -> int:
+        """
+        Return ask price of a market
+        :param market: example: "BTC/USD"
+        :param params: additional parameters
+        :return: ask price
+        """
+        if params is None:
+            params = {}
+        return int(self.client.fetch_ticker(market, params=params)["ask"])
+
+    @retry_request
+    @load_markets
+    @only_implemented_types
+    def get_tickers(self, markets: (list, tuple, NoneType) = None, params: (dict, NoneType) = None,
+                    max_workers: int = 20) -> dict:
+        """
+        Return the tickers of several markets, with one request when the exchange supports it, with concurrent
+        requests otherwise
+        :param markets: list of markets, example ["BTC/USD", "ETH/USD"], None for every market (needs fetchTickers)
+        :param params: additional parameters
+        :param max_workers: max number of requests sent at the same time when the exchange can't batch them
+        :return: a dict {market: ccxt ticker}
+        """
+        if params is None:
+            params = {}
+        if self.client.has.get('fetchTickers') or markets is None:
+            tickers = self.client.fetch_tickers(None if markets is None else list(markets), params=params)
+            return tickers if markets is None else {market: tickers[market] for market in markets if market in tickers}
+
+        tickers = {}
+
+        def fetch(_market):
+            tickers[_market] = self.client.fetch_ticker(_market, params=params)
+
+        markets = list(markets)
+        for i in range(0, len(markets), max_workers):
+            threads = [threading.Thread(target=fetch, args=(market,)) for market in markets[i:i + max_workers]]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        missing = [market for market in markets if market not in tickers]
+        if missing:  # a thread failed, the error is raised by a direct request so the retry policy can handle it
+            tickers.update({market: self.client.fetch_ticker(market, params=params) for market in missing})
+        return {market: tickers[market] for market in markets}
+
+    @retry_request
+    @load_markets
+    @only_implemented_types
+    def get_funding_rates(self, market: str, since: (int, NoneType) = None, limit: (int, NoneType) = None,
+                          params: (dict, NoneType) = None) -> "pd.DataFrame":
+        """
+        Download the funding rate history of a perpetual market
+        :param market: example "BTC/USDT:USDT" (or "BTC-PERP" on ftx)
+        :param since: timestamp of the first funding, None for the last ones
+        :param limit: max number of fundings, None for the exchange default
+        :param params: additional parameters
+        :return: pandas dataframe with the columns timestamp funding_rate
+        """
+        if params is None:
+            params = {}
+        history = self.client.fetch_funding_rate_history(market, since=since, limit=limit, params=params)
+        return pd.DataFrame([[entry['timestamp'], entry['fundingRate']] for entry in history],
+                            columns=['timestamp', 'funding_rate'])
+
+    @retry_request
+    @load_markets
+    @only_implemented_types
+    def get_open_interest(self, market: str, timeframe: str, since: (int, NoneType) = None,
+                          limit: (int, NoneType) = None, params: (dict, NoneType) = None) -> "pd.DataFrame":
+        """
+        Download the open interest history of a futures market
+        :param market: example "BTC/USDT:USDT"
+        :param timeframe: interval of the history, usually '5m', '1h', '1d'...
+        :param since: timestamp of the first value, None for the last ones
+        :param limit: max number of values, None for the exchange default
+        :param params: additional parameters
+        :return: pandas dataframe with the columns timestamp open_interest (in contracts or base currency)
+        open_interest_value (in quote currency), a column is empty when the exchange doesn't provide it
+        """
+        if params is None:
+            params = {}
+        history = self.client.fetch_open_interest_history(market, timeframe, since=since, limit=limit, params=params)
+        return pd.DataFrame([[entry['timestamp'], entry.get('openInterestAmount'), entry.get('openInterestValue')]
+                             for entry in history], columns=['timestamp', 'open_interest', 'open_interest_value'])
+
+    @retry_request
+    @load_markets
+    @only_implemented_types
+    def get_trades(self, market: str, since: (int, NoneType) = None, limit: (int, NoneType) = None,
+                   params: (dict, NoneType) = None) -> list:
+        """
+        Download the public trades of a market
+        :param market: example "BTC/USD"
+        :param since: timestamp of the first trade, None for the last trades
+        :param limit: max number of trades, None for the exchange default
+        :param params: additional parameters
+        :return: list of ccxt trades (dicts with the keys id timestamp price amount side...)
+        """
+        if params is None:
+            params = {}
+        return self.client.fetch_trades(market, since=since, limit=limit, params=params)
+
+    @retry_request
+    @only_implemented_types
+    def get_kline(self, market: str, timeframe: str, since: (str, int, NoneType), limit: (int, NoneType),
+                  params: (dict, NoneType) = None) -> "pd.DataFrame":
+        """
+        Download kline for a market
+        :param market: example "ETH/USD"
+        :param timeframe: usually '1y', '1m', '1d', '1w', '1h'...
+        :param since: first candle to download timestamp
+        :param limit: number of candles
+        :param params: additional parameters
+        :return: pandas dataframe
+        """
+        if params is None:
+            params = {}
+        kline = self.client.fetch_ohlcv(market, timeframe, since=since, limit=limit, params=params)
+        dataframe = pd.DataFrame(kline)
+        if dataframe.empty:
+            return dataframe
+        dataframe.rename(columns={0: 'timestamp', 1: 'open', 2: 'high', 3: 'low', 4: 'close', 5: 'volume'},
+                         inplace=True)
+        return dataframe
+
+    @only_implemented_types
+    def get_market(self, market: str) -> dict:
+        """
+        Get some market information
+        :param market: example "ETH/USD"
+        :return:
+        """
+        return self.client.market(market)
+
+    @only_implemented_types
+    def get_precision(self, market: str, params: (dict, NoneType) = None) -> tuple[float, float]:
+        """
+        Get the precision of a market and the minimal size
+        :param market: example "ETH/USD"
+        :param params: additional parameters
+        :return: (market precision, minimal size)
+        """
+        if params is None:
+            params = {}
+        rules = self.get_market_rules(market)
+        return rules.amount_precision, rules.amount_min
+
+    def get_market_rules(self, market: str) -> MarketRules:
+        """
+        Get the precomputed precision & limits of a market, the table is built once when markets are loaded
+        :param market: example "ETH/USD"
+        :return: MarketRules of the market
+        """
+        table = self.rounding_table
+        if table is None or table.markets is not self.client.markets or market not in table:
+            self.client.load_markets()
+            if table is None or table.markets is not self.client.markets:
+                table = self.rounding_table = RoundingTable(self.client.markets, self.client.precisionMode)
+        return table[market]
+
+    def round_amount(self, market: str, amount: (float, int), rounding: str = "down") -> float:
+        """
+        Round an amount to the amount step of a market (exact, whatever the precision mode of the exchange)
+        :param market: example "ETH/USD"
+        :param amount: amount to round
+        :param rounding: "down" (toward zero, default), "up", "floor", "ceil" or "nearest"
+        :return: rounded amount
+        """
+        return self.get_market_rules(market).round_amount(amount, rounding)
+
+    def round_price(self, market: str, price: (float, int), rounding: str = "nearest") -> float:
+        """
+        Round a price to the price tick of a market (exact, whatever the precision mode of the exchange)
+        :param market: example "ETH/USD"
+        :param price: price to round
+        :param rounding: "nearest" (default), "down", "up", "floor" or "ceil"
+        :return: rounded price
+        """
+        return self.get_market_rules(market).round_price(price, rounding)
+
+    def round_amounts(self, markets: list, amounts, rounding: str = "down") -> np.ndarray:
+        """
+        Batch version of round_amount()
+        :param markets: list of markets
+        :param amounts: list or array of amounts
+        :param rounding: "down" (toward zero, default), "up", "floor", "ceil" or "nearest"
+        :return: rounded amounts as a numpy array
+        """
+        for market in set(markets):
+            self.get_market_rules(market)
+        return self.rounding_table.round_amounts(markets, amounts, rounding)
+
+    def round_prices(self, markets: list, prices, rounding: str = "nearest") -> np.ndarray:
+        """
+        Batch version of round_price()
+        :param markets: list of markets
+        :param prices: list or array of prices
+        :param rounding: "nearest" (default), "down", "up", "floor" or "ceil"
+        :return: rounded prices as a numpy array
+        """
+        for market in set(markets):
+            self.get_market_rules(market)
+        return self.rounding_table.round_prices(markets, prices, rounding)
+
+    # Public API - Multithreading dl & ohlcv file saving
+    # Do not use __download__ & __load__ use load_ohlcv instead
+    def __download__(self, market: str, timeframe: str, since: (str, int, NoneType), limit: (int, NoneType),
+                     progress: (DownloadProgress, NoneType), download_size: int,
+                     checkpoint: (DownloadCheckpoint, NoneType) = None, message: (str, NoneType) = None,
+                     fetch: (callable, NoneType) = None, page_limit: (int, NoneType) = None):
+        """
+        Please do not use this method directly use load_ohlcv instead
+        :param progress: DownloadProgress receiving the events of the download, None to report nothing
+        :param checkpoint: if given, pages are saved as they complete and pages already saved are not downloaded again
+        :param message: description of the download given to the progress
+        :param fetch: page downloader called as fetch(since, limit) and returning a dataframe with a timestamp column
+        at regular intervals, None to download candles with get_kline
+        :param page_limit: max limit of a request, None to let the exchange cap the first page, the next pages never
+        ask for more values than the first page returned
+        """
+
+        # Sub functions
+
+        def dl(_since, _limit, _request_id, response_dict):
+            try:
+                response_dict[_request_id] = policy.call(fetch, int(_since), _limit, client=self.client,
+                                                         on_retry=on_retry, metrics=self.metrics)
+                if checkpoint is not None:
+                    checkpoint.save_page(_request_id, response_dict[_request_id])
+                if progress is not None:
+                    page = response_dict[_request_id]
+                    progress.page(len(page), int(page.memory_usage(index=False).sum()))
+            except BaseException as exception:  # the policy gave up, the download is stopped
+                errors.append(exception)
+            return response_dict
+
+        def on_retry(exception, attempt, delay):
+            if progress is not None:
+                progress.wait(delay, RetryPolicy.classify(exception))
+
+        # Ini
+        if fetch is None:
+            fetch = functools.partial(self.get_kline, market, timeframe)
+        if progress is not None and progress.silent:
+            progress = None  # nothing to report, skip the bookkeeping
+        remainging_candles = limit
+        policy = self.retry_policy if self.retry_policy is not None else RetryPolicy(max_retries=0)
+        errors = []  # errors of the requests the retry policy gave up on
+
+        # Part 1 - first set of candles
+        dataframe = None if checkpoint is None else checkpoint.get_first_page()
+        if dataframe is None:
+            dataframe = fetch(since, limit if page_limit is None else min(limit, page_limit))
+            if checkpoint is not None:
+                checkpoint.save_first_page(dataframe)
+        size = len(dataframe)
+        if size == 0:
+            return dataframe
+        remainging_candles -= size
+        if remainging_candles <= 0 or len(dataframe) < 2:
+            return dataframe
+
+        # Part 2 - requests making
+        requests = None if checkpoint is None else checkpoint.get_pages()
+        if requests is None:
+            t0 = int(dataframe.iloc[0]["timestamp"])  # First timestamp
+            t1 = int(dataframe.iloc[1]["timestamp"])  # Second timestamp
+            tx = int(dataframe.iloc[-1]["timestamp"])  # Last timestamp
+            offset = t1 - t0  # time between two df rows
+            full_offset = tx - t0  # time between first & last df rows
+            requests = []
+            last_timestamp = tx  # For the loop
+            while remainging_candles > 0:
+                last_timestamp += offset
+                if last_timestamp > time.time() * 1000:
+                    remainging_candles = 0
+                    break
+                requests.append((last_timestamp, min(remainging_candles, size)))
+                remainging_candles -= size
+                last_timestamp += full_offset
+            if checkpoint is not None:
+                checkpoint.save_pages(requests)
+        if len(requests) == 0:
+            return dataframe
+
+        # Part 3 - requests sending, download_size requests at the same time
+        responses = {}
+        total_length = len(requests)  # total length of the responses list
+        pending = list(range(total_length))
+        if checkpoint is not None:  # pages saved by a previous run are loaded instead of being downloaded
+            pending = checkpoint.get_pending()
+            for request_id in set(range(total_length)) - set(pending):
+                responses[request_id] = checkpoint.load_page(request_id)
+
+        if progress is not None:
+            progress.start(market, timeframe, total_length, total_length - len(pending),
+                           size + sum(len(page) for page in responses.values()), message)
+        for first in range(0, len(pending), download_size):
+            threads = []
+            for page in pending[first:first + download_size]:
+                timestamp, limit = requests[page]
+                threads.append(threading.Thread(target=dl, args=(timestamp, limit, page, responses)))
+            for thread in threads:
+                thread.start()  # we schedule the requests
+            for thread in threads:
+                thread.join()  # we wait for the responses
+            if errors:
+                if progress is not None:
+                    progress.error(errors[0])
+                raise errors[0]
+        if progress is not None:
+            progress.done()
+
+        # Merging
+        dataframes = [dataframe]
+        for i in range(len(responses)):
+            dataframes.append(responses[i])
+
+        return pd.concat(dataframes, ignore_index=True)
+
+    def __get_file_name__(self, market: str, timeframe: str, since: int, limit: int, kind: str = "ohlcv"):
+        """
+        Generate file name to save / load market data from file system
+        :param kind: "ohlcv", "funding" or "open_interest"
+        :return:
+        """
+        filename = ""
+        filename += market.replace("-", "").replace("/", "").replace(":", "") + '_'  # market
+        filename += "" if kind == "ohlcv" else kind + '_'  # series
+        filename += timeframe + '_' if timeframe else ""  # timeframe
+        filename += datetime.fromtimestamp(since / 1000).strftime("%d-%m-%y-%H-%M-%S") + '_'  # since
+        filename += ("to_now" if limit == -1 else str(limit) + '_candles') + '.csv'  # limit
+
+        return filename
+
+    @only_implemented_types
+    def load_ohlcv(self, market: str, timeframe: str, since: int, limit: int, output: bool = True,
+                   download_size: int = 100, path: (str, NoneType) = "data/", mmap: bool = False,
+                   progress: (DownloadProgress, NoneType) = None) -> "pd.DataFrame":
+        """
+        Load ohlcv method work as the get_kline method with some more features:
+        - you can very quickly download a lot of candles using multithreading with just one call
+        - you can save your data as a csv file to be able to load it from a file when you need it to gain a lot of speed
+        - you can pass -1 as the limit to update your data everytime you load it with the last candles,
         the method just download candles you don't have
         :param market: example "BTC/USD"
         :param timeframe: usually '1y', '1m', '1d', '1w', '1h'...
         :param since: first candle to download timestamp
         :param limit: number of candles you want to download, use -1 to download as many candles as possible and to
         update your dataframe with the last candles if you chose to save your data to the filesystem
-        :param output: Display download and load informations, nottably the progress bar
+        :param output: Display download and load informations, nottably the progress bar, False for a silent download
         :param download_size: number of requests sheduled at the same time, increase this parameter may cause some
         issues ! Decrease this parameter will make the download slower but you can do it if you encounter some issues.
         :param path: None will disable the data saving to the file system and everytime you call this method,
         data will be downloaded. If you pass a path as a string to this parameter, data will be saved to this path as
         csv files and the method will check to this path if a file exists with data you want to load.
+        :param mmap: True to load saved data as a read-only memory mapped dataframe (a .npy copy of the csv file is
+        kept next to it), processes loading the same data then share one copy in memory instead of one each
+        :param progress: DownloadProgress receiving the download events (pages, candles, bytes, eta, waits), replaces
+        the progress bar of output
         :return: a pandas dataframe indexed from 0 to your number of candles minus one with these columns :
         timestamp open high low close volume
         """
 
-        # mkdir if path doesn't exist
+        return self.__load_series__("ohlcv", functools.partial(self.get_kline, market, timeframe), market, timeframe,
+                                    since, limit, output, download_size, path, mmap, progress)
+
+    def __load_series__(self, kind: str, fetch: callable, market: str, timeframe: str, since: int, limit: int,
+                        output: bool, download_size: int, path: (str, NoneType), mmap: bool,
+                        progress: (DownloadProgress, NoneType)) -> "pd.DataFrame":
+        """
+        Download, save and update a time series as load_ohlcv describes it
+        :param kind: "ohlcv", "funding" or "open_interest", part of the file name
+        :param fetch: page downloader, look at __download__
+        """
+
+        # mkdir if path doesn't exist (several processes may try at the same time)
         if path is not None:
-            if not os.path.exists(path):
-                os.mkdir(path)
+            os.makedirs(path, exist_ok=True)
+        if progress is None and output:
+            progress = DownloadProgress([TerminalProgress()])
+        page_limit = self.page_limits.get(kind)
+
+        def estimate(_since, interval=None):
+            """
+            Number of values from _since to now, interval is the observed time between 2 rows, the timeframe is used
+            when it is unknown (1h for the funding rates which have no timeframe, their shortest interval)
+            """
+            if interval is None:
+                interval = timeframe_to_ms(timeframe) if timeframe else 3600000
+            return int((time.time() * 1000 - _since) / max(interval, 1) + 100)
 
         def append(df):
             """
             This method update a dataframe with new candles
             """
-            print(f"{Colors.PURPLE} EZXT is updating your data with new candles {Colors.END}")
             # time between 2 rows + last timestamp
-            _since = int(df.iloc[1]["timestamp"] - df.iloc[0]["timestamp"] + df.iloc[-1]["timestamp"])
-            _limit = int((time.time() * 1000 - _since) / 60000 + 100)
-            _df = self.__download__(market, timeframe, _since, _limit, output=output, download_size=download_size)
+            interval = int(df.iloc[1]["timestamp"] - df.iloc[0]["timestamp"])
+            _since = int(interval + df.iloc[-1]["timestamp"])
+            _limit = estimate(_since, interval)
+            checkpoint = DownloadCheckpoint(path + filename + ".update.parts",
+                                            {'market': market, 'timeframe': timeframe, 'since': _since})
+            _df = self.__download__(market, timeframe, _since, _limit, progress, download_size, checkpoint=checkpoint,
+                                    message="Updating your data with new candles", fetch=fetch, page_limit=page_limit)
             df = pd.concat([df, _df], ignore_index=True)
+            checkpoint.clear()
             return df
 
         # Check if user want to enable file system
         if path is None:
             # Case 1 - saving to file system disable
             if limit == -1:  # We download in this case as many candles as possible
-                now = time.time() * 1000
-                limit = int(
-                    (now - since) / 60 + 100)  # We could have set here a super high number for the limit parameter
-                # but we are doing it here in a cleaner way
+                limit = estimate(since)
 
-            return self.__download__(market, timeframe, since, limit, output, download_size)
+            return self.__download__(market, timeframe, since, limit, progress, download_size, fetch=fetch,
+                                     page_limit=page_limit)
 
             pass
         else:
             # File system enabled, check if our data was already saved in a file
-            filename = self.__get_file_name__(market, timeframe, since, limit)
+            filename = self.__get_file_name__(market, timeframe, since, limit, kind)
             fullpath = path + filename
-            if os.path.exists(fullpath):
-                # Case 2 - File system enable, data was already downloaded, we load it
-                dataframe = pd.read_csv(fullpath, index_col=0)
-                # Check if we have to update the dataframe
-                if limit == -1:
-                    dataframe = append(dataframe)
+            # the series may have been archived, look at archive_ohlcv()
+            archive = fullpath[:-len(".csv")] + ".ezxt" if kind == "ohlcv" else None
+            # Case 2 - File system enable, data was already loaded by this process
+            if limit != -1 and self.memory_cache is not None:
+                dataframe = self.memory_cache.get((fullpath, mmap), fullpath)
+                if dataframe is None and archive is not None and not os.path.exists(fullpath):
+                    dataframe = self.memory_cache.get((archive, False), archive)
+                self.__count_cache__(kind + "_memory", dataframe is not None)
+                if dataframe is not None:
+                    return dataframe
+            # Case 2 - File system enable, data was already downloaded, readers share the lock
+            if limit != -1:
+                with FileLock(fullpath + ".lock", shared=True):
+                    if os.path.exists(fullpath):
+                        self.__count_cache__(kind + "_file", True)
+                        return self.__read_cache__(fullpath, mmap)
+                    if archive is not None and os.path.exists(archive):
+                        self.__count_cache__(kind + "_file", True)
+                        return self.__read_archive__(archive)
+
+            # one process at a time writes a series, the others wait and load the file it saved
+            with FileLock(fullpath + ".lock"):
+                if os.path.exists(fullpath):
+                    if limit != -1:  # saved by another process while we were waiting for the lock
+                        self.__count_cache__(kind + "_file", True)
+                        return self.__read_cache__(fullpath, mmap)
+                    # Case 2 - File system enable, data was already downloaded, we load it
+                    dataframe = pd.read_csv(fullpath, index_col=0)
+                    # Check if we have to update the dataframe
+                    if limit == -1:
+                        dataframe = append(dataframe)
+                        # We save the new dataframe
+                        self.__write_cache__(dataframe, fullpath, mmap)
+
+                    return dataframe
+                elif archive is not None and os.path.exists(archive):
+                    self.__count_cache__(kind + "_file", True)
+                    if limit != -1:  # archived by another process while we were waiting for the lock
+                        return self.__read_archive__(archive)
+                    # the csv was removed once archived, the archive is updated instead
+                    dataframe = append(OhlcvArchive(archive).read())
+                    self.__write_archive__(market, dataframe, archive)
+                    return dataframe
+                else:
+                    # Case 3 - We download & save market data, pages are checkpointed so an interrupted download
+                    # is resumed by the next call
+                    self.__count_cache__(kind + "_file", False)
+                    checkpoint = DownloadCheckpoint(fullpath + ".parts", {'market': market, 'timeframe': timeframe,
+                                                                          'since': since, 'limit': limit})
+                    if limit == -1:  # We download in this case as many candles as possible
+                        limit = estimate(since)
+                    dataframe = self.__download__(market, timeframe, since, limit, progress, download_size,
+                                                  checkpoint=checkpoint, fetch=fetch, page_limit=page_limit)
                     # We save the new dataframe
-                    dataframe.to_csv(path + filename)
+                    self.__write_cache__(dataframe, fullpath, mmap)
+                    checkpoint.clear()
 
-                return dataframe
-            else:
-                # Case 3 - We download & save market data
-                filename = self.__get_file_name__(market, timeframe, since, limit)
-                if limit == -1:  # We download in this case as many candles as possible
-                    limit = int((time.time() * 1000 - since) / 60000 + 100)
-                dataframe = self.__download__(market, timeframe, since, limit, output, download_size)
-                # We save the new dataframe
-                dataframe.to_csv(path + filename)
+                    return dataframe
+
+    @only_implemented_types
+    def load_funding_rates(self, market: str, since: int, limit: int, output: bool = True, download_size: int = 100,
+                           path: (str, NoneType) = "data/", progress: (DownloadProgress, NoneType) = None
+                           ) -> "pd.DataFrame":
+        """
+        Load the funding rate history of a perpetual market with the download, saving & update features of load_ohlcv,
+        use align_to_candles() to join it to candles
+        :param market: example "BTC/USDT:USDT"
+        :param since: first funding timestamp
+        :param limit: number of fundings, -1 to download as many as possible and to update the saved data with the
+        last fundings each time it is loaded
+        :param output: Display the download progress bar, False for a silent download
+        :param download_size: number of requests sheduled at the same time
+        :param path: directory of the saved data, None to disable the saving
+        :param progress: DownloadProgress receiving the download events
+        :return: pandas dataframe with the columns timestamp funding_rate
+        """
+        return self.__load_series__("funding", functools.partial(self.get_funding_rates, market), market, "", since,
+                                    limit, output, download_size, path, False, progress)
+
+    @only_implemented_types
+    def load_open_interest(self, market: str, timeframe: str, since: int, limit: int, output: bool = True,
+                           download_size: int = 100, path: (str, NoneType) = "data/",
+                           progress: (DownloadProgress, NoneType) = None) -> "pd.DataFrame":
+        """
+        Load the open interest history of a futures market with the download, saving & update features of
+        load_ohlcv, use align_to_candles() to join it to candles
+        :param market: example "BTC/USDT:USDT"
+        :param timeframe: interval of the history, usually '5m', '1h', '1d'...
+        :param since: first value timestamp
+        :param limit: number of values, -1 to download as many as possible and to update the saved data with the last
+        values each time it is loaded
+        :param output: Display the download progress bar, False for a silent download
+        :param download_size: number of requests sheduled at the same time
+        :param path: directory of the saved data, None to disable the saving
+        :param progress: DownloadProgress receiving the download events
+        :return: pandas dataframe with the columns timestamp open_interest open_interest_value
+        """
+        return self.__load_series__("open_interest", functools.partial(self.get_open_interest, market, timeframe),
+                                    market, timeframe, since, limit, output, download_size, path, False, progress)
+
+    @only_implemented_types
+    def archive_ohlcv(self, market: str, timeframe: str, since: int, limit: int, path: str = "data/",
+                      remove_csv: bool = False, block_size: int = 65536) -> str:
+        """
+        Convert a series saved by load_ohlcv() to a compressed archive (look at OhlcvArchive), prices & volumes are
+        stored as integers scaled with the precision of the market. load_ohlcv() reads the archive when the csv file
+        was removed.
+        :param market: example "BTC/USD"
+        :param timeframe: usually '1y', '1m', '1d', '1w', '1h'...
+        :param since: since parameter given to load_ohlcv()
+        :param limit: limit parameter given to load_ohlcv()
+        :param path: path parameter given to load_ohlcv()
+        :param remove_csv: True to remove the csv file once archived
+        :param block_size: number of candles of a block of the archive
+        :return: path of the archive
+        """
+        fullpath = path + self.__get_file_name__(market, timeframe, since, limit)
+        archive = fullpath[:-len(".csv")] + ".ezxt"
+
+        with FileLock(fullpath + ".lock"):
+            dataframe = pd.read_csv(fullpath, index_col=0)
+            self.__write_archive__(market, dataframe, archive, block_size)
+            if remove_csv:
+                os.remove(fullpath)
+
+        return archive
+
+    def __write_archive__(self, market: str, dataframe: "pd.DataFrame", archive: str,
+                          block_size: (int, NoneType) = None):
+        """
+        Write a series as an archive with the precision of its market
+        :param block_size: number of candles of a block, None to keep the block size of the existing archive
+        """
+        if block_size is None:
+            blocks = OhlcvArchive(archive).blocks if os.path.exists(archive) else []
+            block_size = blocks[0]['rows'] if len(blocks) > 1 else 65536
+        try:
+            rules = self.get_market_rules(market)
+            price_decimals, volume_decimals = (None if step is None else max(0, -step.normalize().as_tuple().exponent)
+                                               for step in (rules.price_tick, rules.amount_step))
+        except (KeyError, ccxt.BaseError):  # unknown market, decimals are detected from the data
+            price_decimals = volume_decimals = None
+        OhlcvArchive.write(archive, dataframe, price_decimals, volume_decimals, block_size=block_size)
+        if self.memory_cache is not None:
+            self.memory_cache.put((archive, False), archive, dataframe)
+
+    def __read_archive__(self, archive: str) -> "pd.DataFrame":
+        """
+        Read an archived series and keep it in the memory cache
+        """
+        dataframe = OhlcvArchive(archive).read()
+        if self.memory_cache is not None:
+            self.memory_cache.put((archive, False), archive, dataframe)
+        return dataframe
+
+    def __read_cache__(self, fullpath: str, mmap: bool) -> "pd.DataFrame":
+        """
+        Read a saved series, from its memory mapped copy if mmap is True (the copy is made if it is missing or older
+        than the csv file)
+        """
+        if not mmap:
+            dataframe = pd.read_csv(fullpath, index_col=0)
+        else:
+            shared = fullpath[:-len(".csv")] + ".npy"
+            if not os.path.exists(shared) or os.path.getmtime(shared) < os.path.getmtime(fullpath):
+                save_shared(pd.read_csv(fullpath, index_col=0), shared)  # atomic, concurrent readers may both do it
+            dataframe = load_shared(shared)
+        if self.memory_cache is not None:
+            self.memory_cache.put((fullpath, mmap), fullpath, dataframe)
+        return dataframe
+
+    def __write_cache__(self, dataframe: "pd.DataFrame", fullpath: str, mmap: bool):
+        """
+        Save a series atomically, and its memory mapped copy if mmap is True or if it already has one
+        """
+        atomic_to_csv(dataframe, fullpath)
+        shared = fullpath[:-len(".csv")] + ".npy"
+        if mmap or os.path.exists(shared):
+            save_shared(dataframe, shared)
+        if self.memory_cache is not None and not mmap:
+            self.memory_cache.put((fullpath, mmap), fullpath, dataframe)
+
+    @only_implemented_types
+    def load_indicators(self, market: str, timeframe: str, since: int, limit: int, indicators: list,
+                        output: bool = True, download_size: int = 100, path: (str, NoneType) = "data/"
+                        ) -> "pd.DataFrame":
+        """
+        Load a series with load_ohlcv() and compute indicators over it, the indicators of the candles already
+        computed by a previous call (or a previous run, the values are saved next to the series) are not computed
+        again, with limit=-1 only the new candles are computed
+        :param market: example "BTC/USD"
+        :param timeframe: usually '1y', '1m', '1d', '1w', '1h'...
+        :param since: first candle timestamp
+        :param limit: number of candles, -1 to update the series, look at load_ohlcv
+        :param indicators: Indicator instances, example [SMA(20), EMA(50), ATR(14), VWAP(), Returns()]
+        :param output: Display the download progress bar, False for a silent download
+        :param download_size: number of requests sheduled at the same time
+        :param path: directory of the saved series & indicators, None to keep the indicators in memory only
+        :return: pandas dataframe with the columns timestamp open high low close volume and one column per indicator
+        value
+        """
+        candles = self.load_ohlcv(market, timeframe, since, limit, output=output, download_size=download_size,
+                                  path=path)
+        key = (market, timeframe, since, limit, path, tuple(indicator.spec for indicator in indicators))
+        engine = self.indicator_engines.get(key)
+        if engine is None:
+            state_path = None
+            if path is not None:
+                state_path = path + self.__get_file_name__(market, timeframe, since, limit)[:-len(".csv")]
+                state_path += "_" + hashlib.sha1(",".join(key[-1]).encode()).hexdigest()[:12]
+            engine = self.indicator_engines[key] = IndicatorEngine(indicators, state_path)
+        values = engine.update(candles)
+        return pd.concat([candles.reset_index(drop=True), values.drop(columns='timestamp')], axis=1)
+
+    # Public API - Backfill
+
+    @only_implemented_types
+    def backfill(self, queue: BackfillQueue, path: str = "data/", worker: (str, NoneType) = None,
+                 download_size: int = 100, max_units: (int, NoneType) = None, wait: bool = True) -> dict:
+        """
+        Work on a backfill: lease units from the queue, download them with load_ohlcv() to the common store and mark
+        them done. Run it in as many processes as you want on every node sharing the queue & the path, each node
+        downloads with its own rate limit. A unit interrupted by a crash is resumed from its saved pages by the worker
+        leasing it next.
+        :param queue: BackfillQueue shared by the workers, look at BackfillQueue.add_jobs
+        :param path: directory of the common store (shared volume), units are saved as load_ohlcv files
+        :param worker: id of the worker, None for host-pid-thread
+        :param download_size: number of requests sheduled at the same time, look at load_ohlcv
+        :param max_units: max number of units to download, None to work until the queue is empty
+        :param wait: True to wait for the units leased by other workers (they are leased again if their lease expires)
+        before returning, False to return as soon as nothing is left to lease
+        :return: dict with the keys units candles failed lost (units whose lease expired during the download) of this
+        worker
+        """
+        worker = f"{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}" if worker is None else worker
+        result = {'units': 0, 'candles': 0, 'failed': 0, 'lost': 0}
+
+        def heartbeat(_unit_id, _stop):
+            while not _stop.wait(queue.lease / 3):
+                if not queue.renew(_unit_id, worker):
+                    break  # lost the lease, the unit is saved twice with the same candles
+
+        while max_units is None or result['units'] + result['failed'] + result['lost'] < max_units:
+            units = queue.lease_units(worker)
+            if not units:
+                if wait and queue.get_stats()[UnitState.LEASED] > 0:
+                    time.sleep(min(queue.lease, 5.))
+                    continue
+                break
+            unit = units[0]
+            limit = int((unit['until'] - unit['since']) // timeframe_to_ms(unit['timeframe']))
+            stop = threading.Event()
+            thread = threading.Thread(target=heartbeat, args=(unit['unit_id'], stop), daemon=True)
+            thread.start()
+            try:
+                dataframe = self.load_ohlcv(unit['market'], unit['timeframe'], unit['since'], limit, output=False,
+                                            download_size=download_size, path=path)
+            except BaseException as exception:
+                queue.fail(unit['unit_id'], worker, f"{type(exception).__name__}: {exception}")
+                result['failed'] += 1
+                if isinstance(exception, (KeyboardInterrupt, SystemExit)):
+                    raise
+                continue
+            finally:
+                stop.set()
+                thread.join()
+            if queue.complete(unit['unit_id'], worker, len(dataframe)):
+                result['units'] += 1
+                result['candles'] += len(dataframe)
+            else:  # the lease expired and the unit was leased again, the new holder completes it
+                result['lost'] += 1
+        return result
+
+    @only_implemented_types
+    def load_backfill(self, queue: BackfillQueue, market: str, timeframe: str, path: str = "data/"
+                      ) -> "pd.DataFrame":
+        """
+        Assemble the units of a series saved by backfill(), without any request
+        :param queue: BackfillQueue of the backfill
+        :param market: example "BTC/USD"
+        :param timeframe: usually '1m', '1h', '1d'...
+        :param path: directory of the common store
+        :return: pandas dataframe with the columns timestamp open high low close volume of the units done, sorted by
+        timestamp
+        """
+        interval = timeframe_to_ms(timeframe)
+        dataframes = []
+        for unit in queue.get_units(market, timeframe, UnitState.DONE):
+            limit = int((unit['until'] - unit['since']) // interval)
+            dataframe = self.load_ohlcv(market, timeframe, unit['since'], limit, output=False, path=path)
+            dataframes.append(dataframe[(dataframe['timestamp'] >= unit['since']) &
+                                        (dataframe['timestamp'] < unit['until'])])
+        if not dataframes:
+            return pd.DataFrame(columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        dataframe = pd.concat(dataframes, ignore_index=True).drop_duplicates(subset='timestamp', keep="last")
+        return dataframe.sort_values('timestamp', kind="stable").reset_index(drop=True)
+
+    # Public API - Trades
+
+    @only_implemented_types
+    def load_trades(self, market: str, since: int, until: (int, NoneType) = None, output: bool = True,
+                    download_size: int = 100, path: (str, NoneType) = "data/", chunk: int = 3600000,
+                    id_param: (str, NoneType) = None, progress: (DownloadProgress, NoneType) = None) -> "pd.DataFrame":
+        """
+        Load the trades of a market between two timestamps. The range is split in chunks downloaded at the same time,
+        each chunk is paginated with fetch_trades and the overlaps between pages are removed.
+        With a path, every UTC day fully covered by the range is saved as soon as it is downloaded (one csv file per
+        day next to the ohlcv files), later calls only download the days they don't have.
+        :param market: example "BTC/USD"
+        :param since: timestamp of the first trade
+        :param until: timestamp after the last trade (excluded), None for now
+        :param output: Display the download progress bar, False for a silent download
+        :param download_size: number of chunks downloaded at the same time
+        :param path: directory of the saved days, None to disable the saving
+        :param chunk: duration of a chunk in ms
+        :param id_param: exchange parameter to paginate by trade id ("fromId" on binance), None to paginate by time
+        :param progress: DownloadProgress receiving the download events, one page per chunk
+        :return: a pandas dataframe with the columns timestamp id price amount side, sorted by timestamp
+        """
+        now = int(time.time() * 1000)
+        until = now if until is None else min(until, now)
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+        if progress is None and output:
+            progress = DownloadProgress([TerminalProgress()])
+        if progress is not None and progress.silent:
+            progress = None
+
+        # Saved days are loaded, the others are split in chunks
+        day = 86400000
+        frames = {}  # {day start: trades}
+        chunks = []  # (day start, chunk start, chunk end)
+        for start in range(since // day * day, until, day):
+            end = start + day
+            fullpath = None
+            if path is not None and since <= start and end <= until:  # whole day, it can be saved
+                fullpath = path + self.__get_trades_file_name__(market, start)
+                frames[start] = self.__read_trades__(fullpath)
+                self.__count_cache__("trades_file", frames[start] is not None)
+                if frames[start] is not None:
+                    continue
+            first, last = max(start, since), min(end, until)
+            chunks.extend((start, position, min(position + chunk, last)) for position in range(first, last, chunk))
+            frames[start] = fullpath  # replaced by the trades once every chunk of the day is downloaded
+
+        # Chunks downloading, the days are saved as soon as they are complete
+        policy = self.retry_policy if self.retry_policy is not None else RetryPolicy(max_retries=0)
+        remaining = {}
+        for start, _, _ in chunks:
+            remaining[start] = remaining.get(start, 0) + 1
+        parts = {start: [] for start in remaining}
+        lock = threading.Lock()
+        errors = []
+
+        def on_retry(exception, attempt, delay):
+            if progress is not None:
+                progress.wait(delay, RetryPolicy.classify(exception))
+
+        def dl(_day, _start, _end):
+            try:
+                trades = self.__download_trades__(market, _start, _end, id_param, policy, on_retry)
+                if progress is not None:
+                    progress.page(len(trades), int(trades.memory_usage(index=False).sum()))
+                with lock:
+                    parts[_day].append(trades)
+                    remaining[_day] -= 1
+                    complete = remaining[_day] == 0
+                if complete:
+                    self.__save_trades__(_day, frames, parts[_day])
+            except BaseException as exception:  # the policy gave up, the download is stopped
+                errors.append(exception)
+
+        if chunks and progress is not None:
+            progress.start(market, "trades", len(chunks), message="Trades Download")
+        for first in range(0, len(chunks), download_size):
+            threads = [threading.Thread(target=dl, args=item) for item in chunks[first:first + download_size]]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if errors:
+                if progress is not None:
+                    progress.error(errors[0])
+                raise errors[0]
+        if chunks and progress is not None:
+            progress.done()
+
+        trades = pd.concat([frames[start] for start in sorted(frames)] or [pd.DataFrame(columns=trade_columns)],
+                           ignore_index=True)
+        trades = trades[(trades['timestamp'] >= since) & (trades['timestamp'] < until)]
+        return trades.reset_index(drop=True)
+
+    @only_implemented_types
+    def load_trade_candles(self, market: str, timeframe: (str, int), since: int, until: (int, NoneType) = None,
+                           fill: bool = False, output: bool = True, download_size: int = 100,
+                           path: (str, NoneType) = "data/") -> "pd.DataFrame":
+        """
+        Build candles of any interval (10s candles for example) from the trades of a market, look at load_trades
+        :param market: example "BTC/USD"
+        :param timeframe: interval of the candles, '10s', '1m', '4h'... or a number of milliseconds
+        :param since: timestamp of the first trade
+        :param until: timestamp after the last trade (excluded), None for now
+        :param fill: True to add the intervals without trades, look at trades_to_candles
+        :param output: Display the download progress bar
+        :param download_size: number of chunks downloaded at the same time
+        :param path: directory of the saved trades, None to disable the saving
+        :return: pandas dataframe with the columns timestamp open high low close volume
+        """
+        trades = self.load_trades(market, since, until, output=output, download_size=download_size, path=path)
+        return trades_to_candles(trades, timeframe, fill=fill)
+
+    def __download_trades__(self, market: str, start: int, end: int, id_param: (str, NoneType),
+                            policy: RetryPolicy, on_retry: callable) -> "pd.DataFrame":
+        """
+        Download the trades of [start, end) page by page, pages overlap on their last timestamp (or follow the last
+        id with id_param) and duplicates are removed. A page with a single timestamp is asked again bigger,
+        TradesPaginationError is raised if the exchange can't send every trade of the timestamp
+        """
+        trades = []
+        cursor, params = start, {}
+        limit, previous = None, 0  # page size asked for when a whole page has the same timestamp
+        page_size = 0  # largest page received, pages the exchange sends at most
+        while True:
+            page = policy.call(self.get_trades, market, None if params else cursor, limit, params, client=self.client,
+                               on_retry=on_retry, metrics=self.metrics)
+            page_size = max(page_size, len(page))
+            page = [trade for trade in page if trade['timestamp'] >= start]
+            if not page:
+                break
+            trades.extend(trade for trade in page if trade['timestamp'] < end)
+            last = page[-1]
+            if last['timestamp'] >= end:
+                break
+            if id_param is not None and str(last.get('id')).isdigit():  # ids which are not numbers are paged by time
+                if params and int(last['id']) < params[id_param]:  # the exchange ignored the id parameter
+                    break
+                params = {id_param: int(last['id']) + 1}
+            elif last['timestamp'] > cursor:
+                cursor = last['timestamp']  # the next page starts with the trades of this timestamp again
+                limit, previous = None, 0
+            elif len(page) > previous:  # the whole page has the same timestamp, ask for a bigger page
+                limit, previous = 2 * len(page), len(page)
+            elif len(page) < page_size:  # no more trades with a smaller page than the exchange sends, move on
+                cursor += 1
+                limit, previous = None, 0
+            else:  # the exchange doesn't send bigger pages, moving on would skip trades
+                raise TradesPaginationError(market, cursor, len(page))
+
+        dataframe = pd.DataFrame([[trade['timestamp'], trade.get('id'), trade['price'], trade['amount'],
+                                   trade.get('side')] for trade in trades], columns=trade_columns)
+        subset = ['id'] if dataframe['id'].notna().all() else trade_columns
+        dataframe = dataframe.drop_duplicates(subset=subset)
+        return dataframe.sort_values('timestamp', kind="stable").reset_index(drop=True)
+
+    def __get_trades_file_name__(self, market: str, day: int) -> str:
+        """
+        Generate the file name of the trades of a UTC day
+        """
+        date = datetime.fromtimestamp(day / 1000, timezone.utc).strftime("%Y-%m-%d")
+        return market.replace("-", "").replace("/", "").replace(":", "") + '_trades_' + date + '.csv'
 
+    def __read_trades__(self, fullpath: str) -> ("pd.DataFrame", NoneType):
+        """
+        Read a saved day of trades, None if the day wasn't saved
+        """
+        if self.memory_cache is not None:
+            dataframe = self.memory_cache.get((fullpath, False), fullpath)
+            if dataframe is not None:
                 return dataframe
+        with FileLock(fullpath + ".lock", shared=True):
+            if not os.path.exists(fullpath):
+                return None
+            dataframe = pd.read_csv(fullpath, index_col=0, dtype={'id': str, 'side': str})
+        if self.memory_cache is not None:
+            self.memory_cache.put((fullpath, False), fullpath, dataframe)
+        return dataframe
+
+    def __save_trades__(self, day: int, frames: dict, parts: list):
+        """
+        Merge the chunks of a day, and save the day if it is a whole one (frames[day] is then its path)
+        """
+        dataframe = pd.concat(parts, ignore_index=True).sort_values('timestamp', kind="stable")
+        subset = ['id'] if dataframe['id'].notna().all() else trade_columns
+        dataframe = dataframe.drop_duplicates(subset=subset).reset_index(drop=True)
+        fullpath = frames[day]
+        if fullpath is not None:
+            with FileLock(fullpath + ".lock"):
+                atomic_to_csv(dataframe, fullpath)
+            if self.memory_cache is not None:
+                self.memory_cache.put((fullpath, False), fullpath, dataframe)
+        frames[day] = dataframe
 
     # Private API
 
     @only_authenticated
+    @retry_request
     @load_markets
     @only_implemented_types
     def get_free_balance(self, token: str, params: (dict, NoneType) = None) -> float:
@@ -547,11 +3796,13 @@ class WrappedGenericExchange:
         if params is None:
             params = {}
         balances = self.client.fetch_balance(params=params)
+        self.__cache_balance__(balances)
         balance = balances.get(token, {})
         free = balance.get('free', 0)
         return float(free)
 
     @only_authenticated
+    @retry_request
     @load_markets
     @only_implemented_types
     def get_balance(self, token: str, params: (dict, NoneType) = None) -> float:
@@ -564,6 +3815,7 @@ class WrappedGenericExchange:
         if params is None:
             params = {}
         balances = self.client.fetch_balance(params=params)
+        self.__cache_balance__(balances)
         balance = balances.get(token, {})
         free = balance.get('total', 0)
         return float(free)
@@ -580,6 +3832,8 @@ class WrappedGenericExchange:
         return self.client.load_accounts()
 
     @only_authenticated
+    @journal_orders
+    @retry_request
     @only_implemented_types
     def get_order(self, order_id: str, market: str, params: (dict, NoneType) = None) -> dict:
         """
@@ -594,6 +3848,8 @@ class WrappedGenericExchange:
         return self.client.fetch_order(order_id, market, params=params)
 
     @only_authenticated
+    @journal_orders
+    @retry_request
     @only_implemented_types
     def get_all_orders(self, market: str, params: (dict, NoneType) = None) -> list:
         """
@@ -607,6 +3863,8 @@ class WrappedGenericExchange:
         return self.client.fetch_orders(symbol=market, params=params)
 
     @only_authenticated
+    @journal_orders
+    @retry_request
     @only_implemented_types
     def get_all_open_orders(self, market: str, params: (dict, NoneType) = None) -> list:
         """
@@ -620,6 +3878,49 @@ class WrappedGenericExchange:
         return self.client.fetch_open_orders(symbol=market, params=params)
 
     @only_authenticated
+    @retry_request
+    @only_implemented_types
+    def sync_orders(self, market: str, since: (int, NoneType) = None, params: (dict, NoneType) = None) -> int:
+        """
+        Incrementally synchronize the order journal with the exchange, only orders (and fills) more recent than the
+        last one recorded for this market are downloaded, older orders still open in the journal are polled again
+        (fetch_open_orders, then fetch_order for the ones which are not open anymore)
+        :param market: example "BTC/USD"
+        :param since: timestamp to start from, by default the last order recorded in the journal for this market
+        :param params: additional parameters
+        :return: number of orders received
+        """
+        if self.journal is None:
+            raise JournalNotEnabled(self.sync_orders)
+        if params is None:
+            params = {}
+        order_since = self.journal.get_last_timestamp(market) if since is None else since
+        orders = self.client.fetch_orders(symbol=market, since=order_since, params=params)
+        self.journal.record(orders)
+
+        # Orders older than the cursor are not downloaded again, the open ones may have changed since
+        received = {str(order["id"]) for order in orders if order.get("id") is not None}
+        stale = [order["id"] for order in self.journal.get_orders(market=market, status="open")
+                 if str(order["id"]) not in received]
+        if stale and self.client.has.get('fetchOpenOrders'):
+            open_orders = self.client.fetch_open_orders(symbol=market, params=params)
+            self.journal.record(open_orders)
+            orders = orders + [order for order in open_orders if str(order.get("id")) not in received]
+            received.update(str(order.get("id")) for order in open_orders)
+        closed = [self.client.fetch_order(order_id, market, params=params) for order_id in stale
+                  if str(order_id) not in received]
+        self.journal.record(closed)
+        orders = orders + closed
+
+        if self.client.has.get('fetchMyTrades'):
+            fill_since = self.journal.get_last_timestamp(market, table="fills") if since is None else since
+            self.journal.record_fills(self.client.fetch_my_trades(symbol=market, since=fill_since, params=params))
+
+        return len(orders)
+
+    @only_authenticated
+    @journal_orders
+    @retry_order
     @only_implemented_types
     def cancel_order_by_id(self, order_id: str, market: str, params: (dict, NoneType) = None) -> dict:
         """
@@ -632,9 +3933,12 @@ class WrappedGenericExchange:
 
         if params is None:
             params = {}
+        self.__on_order_sent__()
         return self.client.cancel_order(order_id, market, params=params)
 
     @only_authenticated
+    @journal_orders
+    @retry_order
     @only_implemented_types
     def cancel_order_by_object(self, order: dict, market: str, params: (dict, NoneType) = None) -> dict:
         """
@@ -647,9 +3951,11 @@ class WrappedGenericExchange:
 
         if params is None:
             params = {}
+        self.__on_order_sent__()
         return self.client.cancel_order(order["info"]["id"], market, params=params)
 
     @only_authenticated
+    @retry_request
     @only_implemented_types
     def get_order_status_by_id(self, order_id: str, market: str, params: (dict, NoneType) = None) -> str:
         """
@@ -678,6 +3984,7 @@ class WrappedGenericExchange:
         return order["info"]["status"]
 
     @only_authenticated
+    @retry_request
     @only_implemented_types
     def get_order_size(self, market: str, side: str, size_type: str, size: (float, int), price: (float, int, NoneType)
     = None, params: (dict, NoneType) = None) -> float:
@@ -702,7 +4009,8 @@ class WrappedGenericExchange:
 
         if params is None:
             params = {}
-        currency_1_name, currency_2_name = market.split("/")
+        rules = self.get_market_rules(market)
+        currency_1_name, currency_2_name = rules.base, rules.quote
 
         # Getting the price
         if price is None:
@@ -729,18 +4037,107 @@ class WrappedGenericExchange:
         size = float(size)
 
         # Parsing size with market minimum order size
-        precision, minimum = self.get_precision(market)
-        # precision of the market ( number of digits after the decimal point)
-        digits = int(math.sqrt((int(math.log10(precision)) + 1) ** 2)) + 1
         # Apply the precision
-        size = truncate(size, digits)
+        size = rules.round_amount(size)
         # Apply the minimum
-        if size < minimum:
+        if size < rules.amount_min:
             return 0
 
         return size
 
     @only_authenticated
+    @retry_request
+    @load_markets
+    @only_implemented_types
+    def get_order_sizes(self, markets: list, sides: list, size_types: list, sizes: (list, np.ndarray),
+                        prices: (list, np.ndarray, NoneType) = None,
+                        params: (dict, NoneType) = None) -> tuple[np.ndarray, list]:
+        """
+        Batch version of get_order_size(), size a lot of orders at once with at most one tickers request and one
+        balance request, sizes are also checked against the minimum cost of the markets
+        :param markets: list of markets, example ["BTC/USD", "ETH/USD"]
+        :param sides: list of sides, "buy" or "sell" for each market
+        :param size_types: list of size types, look at get_order_size() for the available size types
+        :param sizes: list of sizes, the value you have to fill depend on the size_type
+        :param prices: list of prices, None (for the whole list or for a leg) to use the market price
+        :param params: additional parameters
+        :return: (sizes as a numpy array, list of reason codes) a size is 0 when its reason code is not SizeReason.OK
+        """
+        if params is None:
+            params = {}
+        count = len(markets)
+        if not len(sides) == len(size_types) == len(sizes) == count or (prices is not None and len(prices) != count):
+            raise ValueError("markets, sides, size_types, sizes and prices must have the same length")
+        if prices is None:
+            prices = [None] * count
+
+        sizes = np.asarray(sizes, dtype=float).copy()
+        prices = np.array([np.nan if price is None else price for price in prices], dtype=float)
+        size_types = np.asarray(size_types, dtype=object)
+        reasons = np.full(count, SizeReason.OK, dtype=object)
+        rules = [self.get_market_rules(market) for market in markets]
+        quoted = (size_types == "currency_2_amount") | (size_types == "currency_2_percent")
+        costs = np.array([rule.cost_min for rule in rules], dtype=float)
+
+        # Getting missing prices with one request, only the sizes in currency 2 & the minimum costs need a price
+        missing = np.isnan(prices) & (quoted | (costs > 0))
+        if missing.any():
+            symbols = sorted({markets[i] for i in np.flatnonzero(missing)})
+            tickers = self.get_tickers(symbols)
+            for i in np.flatnonzero(missing):
+                ticker = tickers.get(markets[i], {})
+                price = ticker.get("bid") if sides[i] == "buy" else ticker.get("ask")
+                prices[i] = np.nan if price is None else price
+
+        # Getting balances with one request
+        currencies = np.array([(rule.base, rule.quote) for rule in rules], dtype=object).reshape(count, 2)
+        balances = np.zeros(count)
+        percent = (size_types == "currency_1_percent") | (size_types == "currency_2_percent")
+        if percent.any():
+            balances = self.client.fetch_balance(params=params)
+            self.__cache_balance__(balances)
+            free = balances.get("free", {})
+            tokens = np.where(size_types == "currency_1_percent", currencies[:, 0], currencies[:, 1])
+            balances = np.array([float(free.get(token) or 0) if is_percent else 0.
+                                 for token, is_percent in zip(tokens, percent)])
+            reasons[percent & (balances <= 0)] = SizeReason.NO_BALANCE
+
+        # Parsing size_type & size
+        sizes = np.where(percent, sizes / 100 * balances, sizes)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sizes = np.where(quoted, sizes / prices, sizes)
+        reasons[quoted & ~(prices > 0)] = SizeReason.NO_PRICE
+        known = percent | quoted | (size_types == "currency_1_amount")
+        reasons[~known] = SizeReason.WRONG_SIZE_TYPE
+
+        # Parsing sizes with markets precision & minimum order size
+        minimums = np.array([rule.amount_min for rule in rules], dtype=float)
+        sizes = self.rounding_table.round_amounts(markets, np.nan_to_num(sizes))
+        reasons[(reasons == SizeReason.OK) & (sizes < minimums)] = SizeReason.BELOW_MINIMUM
+        with np.errstate(invalid="ignore"):
+            below_cost = sizes * prices < costs  # legs without a price are not checked
+        reasons[(reasons == SizeReason.OK) & below_cost] = SizeReason.BELOW_MIN_COST
+        sizes[reasons != SizeReason.OK] = 0
+
+        return sizes, reasons.tolist()
+
+    @only_authenticated
+    @only_implemented_types
+    def prepare_order(self, market: str, side: str, order_type: str,
+                      params: (dict, NoneType) = None) -> PreparedOrder:
+        """
+        Prepare an order handle for low latency submission, look at PreparedOrder.submit()
+        :param market: example "BTC/USD"
+        :param side: "buy" or "sell"
+        :param order_type: "market", "limit", "stop" or "takeProfit"
+        :param params: static additional parameters sent with every order
+        :return: a PreparedOrder
+        """
+        return PreparedOrder(self, market, side, order_type, params)
+
+    @only_authenticated
+    @journal_orders
+    @retry_order
     @only_implemented_types
     def post_market_order(self, market: str, side: str, size: (float, int), params: (dict, NoneType) = None) -> dict:
         """
@@ -757,9 +4154,14 @@ class WrappedGenericExchange:
         if size <= 0:
             return {}
 
+        self.__check_order__(market, side, "market", size, None, params)
+        self.__on_order_sent__()
+
         return self.client.create_order(symbol=market, type="market", side=side, amount=size, params=params)
 
     @only_authenticated
+    @journal_orders
+    @retry_order
     @only_implemented_types
     def post_limit_order(self, market: str, side: str, size: (float, int), price: (float, int),
                          params: (dict, NoneType) = None) -> dict:
@@ -778,10 +4180,15 @@ class WrappedGenericExchange:
         if size <= 0:
             return {}
 
+        self.__check_order__(market, side, "limit", size, price, params)
+        self.__on_order_sent__()
+
         return self.client.create_order(symbol=market, type="limit", side=side, amount=size, price=price,
                                         params=params)
 
     @only_authenticated
+    @journal_orders
+    @retry_order
     @only_implemented_types
     def post_stop_loss_order(self, market: str, side: str, size: (float, int), price: (float, int),
                              params: (dict, NoneType) = None) -> dict:
@@ -800,12 +4207,16 @@ class WrappedGenericExchange:
         if size <= 0:
             return {}
 
-        params.update({"stopPrice": price})
+        self.__check_order__(market, side, "stop", size, price, params)
+        self.__on_order_sent__()
+        params = dict(params, stopPrice=price)  # the caller's dict is left untouched
 
         return self.client.create_order(symbol=market, type="stop", side=side, amount=size, price=price,
                                         params=params)
 
     @only_authenticated
+    @journal_orders
+    @retry_order
     @only_implemented_types
     def post_take_profit_order(self, market: str, side: str, size: (float, int), price: (float, int),
                                params: (dict, NoneType) = None) -> dict:
@@ -824,7 +4235,9 @@ class WrappedGenericExchange:
         if size <= 0:
             return {}
 
-        params.update({"triggerPrice": price})
+        self.__check_order__(market, side, "takeProfit", size, price, params)
+        self.__on_order_sent__()
+        params = dict(params, triggerPrice=price)  # the caller's dict is left untouched
 
         return self.client.create_order(symbol=market, type='takeProfit', side=side, amount=size,
                                         params=params)
@@ -842,6 +4255,11 @@ class WrappedFtxClient(WrappedGenericExchange):
         Instantiate ftx ccxt client
         """
         super().__init__(ccxt.ftx)
+        self.position_cache = {}  # Last positions snapshot {market: position}, look at get_positions()
+        self.position_cache_time = 0.  # When position_cache was received
+        self.account_cache = None  # Last account data, look at get_account_data()
+        self.account_cache_time = 0.  # When account_cache was received
+        self.account_ttl = 2.  # Max age in seconds of account_cache
 
     # Override
     @only_implemented_types
@@ -867,6 +4285,8 @@ class WrappedFtxClient(WrappedGenericExchange):
 
     # Override
     @only_authenticated
+    @journal_orders
+    @retry_request
     @only_implemented_types
     def get_order(self, order_id: str, market: str, params: (dict, NoneType) = None) -> dict:
         """
@@ -878,11 +4298,13 @@ class WrappedFtxClient(WrappedGenericExchange):
         """
         if params is None:
             params = {}
-        params.update({'method': 'privateGetOrdersOrderId'})
+        params = dict(params, method='privateGetOrdersOrderId')
         return self.client.fetch_order(order_id, market, params=params)
 
     # Override
     @only_authenticated
+    @journal_orders
+    @retry_order
     @only_implemented_types
     def cancel_order_by_id(self, order_id: str, market: str, params: (dict, NoneType) = None) -> dict:
         """
@@ -897,14 +4319,17 @@ class WrappedFtxClient(WrappedGenericExchange):
         order = self.get_order(order_id, market)
         order_type = order['info']['type']
         if order_type == "stop" or order_type == "take_profit":
-            params.update({'method': 'privateDeleteConditionalOrdersOrderId'})
+            params = dict(params, method='privateDeleteConditionalOrdersOrderId')
         else:
-            params.update({'method': 'privateDeleteOrdersOrderId'})
+            params = dict(params, method='privateDeleteOrdersOrderId')
 
+        self.__on_order_sent__()
         return self.client.cancel_order(order_id, market, params=params)
 
     # Override
     @only_authenticated
+    @journal_orders
+    @retry_order
     @only_implemented_types
     def cancel_order_by_object(self, order: dict, market: str, params: (dict, NoneType) = None) -> dict:
         """
@@ -918,15 +4343,17 @@ class WrappedFtxClient(WrappedGenericExchange):
             params = {}
         order_type = order['info']['type']
         if order_type == "stop" or order_type == "take_profit":
-            params.update({'method': 'privateDeleteConditionalOrdersOrderId'})
+            params = dict(params, method='privateDeleteConditionalOrdersOrderId')
         else:
-            params.update({'method': 'privateDeleteOrdersOrderId'})
+            params = dict(params, method='privateDeleteOrdersOrderId')
 
+        self.__on_order_sent__()
         return self.client.cancel_order(order["info"]["id"], market, params=params)
 
     # Private API - Contract trading ( future )
 
     @only_authenticated
+    @retry_request
     @only_implemented_types
     def get_position(self, market: str, parsing: bool = True, params: (dict, NoneType) = None) -> dict:
         """
@@ -944,17 +4371,53 @@ class WrappedFtxClient(WrappedGenericExchange):
 
         if parsing:
             # Parsing if enable
-            position = {'market': response['info']['future'],
-                        'size': response['info']['size'],
-                        'side': response['info']['side'],
-                        'entryPrice': response['entryPrice'],
-                        'estimatedLiquidationPrice': response['liquidationPrice'],
-                        'collateral': response['collateral']}
-            return position
+            return self.__parse_position__(response)
         else:
             return response
 
+    @staticmethod
+    def __parse_position__(response: dict) -> dict:
+        """
+        Parse a position returned by ccxt
+        """
+        return {'market': response['info']['future'],
+                'size': response['info']['size'],
+                'side': response['info']['side'],
+                'entryPrice': response['entryPrice'],
+                'estimatedLiquidationPrice': response['liquidationPrice'],
+                'collateral': response['collateral']}
+
+    @only_authenticated
+    @retry_request
+    @only_implemented_types
+    def get_positions(self, parsing: bool = True, include_empty: bool = False,
+                      params: (dict, NoneType) = None) -> dict:
+        """
+        Return every position on ftx future markets with a single request, the snapshot is also kept in
+        self.position_cache
+        :param parsing: True if you want EZXT to parse FTX responses (look at get_position())
+        :param include_empty: True to keep markets where the size of the position is 0
+        :param params: additional parameters
+        :return: a dict {market: position}
+        """
+        if params is None:
+            params = {}
+
+        positions = {}
+        for response in self.client.fetch_positions(params=params):
+            if not include_empty and not float(response['info']['size'] or 0):
+                continue
+            position = self.__parse_position__(response) if parsing else response
+            positions[response['info']['future']] = position
+        if parsing:
+            self.position_cache = positions if not include_empty else \
+                {market: position for market, position in positions.items() if float(position['size'] or 0)}
+            self.position_cache_time = time.time()
+
+        return positions
+
     @only_authenticated
+    @retry_request
     @only_implemented_types
     def get_future_order_size(self, market: str, side: str, size_type: str, size: (float, int),
                               price: (float, int, NoneType)
@@ -1008,8 +4471,7 @@ class WrappedFtxClient(WrappedGenericExchange):
         elif size_type == "currency_1_amount":
             pass  # Nothing to do
         elif size_type == "leverage":
-            usd_size = self.get_total_collateral()
-            price = self.get_bid(market)
+            usd_size = self.get_total_collateral()  # cached, look at get_account_data()
             size = usd_size * size / price  # Here size represent the leverage
         else:
             raise WrongSizeType
@@ -1017,69 +4479,160 @@ class WrappedFtxClient(WrappedGenericExchange):
         size = float(size)
 
         # Parsing size with market minimum order size
-        precision, minimum = self.get_precision(market)
-        # precision of the market ( number of digits after the decimal point)
-        digits = int(math.sqrt((int(math.log10(precision)) + 1) ** 2)) + 1
+        rules = self.get_market_rules(market)
         # Apply the precision
-        size = truncate(size, digits)
+        size = rules.round_amount(size)
         # Apply the minimum
-        if size < minimum:
+        if size < rules.amount_min:
             return 0
 
         return size
 
     @only_authenticated
     @only_implemented_types
-    def close_future_position(self, market: str, limit_price: (int, float, NoneType) = None):
+    def close_future_position(self, market: str, limit_price: (int, float, NoneType) = None,
+                              position: (dict, NoneType) = None) -> dict:
         """
         Completly close any open position in a future market
         :param market: future market, ( e.g "BTC-PERP" )
         :param limit_price: If you want to close your position with a limit order, fill this parameter with limit price
+        :param position: the position as returned by get_position() or get_positions(), if you already have it the
+        position is not fetched again
+        :return: the order as a dict
         """
 
-        position = self.get_position(market)
+        if position is None:
+            position = self.get_position(market)
+        size = float(position['size'] or 0)
+        if size <= 0:
+            return {}
+        side = "buy" if position["side"] == "sell" else "sell"
         if limit_price is not None:
-            self.post_limit_order(market, "buy" if position["side"] == "sell" else "sell", float(position['size']),
-                                  limit_price, params={"reduceOnly": True})
+            order = self.post_limit_order(market, side, size, limit_price, params={"reduceOnly": True})
         else:
-            self.post_market_order(market, "buy" if position["side"] == "sell" else "sell", float(position['size']),
-                                   params={"reduceOnly": True})
+            order = self.post_market_order(market, side, size, params={"reduceOnly": True})
+        self.position_cache.pop(market, None)
+
+        return order
+
+    @only_authenticated
+    @only_implemented_types
+    def close_all_positions(self, limit_prices: (dict, NoneType) = None, markets: (list, NoneType) = None,
+                            max_workers: int = 10) -> dict:
+        """
+        Close every open position from a single positions snapshot, reduce only orders are sent concurrently
+        :param limit_prices: {market: limit price} for the positions you want to close with a limit order, the
+        others are closed with a market order
+        :param markets: only close positions on these markets, None for every market
+        :param max_workers: max number of orders sent at the same time
+        :return: a dict {market: order} (or {market: exception} if the order failed)
+        """
+        if limit_prices is None:
+            limit_prices = {}
+
+        positions = self.get_positions()
+        if markets is not None:
+            positions = {market: position for market, position in positions.items() if market in markets}
+        results = {}
+
+        def close(_market, _position):
+            try:
+                results[_market] = self.close_future_position(_market, limit_prices.get(_market), position=_position)
+            except BaseException as exception:  # EZXT exceptions inherit BaseException
+                results[_market] = exception
+
+        items = list(positions.items())
+        for i in range(0, len(items), max_workers):
+            threads = [threading.Thread(target=close, args=item) for item in items[i:i + max_workers]]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        return results
 
     # Private API - Stuff
 
     @only_authenticated
+    @retry_request
     @only_implemented_types
-    def get_account_data(self) -> dict:
+    def get_account_data(self, max_age: (int, float, NoneType) = None) -> dict:
         """
-        Recover some account informations
-        :return: a dict with the following keys: AccountIdentifier, collateral, totalAccountValue
+        Recover some account informations, the response is cached for a short time (self.account_ttl) and dropped each
+        time one of our orders is sent or cancelled
+        :param max_age: max age in seconds of the cached data, None to use self.account_ttl, 0 to force a request
+        :return: a dict with the following keys: AccountIdentifier, collateral, totalAccountValue, freeCollateral,
+        leverage
         """
+        if max_age is None:
+            max_age = self.account_ttl
+        if self.account_cache is not None and time.time() - self.account_cache_time < max_age:
+            self.__count_cache__("account", True)
+            return self.account_cache
+        self.__count_cache__("account", False)
+
         response = self.client.private_get_account()['result']
         data = {'accountIdentifier': response['accountIdentifier'],
                 'collateral': response['collateral'],
-                'totalAccountValue': response['totalAccountValue']}
+                'totalAccountValue': response['totalAccountValue'],
+                'freeCollateral': response.get('freeCollateral'),
+                'leverage': response.get('leverage')}
+        self.account_cache = data
+        self.account_cache_time = time.time()
 
         return data
 
+    # Override
+    def __on_order_sent__(self):
+        """
+        Called each time an order is sent or cancelled, drop cached account state changed by our own orders
+        """
+        super().__on_order_sent__()
+        self.account_cache = None
+
     @only_authenticated
     @only_implemented_types
-    def get_total_account_value(self) -> float:
+    def get_total_account_value(self, max_age: (int, float, NoneType) = None) -> float:
         """
         Get total account value
+        :param max_age: max age in seconds of the cached account data, look at get_account_data()
         :return: total account value as a float
         """
 
-        return float(self.get_account_data()['totalAccountValue'])
+        return float(self.get_account_data(max_age)['totalAccountValue'])
 
     @only_authenticated
     @only_implemented_types
-    def get_total_collateral(self) -> float:
+    def get_total_collateral(self, max_age: (int, float, NoneType) = None) -> float:
         """
         Get total account collateral
+        :param max_age: max age in seconds of the cached account data, look at get_account_data()
         :return: total account collateral as a float
         """
 
-        return float(self.get_account_data()['collateral'])
+        return float(self.get_account_data(max_age)['collateral'])
+
+    @only_authenticated
+    @only_implemented_types
+    def get_free_collateral(self, max_age: (int, float, NoneType) = None) -> float:
+        """
+        Get free account collateral
+        :param max_age: max age in seconds of the cached account data, look at get_account_data()
+        :return: free account collateral as a float
+        """
+
+        return float(self.get_account_data(max_age)['freeCollateral'] or 0)
+
+    @only_authenticated
+    @only_implemented_types
+    def get_leverage(self, max_age: (int, float, NoneType) = None) -> float:
+        """
+        Get the max leverage of the account
+        :param max_age: max age in seconds of the cached account data, look at get_account_data()
+        :return: account leverage as a float
+        """
+
+        return float(self.get_account_data(max_age)['leverage'] or 0)
 
 
 class WrappedBinanceClient(WrappedGenericExchange):
@@ -1097,3 +4650,1004 @@ class WrappedBinanceClient(WrappedGenericExchange):
         :return:
         """
         self.client.set_sandbox_mode(True)
+
+
+'''
+Replay exchange
+'''
+
+
+# Offline ccxt-like exchange (e.g. WrappedGenericExchange(ReplayExchange.configure(latency=0.01)))
+class ReplayExchange:
+    """
+    Network-free stand-in for a ccxt exchange class, to run and benchmark the wrapper deterministically.
+    Serves recorded or synthetic markets, tickers, OHLCV pages and balances and simulates the order lifecycle (market
+    orders fill at once, limit orders fill when marketable or after fill_delay seconds, trigger orders stay open and
+    reserve nothing), with configurable latency, rate limit and error injection. Every call is counted in self.calls.
+    Use ReplayExchange.configure() to get a configured class since wrapped clients instantiate the class themselves.
+    """
+    # Default options, look at configure()
+    options = {'symbols': ("BTC/USDT", "ETH/USDT"), 'markets': None, 'tickers': None, 'ohlcv': None,
+               'balances': None, 'ohlcv_limit': 1000, 'latency': 0., 'jitter': 0., 'rate_limit': None,
+               'retry_after': 1, 'error_rate': 0., 'errors': None, 'fill_delay': None, 'seed': 0, 'now': None,
+               'trades': None, 'trades_limit': 1000, 'trade_interval': 1000}
+    precisionMode = PrecisionMode.TICK_SIZE
+
+    @classmethod
+    def configure(cls, **options) -> type:
+        """
+        Return a ReplayExchange class with some options changed
+        :param options:
+        - symbols: symbols of the synthetic markets
+        - markets: recorded ccxt markets {symbol: market}, replace the synthetic ones
+        - tickers: recorded tickers {symbol: {'bid', 'ask', 'last'}}, synthetic prices are used for the others
+        - ohlcv: recorded candles {(symbol, timeframe): dataframe or list of [timestamp, o, h, l, c, v]}
+        - balances: initial balances {token: amount}, 1 BTC & 100 000 USDT by default
+        - ohlcv_limit: max number of candles returned by fetch_ohlcv
+        - latency, jitter: seconds slept by every call (latency + random jitter)
+        - rate_limit: max number of calls per second, RateLimitExceeded is raised above, None for no limit
+        - retry_after: Retry-After header sent with a RateLimitExceeded error
+        - error_rate: probability of a call to raise an error picked in errors
+        - errors: error classes injected randomly, ccxt.NetworkError & ccxt.RequestTimeout by default
+        - fill_delay: seconds after which a non marketable limit order is filled, None to never fill it
+        - seed: random seed of the synthetic prices & of the error injection
+        - now: fixed current timestamp in ms, None to use the clock
+        - trades: recorded trades {symbol: list of ccxt trades sorted by timestamp}
+        - trades_limit: max number of trades returned by fetch_trades
+        - trade_interval: ms between two synthetic trades (one trade at a random time in each interval)
+        :return: a subclass of ReplayExchange
+        """
+        unknown = set(options) - set(cls.options)
+        if unknown:
+            raise ValueError(f"unknown ReplayExchange options: {', '.join(sorted(unknown))}")
+        return type(cls.__name__, (cls,), {'options': dict(cls.options, **options)})
+
+    def __init__(self, config: (dict, NoneType) = None):
+        """
+        :param config: ccxt config (apiKey, secret, enableRateLimit...), only kept as attributes
+        """
+        config = config or {}
+        self.apiKey = config.get('apiKey')
+        self.secret = config.get('secret')
+        self.enableRateLimit = config.get('enableRateLimit', True)
+        self.headers = config.get('headers', {})
+        self.id = "replay"
+        self.random = random.Random(self.options['seed'])
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.call_times = deque()
+        self.injected = deque()  # errors raised by the next calls, look at fail_next()
+        self.last_response_headers = {}
+        self.markets = None
+        self.has = {'fetchTicker': True, 'fetchTickers': True, 'fetchOHLCV': True, 'fetchBalance': True,
+                    'createOrder': True, 'createMarketOrder': True, 'createLimitOrder': True,
+                    'createStopOrder': True, 'createTakeProfitOrder': True, 'cancelOrder': True,
+                    'fetchOrder': True, 'fetchOrders': True, 'fetchOpenOrders': True, 'fetchMyTrades': True,
+                    'fetchPositions': True, 'fetchTrades': True, 'fetchFundingRateHistory': True,
+                    'fetchOpenInterestHistory': True}
+        balances = self.options['balances'] or {'BTC': 1., 'USDT': 100000.}
+        self.balances = {token: {'free': float(amount), 'used': 0., 'total': float(amount)}
+                         for token, amount in balances.items()}
+        self.orders = {}
+        self.open_orders = {}  # open limit orders, checked for fills on every order call
+        self.trades = []
+        self.next_id = 1
+
+    # Simulation
+
+    def request(self, path: str, api: str = 'public', method: str = 'GET', params: (dict, NoneType) = None,
+                headers: (dict, NoneType) = None, body: (str, NoneType) = None, config: (dict, NoneType) = None):
+        """
+        Simulated http request of every endpoint: count the call, sleep the latency and raise injected or rate limit
+        errors (named request like the ccxt method so the endpoint metrics work offline)
+        """
+        name = path
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            error = self.injected.popleft() if self.injected else None
+            if error is None and self.options['error_rate'] and self.random.random() < self.options['error_rate']:
+                errors = self.options['errors'] or (ccxt.NetworkError, ccxt.RequestTimeout)
+                error = self.random.choice(errors)(f"replay: injected error on {name}")
+            limited = False
+            if self.options['rate_limit'] is not None:
+                now = time.monotonic()
+                while self.call_times and now - self.call_times[0] > 1:
+                    self.call_times.popleft()
+                limited = len(self.call_times) >= self.options['rate_limit']
+                if not limited:
+                    self.call_times.append(now)
+            jitter = self.random.random() * self.options['jitter'] if self.options['jitter'] else 0.
+        if self.options['latency'] or jitter:
+            time.sleep(self.options['latency'] + jitter)
+        if limited:
+            self.last_response_headers = {'Retry-After': str(self.options['retry_after'])}
+            raise ccxt.RateLimitExceeded(f"replay: rate limit of {self.options['rate_limit']} calls/s reached")
+        self.last_response_headers = {}
+        if error is not None:
+            raise error
+
+    def fail_next(self, error: BaseException, count: int = 1):
+        """
+        Make the next calls raise an error
+        :param error: the exception raised
+        :param count: number of calls raising it
+        """
+        with self.lock:
+            self.injected.extend([error] * count)
+
+    def milliseconds(self) -> int:
+        return self.options['now'] if self.options['now'] is not None else int(time.time() * 1000)
+
+    def __price__(self, symbol: str, timestamps: np.ndarray) -> np.ndarray:
+        """
+        Deterministic synthetic price of a symbol at some timestamps
+        """
+        base = 100. + sum(map(ord, symbol)) * 37 % 50000
+        steps = timestamps / 60000.
+        noise = np.modf(np.sin(steps * 12.9898 + self.options['seed']) * 43758.5453)[0]
+        return np.round(base * (1 + 0.05 * np.sin(steps / 1440.) + 0.002 * noise), 2)
+
+    def __fill_orders__(self):
+        """
+        Fill the open limit orders which are marketable or older than fill_delay
+        """
+        now = self.milliseconds()
+        tickers = {}
+        for order in list(self.open_orders.values()):
+            if order['symbol'] not in tickers:
+                tickers[order['symbol']] = self.fetch_ticker(order['symbol'], counted=False)
+            ticker = tickers[order['symbol']]
+            marketable = order['price'] is not None and (
+                order['price'] >= ticker['ask'] if order['side'] == 'buy' else order['price'] <= ticker['bid'])
+            delay = self.options['fill_delay']
+            if order['type'] == 'limit' and (marketable or (delay is not None
+                                                            and now - order['timestamp'] >= delay * 1000)):
+                self.__fill__(order, order['price'])
+
+    def __fill__(self, order: dict, price: float):
+        """
+        Fill an order entirely & update balances
+        """
+        base, quote = order['symbol'].split(":")[0].split("/")
+        for token in (base, quote):
+            self.balances.setdefault(token, {'free': 0., 'used': 0., 'total': 0.})
+        amount, cost = order['amount'], order['amount'] * price
+        spent, received = (quote, base) if order['side'] == 'buy' else (base, quote)
+        reserved = order.pop('reserved', 0.)
+        self.balances[spent]['used'] -= reserved
+        self.balances[spent]['free'] += reserved - (cost if order['side'] == 'buy' else amount)
+        self.balances[received]['free'] += amount if order['side'] == 'buy' else cost
+        for token in (base, quote):
+            self.balances[token]['total'] = self.balances[token]['free'] + self.balances[token]['used']
+        trade = {'id': f"t{len(self.trades) + 1}", 'order': order['id'], 'symbol': order['symbol'],
+                 'side': order['side'], 'price': price, 'amount': amount, 'cost': cost,
+                 'timestamp': self.milliseconds()}
+        self.trades.append(trade)
+        self.open_orders.pop(order['id'], None)
+        order.update({'status': 'closed', 'filled': amount, 'remaining': 0., 'average': price, 'cost': cost,
+                      'trades': [trade]})
+        order['info']['status'] = 'closed'
+
+    def __snapshot__(self, order: dict) -> dict:
+        order = dict(order, info=dict(order['info']), trades=list(order.get('trades') or []))
+        order.pop('reserved', None)
+        return order
+
+    # ccxt public API
+
+    def load_markets(self, reload: bool = False, params: (dict, NoneType) = None) -> dict:
+        if self.markets is None or reload:  # like ccxt, markets are only requested once
+            self.request('load_markets')
+            if self.options['markets'] is not None:
+                self.markets = dict(self.options['markets'])
+            else:
+                self.markets = {}
+                for symbol in self.options['symbols']:
+                    base, quote = symbol.split(":")[0].split("/")
+                    self.markets[symbol] = {
+                        'id': symbol.replace("/", ""), 'symbol': symbol, 'base': base, 'quote': quote,
+                        'type': 'spot', 'spot': True, 'active': True,
+                        'precision': {'amount': 0.0001, 'price': 0.01},
+                        'limits': {'amount': {'min': 0.0001, 'max': 10000.}, 'price': {'min': 0.01, 'max': None},
+                                   'cost': {'min': 1., 'max': None}}}
+        return self.markets
+
+    def market(self, symbol: str) -> dict:
+        if self.markets is None:
+            self.load_markets()
+        if symbol not in self.markets:
+            raise ccxt.BadSymbol(f"replay does not have market symbol {symbol}")
+        return self.markets[symbol]
+
+    def fetch_ticker(self, symbol: str, params: (dict, NoneType) = None, counted: bool = True) -> dict:
+        if counted:
+            self.request('fetch_ticker')
+        self.market(symbol)
+        recorded = (self.options['tickers'] or {}).get(symbol)
+        if recorded is not None:
+            return dict(recorded, symbol=symbol)
+        now = self.milliseconds()
+        steps = now // 60000  # same price as the last 1m candle of __price__(), without numpy for a single value
+        noise = math.modf(math.sin(steps * 12.9898 + self.options['seed']) * 43758.5453)[0]
+        base = 100. + sum(map(ord, symbol)) * 37 % 50000
+        last = round(base * (1 + 0.05 * math.sin(steps / 1440.) + 0.002 * noise), 2)
+        return {'symbol': symbol, 'timestamp': now, 'bid': round(last - 0.01, 2), 'ask': round(last + 0.01, 2),
+                'last': last}
+
+    def fetch_tickers(self, symbols: (list, NoneType) = None, params: (dict, NoneType) = None) -> dict:
+        self.request('fetch_tickers')
+        if self.markets is None:
+            self.load_markets()
+        return {symbol: self.fetch_ticker(symbol, counted=False) for symbol in (symbols or list(self.markets))}
+
+    def fetch_ohlcv(self, symbol: str, timeframe: str = '1m', since: (int, NoneType) = None,
+                    limit: (int, NoneType) = None, params: (dict, NoneType) = None, counted: bool = True) -> list:
+        if counted:
+            self.request('fetch_ohlcv')
+        self.market(symbol)
+        step = timeframe_to_ms(timeframe)
+        limit = self.options['ohlcv_limit'] if limit is None else min(limit, self.options['ohlcv_limit'])
+        recorded = (self.options['ohlcv'] or {}).get((symbol, timeframe))
+        if recorded is not None:
+            rows = recorded.values.tolist() if isinstance(recorded, pd.DataFrame) else list(recorded)
+            rows = [row for row in rows if since is None or row[0] >= since]
+            return [list(row) for row in rows[:limit]]
+        now = self.milliseconds() // step * step
+        start = now - (limit - 1) * step if since is None else -(-since // step) * step
+        timestamps = np.arange(start, min(start + limit * step, now + step), step, dtype=np.int64)
+        if not len(timestamps):
+            return []
+        opens = self.__price__(symbol, timestamps)
+        closes = self.__price__(symbol, timestamps + step - 60000)
+        highs = np.maximum(opens, closes) + 0.5
+        lows = np.minimum(opens, closes) - 0.5
+        volumes = np.round(np.abs(np.modf(opens * 7.13)[0]) * 100, 4)
+        return [[int(t), float(o), float(h), float(l), float(c), float(v)]
+                for t, o, h, l, c, v in zip(timestamps, opens, highs, lows, closes, volumes)]
+
+    def fetch_trades(self, symbol: str, since: (int, NoneType) = None, limit: (int, NoneType) = None,
+                     params: (dict, NoneType) = None) -> list:
+        self.request('fetch_trades')
+        self.market(symbol)
+        params = params or {}
+        limit = self.options['trades_limit'] if limit is None else min(limit, self.options['trades_limit'])
+        recorded = (self.options['trades'] or {}).get(symbol)
+        if recorded is not None:
+            trades = [trade for trade in recorded if (since is None or trade['timestamp'] >= since)
+                      and ('fromId' not in params or int(trade['id']) >= int(params['fromId']))]
+            return [dict(trade) for trade in trades[:limit]]
+        # trade k happens at a random time of [k * interval, (k + 1) * interval), its id is k
+        interval = self.options['trade_interval']
+        now = self.milliseconds()
+        if 'fromId' in params:
+            first = int(params['fromId'])
+        elif since is not None:
+            first = since // interval
+        else:
+            first = now // interval - limit
+        ids = np.arange(first, first + limit + 1, dtype=np.int64)
+        random_parts = np.modf(np.abs(np.sin(ids * 78.233 + self.options['seed']) * 43758.5453))[0]
+        timestamps = ids * interval + (random_parts * interval).astype(np.int64)
+        keep = (timestamps <= now) & (timestamps >= (since if since is not None and 'fromId' not in params else 0))
+        ids, random_parts, timestamps = ids[keep][:limit], random_parts[keep][:limit], timestamps[keep][:limit]
+        prices = np.round(self.__price__(symbol, timestamps) + (random_parts - 0.5) * 2, 2)
+        amounts = np.round(random_parts * 0.5 + 0.0001, 4)
+        return [{'id': str(i), 'symbol': symbol, 'timestamp': int(t), 'price': float(p), 'amount': float(a),
+                 'side': 'buy' if r >= 0.5 else 'sell'}
+                for i, t, p, a, r in zip(ids, timestamps, prices, amounts, random_parts)]
+
+    def fetch_funding_rate_history(self, symbol: (str, NoneType) = None, since: (int, NoneType) = None,
+                                   limit: (int, NoneType) = None, params: (dict, NoneType) = None) -> list:
+        self.request('fetch_funding_rate_history')
+        self.market(symbol)
+        rows = self.fetch_ohlcv(symbol, '8h', since, limit, counted=False)
+        return [{'symbol': symbol, 'timestamp': row[0], 'fundingRate': round((row[4] - row[1]) / row[1] / 10, 8)}
+                for row in rows]
+
+    def fetch_open_interest_history(self, symbol: str, timeframe: str = '1h', since: (int, NoneType) = None,
+                                    limit: (int, NoneType) = None, params: (dict, NoneType) = None) -> list:
+        self.request('fetch_open_interest_history')
+        self.market(symbol)
+        rows = self.fetch_ohlcv(symbol, timeframe, since, limit, counted=False)
+        return [{'symbol': symbol, 'timestamp': row[0], 'openInterestAmount': round(row[5] * 1000, 4),
+                 'openInterestValue': round(row[5] * 1000 * row[4], 2)} for row in rows]
+
+    # ccxt private API
+
+    def fetch_balance(self, params: (dict, NoneType) = None) -> dict:
+        self.request('fetch_balance')
+        with self.lock:
+            self.__fill_orders__()
+            balances = {token: dict(balance) for token, balance in self.balances.items()}
+        balances['free'] = {token: balance['free'] for token, balance in self.balances.items()}
+        balances['used'] = {token: balance['used'] for token, balance in self.balances.items()}
+        balances['total'] = {token: balance['total'] for token, balance in self.balances.items()}
+        return balances
+
+    def create_order(self, symbol: str, type: str, side: str, amount: float, price: (float, NoneType) = None,
+                     params: (dict, NoneType) = None) -> dict:
+        self.request('create_order')
+        params = params or {}
+        market = self.market(symbol)
+        if side not in ('buy', 'sell'):
+            raise ccxt.InvalidOrder(f"replay: wrong side {side}")
+        if amount < (market['limits']['amount']['min'] or 0):
+            raise ccxt.InvalidOrder(f"replay: amount {amount} below the minimum")
+        trigger = params.get('stopPrice', params.get('triggerPrice'))
+        if price is None and type != 'market':
+            price = trigger
+        with self.lock:
+            ticker = self.fetch_ticker(symbol, counted=False)
+            base, quote = symbol.split(":")[0].split("/")
+            spent = quote if side == 'buy' else base
+            needed = amount * (price if price is not None else ticker['ask']) if side == 'buy' else amount
+            balance = self.balances.setdefault(spent, {'free': 0., 'used': 0., 'total': 0.})
+            reserve = type in ('market', 'limit') and market.get('spot', True) and not params.get('reduceOnly')
+            if reserve and needed > balance['free'] + 1e-12:
+                raise ccxt.InsufficientFunds(f"replay: {needed} {spent} needed, {balance['free']} available")
+            order_id = str(self.next_id)
+            self.next_id += 1
+            now = self.milliseconds()
+            order = {'id': order_id, 'clientOrderId': params.get('clientOrderId'), 'symbol': symbol, 'type': type,
+                     'side': side, 'price': price, 'amount': float(amount), 'filled': 0., 'remaining': float(amount),
+                     'cost': 0., 'average': None, 'status': 'open', 'timestamp': now, 'trades': [],
+                     'stopPrice': trigger, 'reduceOnly': bool(params.get('reduceOnly')),
+                     'info': {'id': order_id, 'status': 'open', 'type': type}}
+            if reserve:
+                order['reserved'] = needed
+                balance['free'] -= needed
+                balance['used'] += needed
+            self.orders[order_id] = order
+            if type == 'limit':
+                self.open_orders[order_id] = order
+            if type == 'market':
+                self.__fill__(order, ticker['ask'] if side == 'buy' else ticker['bid'])
+            else:
+                self.__fill_orders__()
+            return self.__snapshot__(order)
+
+    def cancel_order(self, id: str, symbol: (str, NoneType) = None, params: (dict, NoneType) = None) -> dict:
+        self.request('cancel_order')
+        with self.lock:
+            order = self.orders.get(str(id))
+            if order is None:
+                raise ccxt.OrderNotFound(f"replay: order {id} not found")
+            if order['status'] != 'open':
+                raise ccxt.InvalidOrder(f"replay: order {id} is {order['status']}")
+            base, quote = order['symbol'].split(":")[0].split("/")
+            spent = quote if order['side'] == 'buy' else base
+            reserved = order.pop('reserved', 0.)
+            self.balances[spent]['free'] += reserved
+            self.balances[spent]['used'] -= reserved
+            order['status'] = order['info']['status'] = 'canceled'
+            self.open_orders.pop(order['id'], None)
+            return self.__snapshot__(order)
+
+    def fetch_order(self, id: str, symbol: (str, NoneType) = None, params: (dict, NoneType) = None) -> dict:
+        self.request('fetch_order')
+        with self.lock:
+            self.__fill_orders__()
+            if str(id) not in self.orders:
+                raise ccxt.OrderNotFound(f"replay: order {id} not found")
+            return self.__snapshot__(self.orders[str(id)])
+
+    def fetch_orders(self, symbol: (str, NoneType) = None, since: (int, NoneType) = None,
+                     limit: (int, NoneType) = None, params: (dict, NoneType) = None) -> list:
+        self.request('fetch_orders')
+        with self.lock:
+            self.__fill_orders__()
+            orders = [self.__snapshot__(order) for order in self.orders.values()
+                      if (symbol is None or order['symbol'] == symbol)
+                      and (since is None or order['timestamp'] >= since)]
+        return orders[:limit] if limit is not None else orders
+
+    def fetch_open_orders(self, symbol: (str, NoneType) = None, since: (int, NoneType) = None,
+                          limit: (int, NoneType) = None, params: (dict, NoneType) = None) -> list:
+        self.request('fetch_open_orders')
+        with self.lock:
+            self.__fill_orders__()
+            orders = [self.__snapshot__(order) for order in self.orders.values() if order['status'] == 'open'
+                      and (symbol is None or order['symbol'] == symbol)
+                      and (since is None or order['timestamp'] >= since)]
+        return orders[:limit] if limit is not None else orders
+
+    def fetch_my_trades(self, symbol: (str, NoneType) = None, since: (int, NoneType) = None,
+                        limit: (int, NoneType) = None, params: (dict, NoneType) = None) -> list:
+        self.request('fetch_my_trades')
+        trades = [dict(trade) for trade in self.trades if (symbol is None or trade['symbol'] == symbol)
+                  and (since is None or trade['timestamp'] >= since)]
+        return trades[:limit] if limit is not None else trades
+
+    def fetch_positions(self, symbols: (list, NoneType) = None, params: (dict, NoneType) = None) -> list:
+        self.request('fetch_positions')
+        return []
+
+    def load_accounts(self, reload: bool = False, params: (dict, NoneType) = None) -> list:
+        self.request('load_accounts')
+        return [{'id': 'replay', 'type': 'main'}]
+
+    def set_sandbox_mode(self, enabled: bool):
+        pass
+
+
+'''
+Quote aggregator
+'''
+
+
+# Normalise a symbol written as "btc-usdt", "BTC_USDT" or "BTC/USDT" to the ccxt unified form
+def normalize_symbol(symbol: str) -> str:
+    """
+    :param symbol: market symbol
+    :return: upper case symbol with "/" between the base & the quote (unchanged when no separator is found)
+    """
+    symbol = symbol.strip().upper()
+    if "/" not in symbol:
+        for separator in ("-", "_"):
+            if separator in symbol:
+                return symbol.replace(separator, "/", 1)
+    return symbol
+
+
+# Best bid & ask of a set of symbols across several exchanges
+class QuoteAggregator:
+    """
+    Fetch the tickers of several wrapped clients concurrently (one thread and, when the exchange supports it, one
+    batched request per venue) and consolidate them in a best bid / best ask table, with the timestamp & the latency
+    of each venue. A full refresh takes about the round trip of the slowest venue.
+    """
+
+    def __init__(self, wrapped_clients: (dict, list, tuple), symbol_map: (dict, NoneType) = None,
+                 max_age: (int, float, NoneType) = None, max_workers: int = 20):
+        """
+        :param wrapped_clients: {venue name: wrapped client} or a list of wrapped clients (named by ccxt id)
+        :param symbol_map: {venue: {symbol: venue symbol}} for the symbols which can't be matched automatically
+        :param max_age: quotes older than max_age seconds are ignored by the best bid / ask, None to keep them all
+        :param max_workers: max number of ticker requests sent at the same time to a venue which can't batch them
+        """
+        if not isinstance(wrapped_clients, dict):
+            named = {}
+            for wrapped_client in wrapped_clients:
+                name = getattr(wrapped_client.client, 'id', None) or wrapped_client.exchange.__name__.lower()
+                count = sum(1 for venue in named if venue == name or venue.startswith(name + "#"))
+                named[name if not count else f"{name}#{count + 1}"] = wrapped_client
+            wrapped_clients = named
+        self.wrapped_clients = wrapped_clients
+        self.symbol_map = symbol_map or {}
+        self.max_age = max_age
+        self.max_workers = max_workers
+        self.resolved = {}  # {venue: (markets, {symbol: venue symbol or None}, {(base, quote): venue symbol})}
+        self.venues = {}  # {venue: {'latency', 'received', 'error'}} of the last refresh
+        self.quotes = {}  # last consolidated table, look at refresh()
+
+    def resolve(self, venue: str, symbols: list) -> dict:
+        """
+        Match normalised symbols with the markets of a venue: symbol_map first, then the unified symbol, then the
+        base & quote of the markets (spot markets first)
+        :param venue: name of the venue
+        :param symbols: normalised symbols
+        :return: {symbol: venue symbol}, symbols not listed on the venue are left out
+        """
+        client = self.wrapped_clients[venue].client
+        if client.markets is None:
+            client.load_markets()
+        markets, cached, pairs = self.resolved.get(venue, (None, {}, {}))
+        if markets is not client.markets:  # first call or markets reloaded
+            cached, pairs = {}, {}
+            for symbol, market in client.markets.items():
+                pair = (market.get('base'), market.get('quote'))
+                if pair not in pairs or (market.get('spot') and not client.markets[pairs[pair]].get('spot')):
+                    pairs[pair] = symbol
+            self.resolved[venue] = (client.markets, cached, pairs)
+        overrides = self.symbol_map.get(venue, {})
+        resolved = {}
+        for symbol in symbols:
+            if symbol not in cached:
+                if symbol in overrides:
+                    cached[symbol] = overrides[symbol]
+                elif symbol in client.markets:
+                    cached[symbol] = symbol
+                else:
+                    base, _, quote = symbol.split(":")[0].partition("/")
+                    cached[symbol] = pairs.get((base, quote))
+            if cached[symbol] is not None:
+                resolved[symbol] = cached[symbol]
+        return resolved
+
+    def refresh(self, symbols: (list, tuple)) -> dict:
+        """
+        Fetch the tickers of every venue at the same time and consolidate them
+        :param symbols: symbols to quote, normalised with normalize_symbol()
+        :return: {symbol: {'bid', 'bid_venue', 'ask', 'ask_venue', 'spread', 'crossed',
+        'venues': {venue: {'symbol', 'bid', 'ask', 'last', 'timestamp', 'latency'}}}}, bid & ask are None when no venue
+        quotes the symbol
+        """
+        symbols = list(dict.fromkeys(normalize_symbol(symbol) for symbol in symbols))
+        responses = {}
+
+        def fetch(_venue):
+            start = time.perf_counter()
+            try:
+                resolved = self.resolve(_venue, symbols)
+                tickers = self.wrapped_clients[_venue].get_tickers(sorted(set(resolved.values())),
+                                                                   max_workers=self.max_workers)
+                received = int(time.time() * 1000)
+                responses[_venue] = (resolved, tickers)
+                self.venues[_venue] = {'latency': time.perf_counter() - start, 'received': received, 'error': None}
+            except BaseException as exception:  # EZXT exceptions inherit BaseException, a venue down is skipped
+                self.venues[_venue] = {'latency': time.perf_counter() - start, 'received': None, 'error': exception}
+
+        threads = [threading.Thread(target=fetch, args=(venue,)) for venue in self.wrapped_clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        now = int(time.time() * 1000)
+        quotes = {symbol: {'bid': None, 'bid_venue': None, 'ask': None, 'ask_venue': None, 'spread': None,
+                           'crossed': False, 'venues': {}} for symbol in symbols}
+        for venue in self.wrapped_clients:  # venues order, ties go to the first venue
+            if venue not in responses:
+                continue
+            resolved, tickers = responses[venue]
+            latency, received = self.venues[venue]['latency'], self.venues[venue]['received']
+            for symbol, venue_symbol in resolved.items():
+                ticker = tickers.get(venue_symbol)
+                if not ticker:
+                    continue
+                timestamp = ticker.get('timestamp') or received
+                quote = {'symbol': venue_symbol, 'bid': ticker.get('bid'), 'ask': ticker.get('ask'),
+                         'last': ticker.get('last'), 'timestamp': timestamp, 'latency': latency}
+                consolidated = quotes[symbol]
+                consolidated['venues'][venue] = quote
+                if self.max_age is not None and now - timestamp > self.max_age * 1000:
+                    continue
+                if quote['bid'] is not None and (consolidated['bid'] is None or quote['bid'] > consolidated['bid']):
+                    consolidated['bid'], consolidated['bid_venue'] = quote['bid'], venue
+                if quote['ask'] is not None and (consolidated['ask'] is None or quote['ask'] < consolidated['ask']):
+                    consolidated['ask'], consolidated['ask_venue'] = quote['ask'], venue
+        for consolidated in quotes.values():
+            if consolidated['bid'] is not None and consolidated['ask'] is not None:
+                consolidated['spread'] = consolidated['ask'] - consolidated['bid']
+                consolidated['crossed'] = consolidated['spread'] < 0  # arbitrage between two venues
+        self.quotes = quotes
+        return quotes
+
+    def get_table(self, quotes: (dict, NoneType) = None) -> "pd.DataFrame":
+        """
+        :param quotes: table returned by refresh(), None for the last one
+        :return: pandas dataframe indexed by symbol with the columns bid bid_venue ask ask_venue spread crossed venues
+        (number of venues quoting the symbol)
+        """
+        quotes = self.quotes if quotes is None else quotes
+        return pd.DataFrame.from_dict(
+            {symbol: {'bid': quote['bid'], 'bid_venue': quote['bid_venue'], 'ask': quote['ask'],
+                      'ask_venue': quote['ask_venue'], 'spread': quote['spread'], 'crossed': quote['crossed'],
+                      'venues': len(quote['venues'])} for symbol, quote in quotes.items()},
+            orient="index", columns=['bid', 'bid_venue', 'ask', 'ask_venue', 'spread', 'crossed', 'venues'])
+
+
+'''
+Order scheduler
+'''
+
+
+# States of the parent orders of OrderScheduler
+class ParentState:
+    ACTIVE = "active"  # slices are being posted
+    DONE = "done"  # filled, or the rest is below the minimum amount of the market
+    PARTIAL = "partial"  # every slice & the catch-up slice of a twap were posted, the rest was not filled
+    CANCELED = "canceled"  # canceled by OrderScheduler.cancel()
+    ERROR = "error"  # a child order was rejected, look at the error of the parent
+
+
+# Parent order sliced by OrderScheduler
+class ParentOrder:
+    """
+    Plain record of a sliced order, OrderScheduler.get_parent() returns it as a dict
+    """
+    __slots__ = ('parent_id', 'market', 'side', 'kind', 'size', 'price', 'slices', 'interval', 'visible', 'start',
+                 'index', 'filled', 'state', 'child', 'children', 'due', 'cancel', 'error', 'updated')
+
+    def __init__(self, parent_id: int, market: str, side: str, kind: str, size: float, price: (float, NoneType),
+                 slices: int, interval: float, visible: (float, NoneType), start: float):
+        self.parent_id = parent_id
+        self.market = market
+        self.side = side
+        self.kind = kind  # "twap" or "iceberg"
+        self.size = size  # total size in currency 1
+        self.price = price  # limit price, None for the best bid (buy) or ask (sell) of each slice
+        self.slices = slices
+        self.interval = interval
+        self.visible = visible
+        self.start = start
+        self.index = 0  # next slice
+        self.filled = 0.  # filled by the closed children
+        self.state = ParentState.ACTIVE
+        self.child = None  # open child order
+        self.children = []  # ids of every child order
+        self.due = start  # time of the next event of the parent
+        self.cancel = False  # cancel requested
+        self.error = None
+        self.updated = start
+
+    def to_dict(self) -> dict:
+        return {name: list(self.children) if name == 'children' else getattr(self, name) for name in self.__slots__}
+
+
+# One event loop for many sliced orders
+class OrderScheduler:
+    """
+    Execute many sliced orders (TWAP & iceberg) from a single event loop: the events of the parents are kept in a
+    heap and a tick only handles the due parents, child orders are limit orders sized and priced with the market
+    rules, the status of every child of a market is polled with one open orders request, cancels are batched with
+    cancelOrders when the exchange has it and quotes with one tickers request. Every request goes through the wrapped
+    client and its rate limiter, request_rate caps the share of the scheduler.
+    A parent costs a heap entry and a small record, no thread. A tick only looks at the due parents and at the
+    parents with an open child, finished parents are moved to a bounded archive.
+    """
+
+    def __init__(self, wrapped_client, poll_interval: float = 1., request_rate: (float, NoneType) = None,
+                 keep_finished: int = 10000):
+        """
+        :param wrapped_client: authenticated WrappedGenericExchange sending the orders
+        :param poll_interval: seconds between two status polls of the open children
+        :param request_rate: max requests per second sent by the scheduler, None to only rely on the rate limiter
+        of the client
+        :param keep_finished: number of finished parents kept for get_parent(), the oldest ones are forgotten
+        """
+        self.wrapped_client = wrapped_client
+        self.poll_interval = poll_interval
+        self.request_rate = request_rate
+        self.keep_finished = keep_finished
+        self.parents = {}  # active parents
+        self.finished = OrderedDict()  # finished parents, oldest first
+        self.open_children = set()  # ids of the active parents with an open child
+        self.ids = itertools.count(1)
+        self.events = []  # heap of (time, sequence, parent_id)
+        self.sequence = itertools.count()
+        self.next_poll = 0.
+        self.last_request = 0.
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.thread = None
+        self.running = False
+        self.errors = deque(maxlen=100)  # errors of the polls (the parents are kept as they are)
+
+    # Slice an order in time
+    def submit_twap(self, market: str, side: str, size: (float, int), duration: (float, int), slices: int,
+                    price: (float, int, NoneType) = None, size_type: str = "currency_1_amount",
+                    start: (float, NoneType) = None) -> int:
+        """
+        Post slices child limit orders at regular intervals over duration, the unfilled part of a slice is canceled
+        at the next one and added to the following slices, the unfilled part of the last slice is posted again once
+        (catch-up slice, one more interval) and the parent ends as ParentState.PARTIAL if it is still not filled
+        :param market: example "BTC/USD"
+        :param side: "buy" or "sell"
+        :param size: total size, look at size_type
+        :param duration: seconds between the first slice and the end of the last one
+        :param slices: number of child orders
+        :param price: limit price of the children, None to post each child at the best bid (buy) or ask (sell)
+        :param size_type: look at WrappedGenericExchange.get_order_size()
+        :param start: time of the first slice (time.time()), None for now
+        :return: id of the parent order
+        """
+        return self.__submit__(market, side, "twap", size, size_type, price, slices, duration / slices, None, start)
+
+    # Show a part of an order at a time
+    def submit_iceberg(self, market: str, side: str, size: (float, int), visible_size: (float, int),
+                       price: (float, int, NoneType) = None, size_type: str = "currency_1_amount") -> int:
+        """
+        Post child limit orders of visible_size one after another, the next one when the previous one is closed
+        :param market: example "BTC/USD"
+        :param side: "buy" or "sell"
+        :param size: total size, look at size_type
+        :param visible_size: size of a child order in currency 1
+        :param price: limit price of the children, None to post each child at the best bid (buy) or ask (sell)
+        :param size_type: look at WrappedGenericExchange.get_order_size()
+        :return: id of the parent order
+        """
+        return self.__submit__(market, side, "iceberg", size, size_type, price, 0, 0., visible_size, None)
+
+    def __submit__(self, market: str, side: str, kind: str, size: (float, int), size_type: str,
+                   price: (float, int, NoneType), slices: int, interval: float, visible: (float, NoneType),
+                   start: (float, NoneType)) -> int:
+        rules = self.wrapped_client.get_market_rules(market)
+        if size_type == "currency_1_amount":  # no price nor balance needed
+            total = rules.round_amount(size)
+        else:
+            total = self.wrapped_client.get_order_size(market, side, size_type, size, price)
+        if price is not None:
+            price = rules.round_price(price, "floor" if side == "buy" else "ceil")  # never worse than the limit
+        with self.condition:
+            parent = ParentOrder(next(self.ids), market, side, kind, total, price, slices, interval, visible,
+                                 time.time() if start is None else start)
+            self.parents[parent.parent_id] = parent
+            heapq.heappush(self.events, (parent.due, next(self.sequence), parent.parent_id))
+            self.condition.notify_all()
+        return parent.parent_id
+
+    # Cancel a parent order
+    def cancel(self, parent_id: int):
+        """
+        Cancel the open child of a parent and stop slicing it, done by the next tick
+        :param parent_id: id returned by submit_twap() or submit_iceberg()
+        """
+        with self.condition:
+            if parent_id in self.finished:
+                return
+            parent = self.parents[parent_id]
+            if parent.state == ParentState.ACTIVE:
+                parent.cancel = True
+                parent.due = 0.
+                heapq.heappush(self.events, (0., next(self.sequence), parent_id))
+                self.condition.notify_all()
+
+    def get_parent(self, parent_id: int) -> dict:
+        """
+        :param parent_id: id returned by submit_twap() or submit_iceberg()
+        :return: the parent order as a dict (state, size, filled, child, children, error...), KeyError is raised when
+        the parent is unknown or finished and forgotten (look at keep_finished)
+        """
+        with self.lock:
+            parent = self.parents.get(parent_id) or self.finished[parent_id]
+            return parent.to_dict()
+
+    def get_parents(self, state: (str, NoneType) = None) -> list:
+        """
+        :param state: look at ParentState, None for every parent (the finished ones which are still kept)
+        :return: parent orders as dicts
+        """
+        with self.lock:
+            parents = self.parents.values() if state == ParentState.ACTIVE else \
+                itertools.chain(self.parents.values(), self.finished.values())
+            return [parent.to_dict() for parent in parents if state is None or parent.state == state]
+
+    # Process the due events
+    def run_pending(self, now: (float, NoneType) = None) -> int:
+        """
+        One tick of the event loop: cancel the children of the due parents, poll the open children, post the next
+        children. start() runs it in a thread, call it yourself to run the scheduler in your own loop.
+        :param now: current time (time.time()), None for now
+        :return: number of due parents handled
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            due = {}
+            while self.events and self.events[0][0] <= now:
+                _, _, parent_id = heapq.heappop(self.events)
+                parent = self.parents.get(parent_id)
+                if parent is not None and parent.due <= now:  # else a stale event
+                    due[parent_id] = parent
+            open_children = [self.parents[parent_id] for parent_id in self.open_children]
+
+        # 1 - poll the children, every child of a market with one request, before canceling the children of the
+        # due parents (most of them are closed already)
+        cancels = [parent for parent in due.values() if parent.child is not None
+                   and (parent.kind == "twap" or parent.cancel)]
+        if open_children and (now >= self.next_poll or cancels):
+            self.next_poll = now + self.poll_interval
+            for parent in self.__poll_children__(open_children):
+                if parent.kind == "iceberg":  # the next part of the iceberg is shown at once
+                    due[parent.parent_id] = parent
+
+        # 2 - cancel the children of the parents due for a new slice, or canceled
+        self.__cancel_children__([parent for parent in cancels if parent.child is not None])
+
+        # 3 - post the next children
+        posts = []
+        for parent in due.values():
+            if parent.child is not None:  # not closed yet, retried after the next poll
+                self.__schedule__(parent, now + self.poll_interval)
+            elif parent.cancel:
+                self.__finish__(parent, ParentState.CANCELED)
+            else:
+                posts.append(parent)
+        self.__post_children__(posts, now)
+        return len(due)
+
+    def __cancel_children__(self, parents: list):
+        """
+        Cancel the open children of parents, with one cancelOrders request per market when the exchange has it
+        """
+        client = self.wrapped_client.client
+        if client.has.get('cancelOrders') and len(parents) > 1:
+            markets = {}
+            for parent in parents:
+                markets.setdefault(parent.market, []).append(parent)
+            policy = self.wrapped_client.retry_policy or RetryPolicy(max_retries=0)
+            for market, market_parents in markets.items():
+                self.__spend__()
+                try:
+                    policy.call(client.cancel_orders, [parent.child['id'] for parent in market_parents], market,
+                                client=client, metrics=self.wrapped_client.metrics)
+                except BaseException as exception:  # some children were closed meanwhile, the poll resolves them
+                    self.errors.append(exception)
+            return  # the responses of cancelOrders rarely hold the filled amounts, the poll resolves the children
+        for parent in parents:
+            self.__spend__()
+            try:
+                self.__resolve__(parent, self.wrapped_client.cancel_order_by_id(parent.child['id'], parent.market))
+            except BaseException as exception:  # closed meanwhile, the poll resolves it
+                self.errors.append(exception)
+
+    def __poll_children__(self, parents: list) -> list:
+        """
+        Update the open children of parents
+        :return: parents whose child was closed
+        """
+        markets = {}
+        for parent in parents:
+            markets.setdefault(parent.market, []).append(parent)
+        closed = []
+        for market, market_parents in markets.items():
+            try:
+                self.__spend__()
+                open_ids = {order['id'] for order in self.wrapped_client.get_all_open_orders(market)}
+                missing = [parent for parent in market_parents if parent.child['id'] not in open_ids]
+                if not missing:
+                    continue
+                orders = {}
+                if self.wrapped_client.client.has.get('fetchOrders') and len(missing) > 1:
+                    self.__spend__()
+                    orders = {order['id']: order for order in self.wrapped_client.get_all_orders(market)}
+                for parent in missing:
+                    order = orders.get(parent.child['id'])
+                    if order is None:
+                        self.__spend__()
+                        order = self.wrapped_client.get_order(parent.child['id'], market)
+                    if self.__resolve__(parent, order):
+                        closed.append(parent)
+            except BaseException as exception:  # the market is polled again at the next poll
+                self.errors.append(exception)
+        return closed
+
+    def __resolve__(self, parent: ParentOrder, order: dict) -> bool:
+        """
+        Add the filled amount of a closed child to its parent
+        :return: True if the child is closed
+        """
+        if order.get('status') in (None, 'open'):
+            return False
+        with self.lock:
+            parent.filled += float(order.get('filled') or 0.)
+            parent.child = None
+            parent.updated = time.time()
+            self.open_children.discard(parent.parent_id)
+        return True
+
+    def __post_children__(self, parents: list, now: float):
+        """
+        Size, price & post the next child of each parent, quotes are fetched with one tickers request
+        """
+        sizes = {}
+        for parent in parents:
+            rules = self.wrapped_client.get_market_rules(parent.market)
+            remaining = rules.round_amount(parent.size - parent.filled, "nearest")
+            # the catch-up slice (index == slices) posts the whole rest
+            target = remaining / max(parent.slices - parent.index, 1) if parent.kind == "twap" else parent.visible
+            size = rules.round_amount(min(max(target, rules.amount_min or 0.), remaining))
+            if size <= 0 or size < (rules.amount_min or 0.):  # filled, or the rest can't be traded
+                self.__finish__(parent, ParentState.DONE)
+            elif parent.kind == "twap" and parent.index > parent.slices:  # the catch-up slice wasn't filled either
+                self.__finish__(parent, ParentState.PARTIAL)
+            else:
+                sizes[parent.parent_id] = size
+        parents = [parent for parent in parents if parent.parent_id in sizes]
+        quoted = sorted({parent.market for parent in parents if parent.price is None})
+        tickers = {}
+        if quoted:
+            self.__spend__()
+            try:
+                tickers = self.wrapped_client.get_tickers(quoted)
+            except BaseException as exception:  # the unquoted parents are retried after a poll interval
+                self.errors.append(exception)
+
+        for parent in parents:
+            price = parent.price
+            if price is None:
+                ticker = tickers.get(parent.market) or {}
+                price = ticker.get('bid' if parent.side == "buy" else 'ask')
+                if price is None:
+                    self.__schedule__(parent, now + self.poll_interval)
+                    continue
+            self.__spend__()
+            try:
+                order = self.wrapped_client.post_limit_order(parent.market, parent.side, sizes[parent.parent_id],
+                                                             price)
+            except BaseException as exception:  # the retry policy gave up or the order was rejected
+                with self.lock:
+                    parent.error = exception
+                self.__finish__(parent, ParentState.ERROR)
+                continue
+            with self.lock:
+                parent.child = order
+                parent.children.append(order['id'])
+                parent.updated = now
+                parent.index += 1
+                self.open_children.add(parent.parent_id)
+            filled = self.__resolve__(parent, order)
+            if parent.kind == "twap":
+                self.__schedule__(parent, parent.start + parent.index * parent.interval)
+            elif filled:  # filled at once, the next part is posted at the next tick
+                self.__schedule__(parent, now)
+
+    def __schedule__(self, parent: ParentOrder, due: float):
+        with self.condition:
+            parent.due = due
+            heapq.heappush(self.events, (due, next(self.sequence), parent.parent_id))
+            self.condition.notify_all()
+
+    def __finish__(self, parent: ParentOrder, state: str):
+        with self.condition:
+            parent.state = state
+            parent.updated = time.time()
+            self.open_children.discard(parent.parent_id)
+            self.finished[parent.parent_id] = self.parents.pop(parent.parent_id)
+            while len(self.finished) > self.keep_finished:
+                self.finished.popitem(last=False)
+            self.condition.notify_all()
+
+    def __spend__(self):
+        """
+        Wait for the request budget of the scheduler (request_rate)
+        """
+        if self.request_rate is None:
+            return
+        delay = self.last_request + 1 / self.request_rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.last_request = time.monotonic()
+
+    # Run the event loop in a thread
+    def start(self):
+        """
+        Run the event loop in a background thread until stop() is called
+        """
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.__run__, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the event loop thread, open children stay open
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __run__(self):
+        while self.running:
+            self.run_pending()
+            with self.condition:
+                if not self.running:
+                    break
+                wake = self.events[0][0] if self.events else None
+                if self.open_children:
+                    wake = self.next_poll if wake is None else min(wake, self.next_poll)
+                timeout = None if wake is None else max(0., wake - time.time())
+                self.condition.wait(timeout)
+
+    # Wait for parents to complete
+    def wait(self, parent_ids: (list, tuple, NoneType) = None, timeout: (float, NoneType) = None) -> bool:
+        """
+        Block until parents are not active anymore, the event loop must run in another thread (start())
+        :param parent_ids: ids of the parents, None for every parent
+        :param timeout: max seconds to wait, None for no limit
+        :return: True if every parent is finished (done, partial, canceled or in error)
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.condition:
+            while True:
+                active = self.parents if parent_ids is None else [i for i in parent_ids if i in self.parents]
+                if not active:
+                    return True
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
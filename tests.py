@@ -1,4 +1,14 @@
+import itertools
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
 import time
+
+import numpy as np
+import pandas as pd
+
 import ezxt
 from ezxt import Colors
 
@@ -38,7 +48,7 @@ class UnitTest:
         print(f"{Colors.GREEN}-> bid/ask test passed: {bid}/{ask}")
 
         # kline
-        kline = self.wrapped_client.get_kline(self.market, "1d", 1000)
+        kline = self.wrapped_client.get_kline(self.market, "1d", None, 1000)
         print(f"{Colors.GREEN}-> kline test passed: {kline}")
 
         # market
@@ -107,5 +117,479 @@ class UnitTest:
         print(f"{Colors.GREEN}✅ cancel orders")
 
 
-ut = UnitTest(ezxt.WrappedBinanceClient(), market="BTC/USDT")
-ut.public_test()
+def lazy_import_test():
+    """
+    Check, in a fresh interpreter, that the ticker & order paths work without importing pandas (nor ccxt on the replay
+    exchange, nor when an error is classified)
+    """
+    print(f"{Colors.PURPLE}| Lazy import test |")
+    code = ("import sys, ezxt\n"
+            "wrapped_client = ezxt.WrappedGenericExchange(ezxt.ReplayExchange.configure(fill_delay=0))\n"
+            "wrapped_client.authenticate_client('key', 'secret')\n"
+            "bid = wrapped_client.get_bid('BTC/USDT')\n"
+            "size = wrapped_client.get_order_size('BTC/USDT', 'buy', 'currency_2_percent', 10, bid)\n"
+            "order = wrapped_client.post_limit_order('BTC/USDT', 'buy', size, bid)\n"
+            "wrapped_client.get_order_status_by_object(order)\n"
+            "wrapped_client.post_market_order('BTC/USDT', 'sell', size)\n"
+            "wrapped_client.prepare_order('BTC/USDT', 'buy', 'limit').submit(size, bid)\n"
+            "ezxt.RetryPolicy.classify(ValueError())\n"
+            "print(','.join(name for name in ('pandas', 'ccxt') if name in sys.modules))\n")
+    imported = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    if imported:
+        raise AssertionError(f"the ticker & order paths imported {imported}")
+    print(f"{Colors.GREEN}✅ ticker & order paths without pandas")
+
+
+def rounding_test():
+    """
+    Check that the batch rounding of RoundingTable gives the same results as the exact rounding of MarketRules in the
+    three precision modes
+    """
+    print(f"{Colors.PURPLE}| Rounding test |")
+    rng = np.random.default_rng(0)
+    precisions = {ezxt.PrecisionMode.TICK_SIZE: [(1e-8, 0.01), (0.001, 0.5), (5, 1e-5)],
+                  ezxt.PrecisionMode.DECIMAL_PLACES: [(8, 2), (0, 1), (3, 4)],
+                  ezxt.PrecisionMode.SIGNIFICANT_DIGITS: [(5, 3), (8, 6), (1, 2)]}
+    for mode, steps in precisions.items():
+        table = ezxt.RoundingTable({f"M{i}/USDT": {'symbol': f"M{i}/USDT", 'precision': {'amount': amount,
+                                                                                        'price': price}}
+                                    for i, (amount, price) in enumerate(steps)}, mode)
+        markets = [f"M{i}/USDT" for i in rng.integers(0, len(steps), 3000)]
+        values = np.concatenate([rng.random(1000) * 10. ** rng.integers(-6, 9, 1000),
+                                 [round(value, int(digits)) for value, digits in
+                                  zip(rng.random(1000) * 100, rng.integers(0, 9, 1000))],
+                                 -rng.random(1000) * 1000])
+        values[:4] = [8.28, 9.8, 0.3, 1e300]
+        for rounding in ('down', 'up', 'floor', 'ceil', 'nearest'):
+            for kind in ('amount', 'price'):
+                batch = getattr(table, f"round_{kind}s")(markets, values, rounding)
+                exact = [getattr(table[market], f"round_{kind}")(value, rounding)
+                         for market, value in zip(markets, values)]
+                if not np.array_equal(batch, exact):
+                    raise AssertionError(f"round_{kind}s({rounding}) differs from MarketRules in mode {mode}")
+        print(f"{Colors.GREEN}✅ batch rounding == MarketRules (precision mode {mode})")
+
+
+def indicator_test():
+    """
+    Check that the indicators give the same values over the whole history at once and block by block (blocks shorter
+    than the windows included), in memory and through saved states
+    """
+    print(f"{Colors.PURPLE}| Indicator test |")
+    rng = np.random.default_rng(0)
+    close = 100 + np.cumsum(rng.normal(0, 1, 500))
+    candles = pd.DataFrame({'timestamp': np.arange(500, dtype=np.int64) * 60000, 'open': close,
+                            'high': close + rng.random(500), 'low': close - rng.random(500), 'close': close,
+                            'volume': rng.random(500) * 10})
+
+    def indicators():
+        return [ezxt.SMA(5), ezxt.EMA(10), ezxt.ATR(14), ezxt.VWAP(), ezxt.VWAP(20), ezxt.Returns(3),
+                ezxt.Returns(1, log=True)]
+
+    whole = ezxt.IndicatorEngine(indicators()).update(candles)
+    with tempfile.TemporaryDirectory() as directory:
+        engine = ezxt.IndicatorEngine(indicators())
+        for name, update in (("in memory", lambda _end: engine.append(candles.iloc[:_end])),
+                             ("saved states", lambda _end: ezxt.IndicatorEngine(
+                                 indicators(), os.path.join(directory, "series")).update(candles.iloc[:_end]))):
+            end, sizes = 0, itertools.cycle((1, 1, 2, 3, 1, 7, 40))
+            while end < len(candles):
+                end = min(end + next(sizes), len(candles))
+                blocks = update(end)
+            for column in whole.columns:
+                if not np.allclose(whole[column], blocks[column], equal_nan=True):
+                    raise AssertionError(f"{column}: the values computed block by block ({name}) differ")
+            print(f"{Colors.GREEN}✅ whole history == block by block ({name})")
+
+
+def backfill_queue_test():
+    """
+    Check the leases of the backfill queue (expiry, lost leases, max_attempts) on a temporary SQLite file, then run a
+    backfill on the replay exchange
+    """
+    print(f"{Colors.PURPLE}| Backfill queue test |")
+    with tempfile.TemporaryDirectory() as directory:
+        queue = ezxt.BackfillQueue(os.path.join(directory, "backfill.sqlite"), lease=0.2, max_attempts=2)
+        since = (int(time.time() * 1000) // 60000 - 3000) * 60000
+        if queue.add_jobs("BTC/USDT", "1m", since, since + 2500 * 60000, unit_candles=1000) != 3:
+            raise AssertionError("the job wasn't split in 3 units")
+        if queue.add_jobs("BTC/USDT", "1m", since, since + 2500 * 60000, unit_candles=1000) != 0:
+            raise AssertionError("a job added twice added units")
+        first, second = queue.lease_units("a", 2)
+        if len(queue.lease_units("b", 5)) != 1:
+            raise AssertionError("leased units were leased again")
+        if queue.complete(first['unit_id'], "b", 1000) or not queue.complete(first['unit_id'], "a", 1000):
+            raise AssertionError("a unit was completed by a worker without its lease")
+        print(f"{Colors.GREEN}✅ leases")
+
+        time.sleep(0.3)  # the leases of a on the second unit & of b expire
+        units = queue.lease_units("c", 5)
+        if [unit['unit_id'] for unit in units] != [second['unit_id'], second['unit_id'] + 1] or \
+                queue.complete(second['unit_id'], "a", 1000):
+            raise AssertionError("an expired lease wasn't leased again")
+        queue.fail(units[0]['unit_id'], "c", "error")
+        if queue.get_stats() != {'pending': 0, 'leased': 1, 'done': 1, 'failed': 1}:
+            raise AssertionError(f"a unit wasn't failed after max_attempts: {queue.get_stats()}")
+        print(f"{Colors.GREEN}✅ lease expiry & max_attempts")
+
+        queue.reset_failed()
+        time.sleep(0.3)
+        wrapped_client = ezxt.WrappedGenericExchange(ezxt.ReplayExchange.configure(ohlcv_limit=500))
+        path = os.path.join(directory, "")
+        result = wrapped_client.backfill(queue, path=path)  # the unit abandoned by b & c is failed, not leased
+        if result['units'] != 1 or queue.get_stats()['failed'] != 1:
+            raise AssertionError(f"wrong backfill: {result}, {queue.get_stats()}")
+        queue.reset_failed()
+        result = wrapped_client.backfill(queue, path=path)
+        candles = wrapped_client.load_backfill(queue, "BTC/USDT", "1m", path=path)
+        if result['units'] != 1 or len(candles) != 2500 or candles['timestamp'].diff().max() != 60000:
+            raise AssertionError(f"wrong backfill: {result}, {len(candles)} candles")
+        queue.close()
+        print(f"{Colors.GREEN}✅ backfill")
+
+
+def order_sizes_test():
+    """
+    Check the reason code of each leg sized by get_order_sizes() on the replay exchange, with and without fetchTickers
+    """
+    print(f"{Colors.PURPLE}| Order sizes test |")
+    tickers = {"BTC/USDT": {'bid': 20000., 'ask': 20000.02, 'last': 20000.01},
+               "ETH/USDT": {'bid': 2., 'ask': 2.02, 'last': 2.01},
+               "SOL/USDT": {'bid': None, 'ask': None, 'last': None}}
+    legs = [("BTC/USDT", "buy", "currency_2_amount", 100, ezxt.SizeReason.OK, 0.005),
+            ("BTC/USDT", "buy", "currency_1_amount", 0.00001, ezxt.SizeReason.BELOW_MINIMUM, 0),
+            ("ETH/USDT", "buy", "currency_1_amount", 0.1, ezxt.SizeReason.BELOW_MIN_COST, 0),
+            ("SOL/USDT", "buy", "currency_2_amount", 10, ezxt.SizeReason.NO_PRICE, 0),
+            ("ETH/USDT", "sell", "currency_1_percent", 50, ezxt.SizeReason.NO_BALANCE, 0),
+            ("BTC/USDT", "buy", "lots", 1, ezxt.SizeReason.WRONG_SIZE_TYPE, 0)]
+    markets, sides, size_types, sizes, expected_reasons, expected_sizes = map(list, zip(*legs))
+    for batched in (True, False):
+        wrapped_client = ezxt.WrappedGenericExchange(ezxt.ReplayExchange.configure(
+            symbols=("BTC/USDT", "ETH/USDT", "SOL/USDT"), tickers=tickers))
+        wrapped_client.authenticate_client("key", "secret")
+        wrapped_client.client.has['fetchTickers'] = batched
+        result, reasons = wrapped_client.get_order_sizes(markets, sides, size_types, sizes)
+        if reasons != expected_reasons or not np.allclose(result, expected_sizes):
+            raise AssertionError(f"wrong sizes: {list(zip(result, reasons))}")
+        calls = wrapped_client.client.calls
+        if batched and (calls.get('fetch_tickers') != 1 or calls.get('fetch_ticker')):
+            raise AssertionError(f"the tickers weren't fetched with one request: {calls}")
+        if not batched and (calls.get('fetch_tickers') or calls.get('fetch_ticker') != 3):
+            raise AssertionError(f"the tickers weren't fetched one by one: {calls}")
+        if calls.get('fetch_balance') != 1:
+            raise AssertionError(f"the balance wasn't fetched with one request: {calls}")
+        print(f"{Colors.GREEN}✅ reason codes ({'fetch_tickers' if batched else 'fetch_ticker'})")
+
+
+def series_test():
+    """
+    Load funding rates & open interest on the replay exchange: page limits of each series, -1 limit estimate,
+    incremental refresh of a saved series and alignment to candles
+    """
+    print(f"{Colors.PURPLE}| Series test |")
+    hour = 3600000
+    now = (int(time.time() * 1000) // (8 * hour) - 6) * 8 * hour
+    wrapped_client = ezxt.WrappedGenericExchange(ezxt.ReplayExchange.configure(ohlcv_limit=5000, now=now))
+    limits = {'fetch_funding_rate_history': [], 'fetch_open_interest_history': []}
+    for name in limits:  # the replay exchange caps nothing, the wrapper has to cap the pages of each series
+        def record(*args, _name=name, _fetch=getattr(wrapped_client.client, name), **kwargs):
+            limits[_name].append(kwargs['limit'])
+            return _fetch(*args, **kwargs)
+        setattr(wrapped_client.client, name, record)
+
+    funding = wrapped_client.load_funding_rates("BTC/USDT", now - 1199 * 8 * hour, 1200, output=False, path=None)
+    if len(funding) != 1200 or funding['timestamp'].diff().iloc[1:].ne(8 * hour).any() or \
+            max(limits['fetch_funding_rate_history']) > 1000:
+        raise AssertionError(f"wrong funding rates: {len(funding)} rows, limits {limits}")
+    funding = wrapped_client.load_funding_rates("BTC/USDT", now - 1199 * 8 * hour, -1, output=False, path=None)
+    if len(funding) != 1200 or max(limits['fetch_funding_rate_history']) > 1000:
+        raise AssertionError(f"wrong funding rates to now: {len(funding)} rows, limits {limits}")
+    print(f"{Colors.GREEN}✅ funding rates pages")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "")
+        since = now - 1500 * hour
+        interest = wrapped_client.load_open_interest("BTC/USDT", "1h", since, -1, output=False, path=path)
+        if len(interest) != 1501 or max(limits['fetch_open_interest_history']) > 500:
+            raise AssertionError(f"wrong open interest: {len(interest)} rows, limits {limits}")
+        wrapped_client.client.options['now'] = now + 10 * hour
+        del limits['fetch_open_interest_history'][:]
+        interest = wrapped_client.load_open_interest("BTC/USDT", "1h", since, -1, output=False, path=path)
+        if len(interest) != 1511 or interest['timestamp'].diff().iloc[1:].ne(hour).any() or \
+                max(limits['fetch_open_interest_history']) > 500:
+            raise AssertionError(f"wrong refresh: {len(interest)} rows, limits {limits}")
+        print(f"{Colors.GREEN}✅ open interest pages & refresh")
+
+    candles = wrapped_client.load_ohlcv("BTC/USDT", "1h", now - 47 * hour, 48, output=False, path=None)
+    aligned = ezxt.align_to_candles(candles, funding)
+    expected = funding.set_index('timestamp')['funding_rate'].reindex(candles['timestamp'] // (8 * hour) * 8 * hour)
+    if len(aligned) != 48 or not np.array_equal(aligned['funding_rate'].to_numpy(), expected.to_numpy()):
+        raise AssertionError("the funding rates weren't aligned to the last funding of each candle")
+    print(f"{Colors.GREEN}✅ align_to_candles")
+
+
+def order_journal_test():
+    """
+    Check that sync_orders() polls again the orders still open in the journal, that a failed record is rolled back and
+    that sync_orders() needs an enabled journal
+    """
+    print(f"{Colors.PURPLE}| Order journal test |")
+    wrapped_client = ezxt.WrappedGenericExchange(ezxt.ReplayExchange.configure(fill_delay=None))
+    wrapped_client.authenticate_client("key", "secret")
+    try:
+        wrapped_client.sync_orders("BTC/USDT")
+        raise AssertionError("sync_orders worked without journal")
+    except ezxt.JournalNotEnabled:
+        pass
+
+    wrapped_client.enable_order_journal(":memory:")
+    canceled = wrapped_client.post_limit_order("BTC/USDT", "buy", 2, 1)
+    time.sleep(0.005)
+    still_open = wrapped_client.post_limit_order("BTC/USDT", "buy", 2, 1)
+    time.sleep(0.005)
+    wrapped_client.post_market_order("BTC/USDT", "buy", 0.01)  # the cursor of the next sync
+    wrapped_client.sync_orders("BTC/USDT")
+    wrapped_client.client.cancel_order(canceled['id'], "BTC/USDT")  # not seen by the journal
+    calls = dict(wrapped_client.client.calls)
+    wrapped_client.sync_orders("BTC/USDT")
+    calls = {name: count - calls.get(name, 0) for name, count in wrapped_client.client.calls.items()}
+    if wrapped_client.journal.get_order(canceled['id'])['status'] != "canceled" or \
+            wrapped_client.journal.get_order(still_open['id'])['status'] != "open":
+        raise AssertionError("the orders still open in the journal weren't polled again")
+    if calls.get('fetch_open_orders') != 1 or calls.get('fetch_order') != 1:
+        raise AssertionError(f"wrong requests: {calls}")
+    print(f"{Colors.GREEN}✅ open orders polled again")
+
+    try:
+        wrapped_client.journal.record({'id': "broken", 'price': [1]})  # sqlite can't store a list
+        raise AssertionError("a broken order was recorded")
+    except sqlite3.Error:
+        pass
+    wrapped_client.journal.record({'id': "valid", 'symbol': "BTC/USDT", 'status': "open"})
+    if wrapped_client.journal.get_order("broken") is not None or wrapped_client.journal.get_events("broken") or \
+            wrapped_client.journal.get_order("valid") is None:
+        raise AssertionError("the failed record wasn't rolled back")
+    print(f"{Colors.GREEN}✅ rollback")
+
+
+def order_scheduler_test():
+    """
+    Run TWAP parents on the replay exchange tick by tick: filled slices, a twap never filled (catch-up slice then
+    partial state), cancel, and the archive of the finished parents
+    """
+    print(f"{Colors.PURPLE}| Order scheduler test |")
+    for fill_delay, state, children in ((0., ezxt.ParentState.DONE, 4), (None, ezxt.ParentState.PARTIAL, 5)):
+        wrapped_client = ezxt.WrappedGenericExchange(ezxt.ReplayExchange.configure(fill_delay=fill_delay))
+        wrapped_client.authenticate_client("key", "secret")
+        scheduler = ezxt.OrderScheduler(wrapped_client, poll_interval=0.5, keep_finished=2)
+        start = time.time()
+        filled = scheduler.submit_twap("BTC/USDT", "buy", 40, 4, 4, price=1, start=start)  # never marketable
+        canceled = scheduler.submit_twap("BTC/USDT", "buy", 40, 4, 4, price=1, start=start)
+        scheduler.run_pending(start)
+        scheduler.cancel(canceled)
+        now = start
+        while scheduler.get_parents(ezxt.ParentState.ACTIVE) and now < start + 10:
+            now += 0.5
+            scheduler.run_pending(now)
+        parent = scheduler.get_parent(filled)
+        if parent['state'] != state or len(parent['children']) != children or \
+                not np.isclose(parent['filled'], 40 if state == ezxt.ParentState.DONE else 0.):
+            raise AssertionError(f"wrong parent: {parent}")
+        if scheduler.get_parent(canceled)['state'] != ezxt.ParentState.CANCELED:
+            raise AssertionError("the parent wasn't canceled")
+        if scheduler.parents or scheduler.open_children or wrapped_client.get_all_open_orders("BTC/USDT"):
+            raise AssertionError("finished parents or open children were left")
+        print(f"{Colors.GREEN}✅ twap {state}")
+
+    scheduler.submit_twap("BTC/USDT", "buy", 10, 1, 1, price=1, start=now)
+    scheduler.run_pending(now)
+    scheduler.cancel(3)
+    scheduler.run_pending(now)
+    try:
+        scheduler.get_parent(canceled)  # the first one finished
+        raise AssertionError("a finished parent was kept beyond keep_finished")
+    except KeyError:
+        pass
+    if not scheduler.wait([filled, canceled, 3], timeout=0) or len(scheduler.get_parents()) != 2:
+        raise AssertionError("wrong archive of the finished parents")
+    print(f"{Colors.GREEN}✅ finished parents archive")
+
+
+def trades_pagination_test():
+    """
+    Page recorded trades on the replay exchange through a millisecond holding more trades than a page: bigger page
+    asked again, TradesPaginationError when the exchange can't send it, paging by id, ids which are not numbers
+    """
+    print(f"{Colors.PURPLE}| Trades pagination test |")
+    since = (int(time.time() * 1000) // 3600000 - 2) * 3600000
+    timestamps = [since + 1000 * i for i in range(100)] + [since + 200000] * 400 + \
+                 [since + 300000 + 1000 * i for i in range(100)]
+
+    def load(ids, trades_limit, default_limit=None, id_param=None):
+        trades = [{'id': str(i), 'symbol': "BTC/USDT", 'timestamp': timestamp, 'price': 100., 'amount': 1.,
+                   'side': "buy"} for i, timestamp in zip(ids, timestamps)]
+        wrapped_client = ezxt.WrappedGenericExchange(ezxt.ReplayExchange.configure(
+            trades={"BTC/USDT": trades}, trades_limit=trades_limit))
+        limits = []
+        fetch_trades = wrapped_client.client.fetch_trades
+
+        def record(symbol, since=None, limit=None, params=None):
+            limits.append(limit)
+            return fetch_trades(symbol, since, default_limit if limit is None else limit, params)
+        wrapped_client.client.fetch_trades = record
+        loaded = wrapped_client.load_trades("BTC/USDT", since, since + 3600000, output=False, path=None,
+                                            id_param=id_param)
+        if len(loaded) != 600 or not loaded['id'].is_unique:
+            raise AssertionError(f"{len(loaded)} trades loaded instead of 600")
+        return limits
+
+    limits = load(range(600), 1000, default_limit=250)
+    if 500 not in limits:
+        raise AssertionError(f"the page of a single timestamp wasn't asked again bigger: {limits}")
+    print(f"{Colors.GREEN}✅ bigger page for a single timestamp")
+    try:
+        load(range(600), 250)
+        raise AssertionError("trades were skipped without TradesPaginationError")
+    except ezxt.TradesPaginationError:
+        pass
+    print(f"{Colors.GREEN}✅ TradesPaginationError")
+    load(range(600), 250, id_param="fromId")
+    print(f"{Colors.GREEN}✅ paging by id")
+    load([f"t{i}" for i in range(600)], 1000, id_param="fromId")
+    print(f"{Colors.GREEN}✅ ids which are not numbers paged by time")
+
+
+def retry_policy_test():
+    """
+    Check the error categories, the Retry-After header, the retry budget and the default deadline of RetryPolicy
+    """
+    print(f"{Colors.PURPLE}| Retry policy test |")
+    ccxt, category = ezxt.ccxt, ezxt.ErrorCategory
+    for exception, expected in ((ccxt.RateLimitExceeded(), category.RATE_LIMIT),
+                                (ccxt.DDoSProtection(), category.RATE_LIMIT),
+                                (ccxt.RequestTimeout(), category.TRANSIENT),
+                                (ccxt.ExchangeNotAvailable(), category.TRANSIENT),
+                                (ccxt.BadSymbol(), category.PERMANENT), (ccxt.InsufficientFunds(), category.PERMANENT),
+                                (ValueError(), category.PERMANENT), (KeyboardInterrupt(), category.PERMANENT)):
+        if ezxt.RetryPolicy.classify(exception) != expected:
+            raise AssertionError(f"{type(exception).__name__} isn't classified as {expected}")
+    print(f"{Colors.GREEN}✅ classify")
+
+    class Client:
+        last_response_headers = {'retry-after': "2"}
+    policy = ezxt.RetryPolicy(base_delay=0.01, jitter=0)
+    if ezxt.RetryPolicy.get_retry_after(Client) != 2 or policy.get_delay(0, category.RATE_LIMIT, Client) != 2 or \
+            policy.get_delay(0, category.TRANSIENT, Client) != 0.01:
+        raise AssertionError("the Retry-After header wasn't honoured")
+    Client.last_response_headers = {'Retry-After': "Wed, 21 Oct 2015 07:28:00 GMT"}  # a date in the past
+    if ezxt.RetryPolicy.get_retry_after(Client) != 0:
+        raise AssertionError("a Retry-After date wasn't read")
+    Client.last_response_headers = {'Retry-After': "soon"}
+    if ezxt.RetryPolicy.get_retry_after(Client) is not None:
+        raise AssertionError("an invalid Retry-After header was read")
+    print(f"{Colors.GREEN}✅ Retry-After")
+
+    calls = []
+
+    def fail(exception):
+        calls.append(exception)
+        raise exception
+    policy = ezxt.RetryPolicy(base_delay=0, jitter=0, budget=3, budget_window=60)
+    for attempts in (4, 1):  # 3 retries, then the budget is exhausted
+        del calls[:]
+        try:
+            policy.call(fail, ccxt.RequestTimeout())
+        except ccxt.RequestTimeout:
+            pass
+        if len(calls) != attempts:
+            raise AssertionError(f"{len(calls)} calls instead of {attempts}")
+    del calls[:]
+    try:
+        ezxt.RetryPolicy(base_delay=0).call(fail, ccxt.RequestTimeout(), idempotent=False)
+    except ccxt.RequestTimeout:
+        pass
+    if len(calls) != 1:
+        raise AssertionError("a request which is not idempotent was retried after a transient error")
+    print(f"{Colors.GREEN}✅ budget")
+
+    if ezxt.RetryPolicy().deadline is None:
+        raise AssertionError("the default policy has no deadline")
+    start = time.monotonic()
+    try:
+        ezxt.RetryPolicy(base_delay=0.02, jitter=0, deadline=0.1).call(fail, ccxt.RequestTimeout())
+    except ccxt.RequestTimeout:
+        pass
+    if time.monotonic() - start > 0.1:
+        raise AssertionError("the deadline wasn't honoured")
+    print(f"{Colors.GREEN}✅ deadline")
+
+
+def order_validation_test():
+    """
+    Check the structured errors of the pre-trade validation on the replay exchange: ticks, minimum cost, cached
+    balance, unknown market & unsupported order type
+    """
+    print(f"{Colors.PURPLE}| Order validation test |")
+    wrapped_client = ezxt.WrappedGenericExchange(ezxt.ReplayExchange.configure(fill_delay=None))
+    wrapped_client.authenticate_client("key", "secret")
+    code = ezxt.OrderErrorCode
+
+    def check(expected, *order):
+        errors = wrapped_client.validate_order(*order)
+        if [(error.code, error.field, error.limit) for error in errors] != expected:
+            raise AssertionError(f"{order}: {errors} instead of {expected}")
+
+    check([], "BTC/USDT", "buy", "limit", 0.01, 100.)
+    wrapped_client.enable_order_validation(strict_precision=True)
+    check([(code.AMOUNT_PRECISION, "size", 1.0001), (code.PRICE_PRECISION, "price", 100.01)],
+          "BTC/USDT", "buy", "limit", 1.00015, 100.009)
+    print(f"{Colors.GREEN}✅ ticks")
+    check([(code.COST_TOO_LOW, "cost", 1)], "BTC/USDT", "buy", "limit", 0.001, 100.)
+    try:
+        wrapped_client.post_limit_order("BTC/USDT", "buy", 0.001, 100.)
+        raise AssertionError("an order below the minimum cost was sent")
+    except ezxt.OrderValidationError as exception:
+        if [error.code for error in exception.errors] != [code.COST_TOO_LOW] or wrapped_client.client.calls.get(
+                'create_order'):
+            raise AssertionError(f"wrong rejection: {exception.errors}")
+    print(f"{Colors.GREEN}✅ minimum cost")
+
+    check([], "BTC/USDT", "sell", "limit", 2, 100.)  # no balance cached yet
+    wrapped_client.get_free_balance("USDT")
+    check([(code.INSUFFICIENT_BALANCE, "size", 1.)], "BTC/USDT", "sell", "limit", 2, 100.)
+    check([(code.INSUFFICIENT_BALANCE, "cost", 100000.)], "BTC/USDT", "buy", "limit", 2, 60000.)
+    check([], "BTC/USDT", "buy", "limit", 1, 60000.)
+    wrapped_client.enable_order_validation(strict_precision=True, balance_ttl=0)
+    check([], "BTC/USDT", "sell", "limit", 2, 100.)
+    print(f"{Colors.GREEN}✅ cached balance")
+
+    check([(code.UNKNOWN_MARKET, "market", None)], "DOGE/XYZ", "buy", "limit", 1, 1.)
+    wrapped_client.client.has['createStopOrder'] = False
+    check([(code.UNSUPPORTED_TYPE, "type", None)], "BTC/USDT", "buy", "stop", 0.01, 100.)
+    check([(code.MISSING_PRICE, "price", None)], "BTC/USDT", "buy", "takeProfit", 0.01, None)
+    print(f"{Colors.GREEN}✅ unknown market & unsupported type")
+
+
+if __name__ == "__main__":
+    # Offline run on the replay exchange, add --live to also run the public tests on binance
+    replay = ezxt.WrappedGenericExchange(ezxt.ReplayExchange.configure(fill_delay=None))
+    replay.authenticate_client("key", "secret")
+    ut = UnitTest(replay, market="BTC/USDT")
+    ut.public_test()
+    ut.private_test()
+    lazy_import_test()
+    rounding_test()
+    indicator_test()
+    backfill_queue_test()
+    order_sizes_test()
+    series_test()
+    order_journal_test()
+    order_scheduler_test()
+    trades_pagination_test()
+    retry_policy_test()
+    order_validation_test()
+
+    if "--live" in sys.argv:
+        ut = UnitTest(ezxt.WrappedBinanceClient(), market="BTC/USDT")
+        ut.public_test()